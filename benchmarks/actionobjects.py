@@ -0,0 +1,127 @@
+# gestalt benchmark: actionObject construction
+#
+# Constructs the actionObjects of an emulated 086-005a stepper node, as the driver does, with the slotted actionObject
+# of gestalt.core and with the original representation, which is reproduced here. The original gave every actionObject
+# three threading.Events, a packet set and a dictionary of its own, all allocated as it was constructed.
+#
+# Three cases are run: a bare actionObject; the spin requests into which the driver slices a long move of 255 steps
+# each, thru actionObject.new; and the syncRequest which follows each synchronized move, which the interface recycles
+# once it has finished with the channel.
+#
+# Reported for each are the objects allocated and held by one actionObject, and the bytes they take, measured with
+# sys.getsizeof, and the rate at which actionObjects are constructed.
+#
+# usage: python actionobjects.py [iterations]
+
+#----IMPORTS------------
+import os
+import gc
+import sys
+import imp
+import time
+import types
+import threading
+from gestalt import core
+from harness import openVirtual, addNode, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----LEGACY ACTIONOBJECT------------
+class legacyActionObject(object):
+	'''The actionObject of gestalt.core as it originally was, with only what construction uses.'''
+	def __init__(self, serviceRoutine):
+		self.serviceRoutine = serviceRoutine
+		self.virtualNode = serviceRoutine.virtualNode
+		self.interface = self.virtualNode.interface
+		self.packetEncoder = self.serviceRoutine.packetSet
+		self.packetSet = [[]]
+		self.mode = 'unicast'
+		self.port = self.virtualNode.bindPort.outPorts[self.serviceRoutine]
+		self.clearToRelease = threading.Event()
+		self.channelAccessGranted = threading.Event()
+		self.initComplete = threading.Event()
+		self.mailbox = None
+		self._type_ = 'actionObject'
+
+	def _init(self, *args, **kwargs):
+		try:
+			returnObject = self.init(*args, **kwargs)
+		finally:
+			self.initComplete.set()
+		if returnObject != None: return returnObject
+		else: return self
+
+	def new(self, *args, **kwargs):
+		return self.__class__(self.serviceRoutine)._init(*args, **kwargs)
+
+	def init(self):
+		pass
+
+	__actionSequence__ = core.actionObject.__dict__['__actionSequence__']
+
+
+def legacyClass(actionObjectClass):
+	'''Returns a copy of the driver's actionObjectClass, built on the legacy actionObject, without its slots.'''
+	slots = actionObjectClass.__dict__.get('__slots__', ())
+	methods = dict([(name, value) for name, value in actionObjectClass.__dict__.items() if not name.startswith('__') and name not in slots])
+	return type('legacy' + actionObjectClass.__name__, (legacyActionObject,), methods)
+
+#----MEASUREMENT------------
+sharedTypes = (int, long, float, bool, str, unicode, type(None), type, types.FunctionType, types.ModuleType)
+
+def ownedObjects(item, shared, found):
+	'''Adds item, and every object it refers to which isn't shared with other actionObjects, to found {id: object}.'''
+	if id(item) in found or id(item) in shared or isinstance(item, sharedTypes): return
+	found[id(item)] = item
+	for referent in gc.get_referents(item):
+		ownedObjects(referent, shared, found)
+
+def allocation(actionObjects, serviceRoutine):
+	'''Returns the objects and bytes held by each of actionObjects, on average.'''
+	shared = set([id(serviceRoutine), id(serviceRoutine.virtualNode), id(serviceRoutine.virtualNode.interface), id(serviceRoutine.packetSet), id(core.blankPacketSet)])
+	found = {}
+	for actionObject in actionObjects: ownedObjects(actionObject, shared, found)
+	return len(found)/float(len(actionObjects)), sum([sys.getsizeof(item) for item in found.values()])/float(len(actionObjects))
+
+def constructBare(actionObjectClass, serviceRoutine):
+	create = getattr(actionObjectClass, 'create', actionObjectClass)
+	return [create(serviceRoutine)]
+
+def constructSlices(actionObjectClass, serviceRoutine, sliceCount = 100):
+	create = getattr(actionObjectClass, 'create', actionObjectClass)
+	steps = serviceRoutine.virtualNode.maxSteps*sliceCount
+	return create(serviceRoutine)._init(steps, external = True).actionObjects
+
+def constructSync(actionObjectClass, serviceRoutine):
+	create = getattr(actionObjectClass, 'create', actionObjectClass)
+	actionObject = create(serviceRoutine)._init()
+	if hasattr(actionObject, 'finish'): actionObject.finish()	#as the interface does once the syncRequest has finished with the channel
+	return [actionObject]
+
+def measure(construct, actionObjectClass, serviceRoutine, iterations):
+	'''Returns the objects and bytes held by each actionObject, and the number of actionObjects constructed per second.'''
+	objectCount, byteCount = allocation(construct(actionObjectClass, serviceRoutine), serviceRoutine)
+	constructed = 0
+	startTime = time.time()
+	for iteration in xrange(iterations):
+		constructed += len(construct(actionObjectClass, serviceRoutine))
+	return objectCount, byteCount, constructed/(time.time() - startTime)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: iterations = int(sys.argv[1])
+	else: iterations = 20000
+	interface, devicePort = openVirtual(115200)
+	node = addNode(interface, [1, 1], stepperDriver.virtualNode)
+	cases = [('bare actionObject', constructBare, node.spinRequest, core.actionObject, legacyActionObject),
+			('spin request slices', constructSlices, node.spinRequest, node.spinRequest.actionObject, legacyClass(node.spinRequest.actionObject)),
+			('recycled syncRequest', constructSync, node.syncRequest, node.syncRequest.actionObject, legacyClass(node.syncRequest.actionObject))]
+	print "objects and bytes held by each actionObject, measured with sys.getsizeof, and actionObjects constructed per second:"
+	for name, construct, serviceRoutine, actionObjectClass, legacyObjectClass in cases:
+		print "  " + name + ":"
+		caseIterations = iterations/100 if construct == constructSlices else iterations
+		for representation, objectClass in [('slotted', actionObjectClass), ('legacy', legacyObjectClass)]:
+			objectCount, byteCount, rate = measure(construct, objectClass, serviceRoutine, caseIterations)
+			print "    " + representation + ": " + str(round(objectCount, 1)) + " objects, " + str(int(byteCount)) + " bytes, " + str(int(rate)) + " actionObjects/s"
+	closeInterfaces()
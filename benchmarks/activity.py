@@ -0,0 +1,46 @@
+# gestalt benchmark: thread activity
+#
+# Uses the activity monitor in gestalt.utilities to report how often the interface threads wake up, first while the
+# interface sits idle and then while requests are streamed thru it, along with the latency of each hop a packet takes
+# between threads. A pseudo-terminal stands in for the serial port.
+#
+# usage: python activity.py [requestCount]
+
+#----IMPORTS------------
+import os
+import sys
+import time
+from gestalt import utilities
+from harness import openLoopback, addNode, cpuTime, closeInterfaces
+
+#----BENCHMARK------------
+def printReport(title, report, cpuTime):
+	print title + " (" + str(round(report['elapsedTime'], 2)) + " s, " + str(round(100.0*cpuTime/report['elapsedTime'], 1)) + "% CPU):"
+	for threadName in sorted(report['wakeupsPerSecond']):
+		print "  " + threadName + ": " + str(round(report['wakeupsPerSecond'][threadName], 1)) + " wakeups/s"
+	for hopName in sorted(report['hopLatency']):
+		hop = report['hopLatency'][hopName]
+		print "  " + hopName + ": mean " + str(round(hop['mean']*1000.0, 3)) + " ms, max " + str(round(hop['max']*1000.0, 3)) + " ms over " + str(hop['count'])
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 2000
+
+	interface, masterFile = openLoopback(1000000)
+	node = addNode(interface, [1, 2])
+
+	#idle
+	utilities.activity.enable()
+	startCPU = cpuTime()
+	time.sleep(2)
+	printReport("idle", utilities.activity.report(), cpuTime() - startCPU)
+
+	#streaming
+	utilities.activity.enable()
+	startCPU = cpuTime()
+	for count in range(requestCount):
+		node.pingRequest(count)
+		os.read(masterFile, 64)	#keeps the pty from filling up
+	printReport("streaming " + str(requestCount) + " requests", utilities.activity.report(), cpuTime() - startCPU)
+	closeInterfaces()
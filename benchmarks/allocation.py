@@ -0,0 +1,122 @@
+# gestalt benchmark: packet allocation
+#
+# Follows a spin packet thru the whole packet pipeline, in a single thread: encode, CRC, serialize, receive and frame,
+# validate, route, and decode. The pipeline is run twice: once with the original list-based representation, which is
+# reproduced here, and once with the bytearray packets and in-place framing used by gestalt.interfaces.
+#
+# When tracemalloc is available the peak memory allocated while a packet travels thru the pipeline is reported.
+# Otherwise (tracemalloc isn't part of python 2) the memory held by every intermediate representation of a packet is
+# added up with sys.getsizeof, counting each integer held in a list as its own object.
+#
+# usage: python allocation.py [iterations]
+
+#----IMPORTS------------
+import sys
+import time
+import Queue
+from gestalt import packets
+from gestalt import interfaces
+
+try:
+	import tracemalloc
+except ImportError:
+	tracemalloc = None
+
+#----PIPELINES------------
+gestaltPacket = packets.packet(template = [packets.pInteger('startByte', 1),
+										packets.pList('address', 2),
+										packets.pInteger('port', 1),
+										packets.pLength(),
+										packets.pList('payload')])
+
+spinPacket = packets.packet(template = [packets.pInteger('majorSteps',1),
+									packets.pInteger('directions',1),
+									packets.pInteger('steps', 1),
+									packets.pInteger('accel',1),
+									packets.pInteger('accelSteps',1),
+									packets.pInteger('decelSteps',1),
+									packets.pInteger('sync', 1)])
+
+spinValues = {'majorSteps':120, 'directions':5, 'steps':100, 'accel':3, 'accelSteps':10, 'decelSteps':10, 'sync':1}
+
+crc = interfaces.CRC()
+
+class routerStub(object):
+	'''Collects framed packets in place of the router thread.'''
+	def __init__(self):
+		self.routerQueue = Queue.Queue()
+
+class interfaceStub(object):
+	'''Provides the attributes of a gestaltInterface used by its receive thread.'''
+	def __init__(self):
+		self.CRC = crc
+		self.packetRouter = routerStub()
+
+receiver = interfaces.gestaltInterface.receiveThread(interfaceStub())
+
+
+def legacyEncode(template, inputDict):
+	'''Encodes inputDict the way packets.packet originally did, into a list of integers.'''
+	templatedList = []
+	for token in template.template:
+		templatedList += token(inputDict)
+	return [len(templatedList) if type(outputItem) == packets.pLength else outputItem for outputItem in templatedList]
+
+def legacyPipeline():
+	'''Returns every intermediate representation of a packet as it passes thru the list-based pipeline.'''
+	payload = legacyEncode(spinPacket, spinValues)
+	frame = legacyEncode(gestaltPacket, {'startByte':72, 'address':[1, 2], 'port':23, 'payload':payload})
+	checkedFrame = crc(frame)	#CRC copies a list into a new list
+	serialized = ''.join([chr(byte) for byte in checkedFrame])
+	received = [ord(byte) for byte in serialized]	#received one byte at a time
+	crc.validate(received)
+	routed = received[:len(received) - 1]
+	parsed = gestaltPacket.decodeTokens(routed)
+	decoded = spinPacket.decodeTokens(parsed['payload'])
+	return [payload, frame, checkedFrame, serialized, received, routed, parsed, decoded]
+
+def bufferPipeline():
+	'''Returns every intermediate representation of a packet as it passes thru the bytearray pipeline.'''
+	payload = spinPacket(spinValues)
+	frame = crc(gestaltPacket({'startByte':72, 'address':[1, 2], 'port':23, 'payload':payload}))	#CRC is appended in place
+	serialized = interfaces.serialize(frame)	#passed thru as-is
+	receiveBuffer = bytearray(serialized)	#stands in for the receive buffer, into which the serial port reads
+	receiver.framePackets(receiveBuffer)
+	routed = receiver.interface.packetRouter.routerQueue.get_nowait()
+	data = memoryview(routed)[receiver.headerLength:]
+	decoded = spinPacket.decode(data)
+	return [payload, frame, receiveBuffer, routed, data, decoded]
+
+#----MEASUREMENT------------
+def objectSize(item):
+	'''Returns the size of item, including the integers and values it holds.'''
+	size = sys.getsizeof(item)
+	if type(item) == list: size += sum([sys.getsizeof(element) for element in item])
+	if type(item) == dict: size += sum([objectSize(value) for value in item.values()])
+	return size
+
+def measure(pipeline, iterations):
+	'''Returns the bytes allocated per packet, and the number of packets per second.'''
+	pipeline()	#warms up any caches
+	if tracemalloc:
+		tracemalloc.start()
+		startMemory = tracemalloc.get_traced_memory()[0]
+		pipeline()
+		allocatedBytes = tracemalloc.get_traced_memory()[1] - startMemory
+		tracemalloc.stop()
+	else:
+		allocatedBytes = sum([objectSize(item) for item in pipeline()])
+	startTime = time.time()
+	for iteration in xrange(iterations):
+		pipeline()
+	return allocatedBytes, iterations/(time.time() - startTime)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: iterations = int(sys.argv[1])
+	else: iterations = 20000
+	if tracemalloc: print "peak bytes allocated per packet, measured with tracemalloc:"
+	else: print "bytes held by the representations of each packet, measured with sys.getsizeof:"
+	for name, pipeline in [('list pipeline', legacyPipeline), ('bytearray pipeline', bufferPipeline)]:
+		allocatedBytes, rate = measure(pipeline, iterations)
+		print "  " + name + ": " + str(allocatedBytes) + " bytes, " + str(int(rate)) + " packets/s"
@@ -0,0 +1,84 @@
+# gestalt benchmark: backpressure
+#
+# Commits synchronized moves to several nodes in a tight loop, as a script streaming moves from a file would, over a
+# simulated serial line which carries them at the speed of the bus. The far end of the line is read as fast as it is
+# delivered.
+#
+# The loop is run against an interface whose queues are unbounded, as they originally were, and one with the default
+# capacities. Reported for each are the time taken by the loop and until the last move left the host, the most items
+# held by each queue, and the time the loop spent held up by the interface.
+#
+# A node which has stopped answering is also checked not to hold up the others. More queries than its lane holds are
+# sent to a node which never answers, each waiting out its timeout, and then commands are sent to a second node. The
+# time until the commands to the second node have been written is reported.
+#
+# usage: python backpressure.py [moveCount] [baudRate]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from gestalt import core
+from gestalt import interfaces
+from harness import openVirtual, addNode, closeInterfaces
+
+#----BENCHMARK------------
+unboundedSettings = dict([(stage, {'maxsize':0}) for stage in interfaces.gestaltInterface.queueSettings])
+
+def drainPort(devicePort):
+	while True:
+		devicePort.read(1024)
+
+def runBenchmark(name, queueSettings, moveCount, baudRate, axisCount = 4):
+	interfaceClass = type('backpressureInterface', (interfaces.gestaltInterface,), {'queueSettings':queueSettings})
+	interface, devicePort = openVirtual(baudRate, interfaceClass)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	axisNodes = [addNode(interface, [1, axis + 1]) for axis in range(axisCount)]
+	
+	startTime = time.time()
+	for move in range(moveCount):
+		moveSet = core.actionSet([node.spinRequest(50 + axis) for axis, node in enumerate(axisNodes)])
+		moveSet.commit()
+		moveSet.release()
+	loopTime = time.time() - startTime
+	channelAccess = interface.channelAccess
+	while channelAccess.channelAccessQueue.qsize() or interface.channelPriority.channelPriorityQueue.qsize() or channelAccess.outstanding or interface.interface.transmitQueue.qsize():
+		time.sleep(0.01)
+	finishTime = time.time() - startTime
+	
+	report = interface.queueReport()
+	laneHighWater = max([laneReport['highWater'] for laneReport in report['lanes'].values()])
+	blockedTime = report['channelPriority']['blockedTime']
+	print "  " + name + ": loop took " + str(round(loopTime, 2)) + " s, moves sent after " + str(round(finishTime, 2)) + " s, loop held up for " + str(round(blockedTime, 2)) + " s"
+	print "    most queued: channelPriority " + str(report['channelPriority']['highWater']) + ", channelAccess " + str(report['channelAccess']['highWater']) + ", lane " + str(laneHighWater) + ", transmit " + str(report['transmit']['highWater'])
+
+def runStalled(baudRate, queryCount = 100, commandCount = 200, timeout = 0.5):
+	interface, devicePort = openVirtual(baudRate)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	stalledNode, otherNode = [addNode(interface, [1, axis + 1]) for axis in range(2)]
+	serialInterface = interface.interface
+	serialInterface.resetTransmitStatistics()
+	
+	startTime = time.time()
+	for count in range(queryCount): stalledNode.queryRequest(count, timeout = timeout)	#committed and released, but never answered
+	for count in range(commandCount): otherNode.pingCommand(count)
+	stalledQueries = lambda: min(int((time.time() - startTime)/timeout) + 1, queryCount)	#transmitted one at a time, as each times out
+	while serialInterface.transmitStatistics()['packets'] < commandCount + stalledQueries() and time.time() - startTime < queryCount*timeout: time.sleep(0.001)
+	print "  " + str(queryCount) + " queries to a node which doesn't answer, then " + str(commandCount) + " commands to another node:"
+	print "    commands to the other node written after " + str(round(time.time() - startTime, 3)) + " s, " + str(interface.queueReport()['lanes'][stalledNode.name]['overflow']) + " queries in the overflow of the stalled lane"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 2000
+	if len(sys.argv) > 2: baudRate = int(sys.argv[2])
+	else: baudRate = 1000000
+	print str(moveCount) + " moves at " + str(baudRate) + " baud:"
+	runBenchmark('unbounded queues', unboundedSettings, moveCount, baudRate)
+	runBenchmark('default capacities', interfaces.gestaltInterface.queueSettings, moveCount, baudRate)
+	runStalled(baudRate)
+	closeInterfaces()
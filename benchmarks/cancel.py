@@ -0,0 +1,162 @@
+# gestalt benchmark: cancelling queued motion
+#
+# Streams short moves thru functions.move to a pair of emulated 086-005a stepper nodes, driven as a compound node, until
+# the planner, the interface queues and the move buffers of the nodes are all full. Part way thru the stream the job is
+# stopped. It is stopped three ways: by no longer making moves and letting everything already queued stream out, as
+# was the only way before; with move.cancel, which decelerates along the path and withdraws the rest; and with
+# move.cancel(stop = 'disable'), which withdraws everything which hasn't been sent and disables the motors. A feed hold
+# with move.hold is also checked to come to rest, and once resumed with move.resume, to finish the stream where it should.
+#
+# Reported for each are the time until the stop reached the bus, as reported by move.cancel, the moves withdrawn, the
+# spin requests which the nodes took on after the stop and when they took on the last of them, and when the nodes came
+# to rest, having run out the moves in their buffers. A move longer than a spin request can carry is sent in several. The positions of the nodes are then checked against the future machine
+# position, which a cancel moves back.
+#
+# usage: python cancel.py [stopAfter] [baudRate]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+import threading
+from gestalt import emulators
+from gestalt import interfaces
+from gestalt import functions
+from gestalt import machines
+from gestalt import nodes
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def makeAxis():
+	'''Returns an axis of 25 steps/mm: a 1.8 degree stepper on a leadscrew of 8 mm lead.'''
+	elements = machines.elements
+	return elements.elementChain.forward([elements.microstep.forward(1), elements.stepper.forward(1.8), elements.leadscrew.forward(8), elements.invert.forward(False)])
+
+def streamMoves(move, stopping, moveCount, made):
+	for index in xrange(moveCount):
+		if stopping.is_set(): return
+		move([2.0*(index % 10), 2.0*((3*index) % 7)], 40)
+		made[0] += 1
+
+def isDrained(move, planned = True):
+	'''Returns whether nothing is waiting to be sent to the nodes of move: in its planner or held by it, if planned, or in the interface.'''
+	planner = move.planner
+	if planned and (not planner.plannerInput.empty() or planner.plannerQueue or planner.heldMoves): return False
+	interface = move.virtualNode.nodes[0].interface.Interface
+	report = interface.queueReport()
+	depths = [report[queueName]['depth'] for queueName in ('channelPriority', 'channelAccess', 'express', 'transmit')]
+	depths += [laneReport['depth'] + laneReport['overflow'] for laneReport in report['lanes'].values()]
+	return not any(depths) and not interface.channelAccess.outstanding
+
+def waitForRest(emulatedNodes, move, planned = True, timeout = 60.0, settleTime = 0.5):
+	'''Waits until nothing is left to send to the nodes, as isDrained tells, and every node is idle and has taken on
+	nothing new for settleTime.
+	
+	Returns the times at which the nodes took on their last move, and at which they came to rest.'''
+	startTime = time.time()
+	lastCounts, lastChange, restTime = None, time.time(), None
+	while time.time() - startTime < timeout:
+		counts = [node.moveCount for node in emulatedNodes]
+		if counts != lastCounts: lastCounts, lastChange, restTime = counts, time.time(), None
+		if all([node.isIdle() for node in emulatedNodes]) and isDrained(move, planned):
+			if restTime == None: restTime = time.time()
+			if time.time() - lastChange > settleTime: break
+		else: restTime = None
+		time.sleep(0.005)
+	return lastChange, restTime
+
+def openMachine(baudRate):
+	'''Returns a move function driving two emulated stepper nodes as a compound node, the emulated nodes, and the machine position.'''
+	interface, devicePort = openVirtual(baudRate)
+	emulatedNodes = [emulators.stepperNodeEmulator([1, axis + 1]) for axis in range(2)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], stepperDriver.virtualNode) for axis in range(2)]
+	for node in axisNodes: node.interface = interfaces.interfaceShell(interface)	#as nodes are given their interface by a machine
+	position = machines.state.coordinate(['mm', 'mm'])
+	move = functions.move(virtualNode = nodes.compoundNode(*axisNodes), axes = [makeAxis(), makeAxis()], kinematics = machines.kinematics.direct(2),
+						machinePosition = position)
+	return move, emulatedNodes, position
+
+def positionsMatch(move, emulatedNodes, position):
+	expectedSteps = [int(round(axis.reverse(ordinate))) for axis, ordinate in zip(move.axes, move.kinematics.reverse(position.future()))]
+	return expectedSteps == [node.position for node in emulatedNodes]
+
+def runBenchmark(name, stop, stopAfter, baudRate, moveCount = 2000):
+	move, emulatedNodes, position = openMachine(baudRate)
+	stopping = threading.Event()
+	made = [0]
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		producer = threading.Thread(target = streamMoves, args = (move, stopping, moveCount, made))
+		producer.daemon = True
+		producer.start()
+		time.sleep(stopAfter)
+		stopping.set()
+		stopTime = time.time()
+		takenBefore = max([node.moveCount for node in emulatedNodes])
+		if stop: report = move.cancel(stop)
+		else: report = None
+		producer.join()
+		lastTakenTime, restTime = waitForRest(emulatedNodes, move)
+	finally:
+		sys.stdout = stdout
+
+	takenAfter = max([node.moveCount for node in emulatedNodes]) - takenBefore
+	print "  " + name + ":"
+	if report: print "    stop reached the bus after " + milliseconds(report['stopLatency']) + ", " + str(report['released']) + " moves released to come to rest, " + str(report['withdrawn']) + " withdrawn, " + str(report['purged']) + " items taken out of the queues"
+	print "    " + str(made[0]) + " moves made, nodes took on " + str(takenAfter) + " spin requests after the stop, the last after " + milliseconds(max(lastTakenTime - stopTime, 0))
+	if stop != 'disable':	#a disabled node is at rest at once, but the emulator runs out its move buffer regardless
+		print "    nodes came to rest after " + milliseconds(restTime - stopTime)
+		matched = positionsMatch(move, emulatedNodes, position)
+		print "    positions " + ("match" if matched else "DON'T MATCH") + " the future machine position"
+		assert matched, name + " left the nodes away from the future machine position"
+
+def runHold(stopAfter, baudRate, moveCount = 400):
+	'''Holds the stream part way thru, and then resumes it and lets it finish.'''
+	move, emulatedNodes, position = openMachine(baudRate)
+	stopping = threading.Event()
+	made = [0]
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		producer = threading.Thread(target = streamMoves, args = (move, stopping, moveCount, made))
+		producer.daemon = True
+		producer.start()
+		time.sleep(stopAfter)
+		holdTime = time.time()
+		move.hold()
+		takenBefore = max([node.moveCount for node in emulatedNodes])
+		lastTakenTime, restTime = waitForRest(emulatedNodes, move, planned = False)	#the held moves stay in the planner
+		takenWhileHeld = max([node.moveCount for node in emulatedNodes]) - takenBefore
+		move.resume()
+		producer.join()
+		waitForRest(emulatedNodes, move)
+	finally:
+		sys.stdout = stdout
+	print "  hold, then resume:"
+	print "    nodes took on " + str(takenWhileHeld) + " spin requests after the hold, the last after " + milliseconds(max(lastTakenTime - holdTime, 0)) + ", and came to rest after " + milliseconds(restTime - holdTime)
+	matched = positionsMatch(move, emulatedNodes, position)
+	print "    once resumed, all " + str(made[0]) + " moves made, the nodes took on " + str(min([node.moveCount for node in emulatedNodes])) + " spin requests in all, positions " + ("match" if matched else "DON'T MATCH") + " the future machine position"
+	assert matched, "resuming a hold left the nodes away from the future machine position"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: stopAfter = float(sys.argv[1])
+	else: stopAfter = 1.5
+	if len(sys.argv) > 2: baudRate = int(sys.argv[2])
+	else: baudRate = 115200
+	print "stopping a stream of moves to 2 nodes after " + str(stopAfter) + " s, at " + str(baudRate) + " baud:"
+	runBenchmark('letting the queues drain', None, stopAfter, baudRate)
+	runBenchmark('cancel, decelerating', 'decelerate', stopAfter, baudRate)
+	runBenchmark('cancel, disabling', 'disable', stopAfter, baudRate)
+	runHold(stopAfter, baudRate)
+	closeInterfaces()
@@ -0,0 +1,67 @@
+# gestalt benchmark: channel access
+#
+# Streams requests which hold the channel until their node responds, as the spin requests of a stepper node do, to a
+# growing number of nodes. Each node answers its requests one at a time, a fixed service time after starting on each.
+#
+# The requests are run thru gestaltInterface, which gives each node its own lane on the channel, and thru an
+# interface with the original channel access thread, which grants the channel to one actionObject at a time.
+#
+# usage: python channels.py [requestsPerNode] [serviceTime]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from gestalt import interfaces
+from harness import openLoopback, addNode, responder, closeInterfaces
+
+#----BENCHMARK------------
+class singleChannelInterface(interfaces.gestaltInterface):
+	'''A gestalt interface with the original channel access thread.'''
+	class channelAccessThread(interfaces.gestaltInterface.channelAccessThread):
+		def run(self):
+			while True:
+				accessQueueState, actionObject = self.getActionObject()
+				if accessQueueState == None: return	#the interface has been closed
+				if accessQueueState:
+					actionObject.grantAccess()
+
+
+class requestCounter(object):
+	def __init__(self, requestCount):
+		self.requestCount = requestCount
+		self.finishedCount = 0
+		self.lock = threading.Lock()
+		self.finished = threading.Event()
+	
+	def __call__(self, actionObject):
+		with self.lock:
+			self.finishedCount += 1
+			if self.finishedCount == self.requestCount: self.finished.set()
+
+
+def runBenchmark(interfaceClass, nodeCount, requestsPerNode, serviceTime):
+	interface, masterFile = openLoopback(1000000, interfaceClass)
+	responder(interface, masterFile, serviceTime)
+	nodes = [addNode(interface, [1, index + 1]) for index in range(nodeCount)]
+	counter = requestCounter(nodeCount*requestsPerNode)
+	
+	startTime = time.time()
+	for count in range(requestsPerNode):
+		for node in nodes:
+			node.queryRequest(count, counter)
+	counter.finished.wait(60)
+	elapsedTime = time.time() - startTime
+	print "  " + interfaceClass.__name__ + ", " + str(nodeCount) + " nodes: " + str(counter.finishedCount) + " requests, " + str(round(counter.finishedCount/elapsedTime, 1)) + " requests/s"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestsPerNode = int(sys.argv[1])
+	else: requestsPerNode = 50
+	if len(sys.argv) > 2: serviceTime = float(sys.argv[2])
+	else: serviceTime = 0.005
+	print "service time " + str(serviceTime*1000.0) + " ms per request:"
+	for nodeCount in [1, 2, 4, 8]:
+		for interfaceClass in [interfaces.gestaltInterface, singleChannelInterface]:
+			runBenchmark(interfaceClass, nodeCount, requestsPerNode, serviceTime)
+	closeInterfaces()
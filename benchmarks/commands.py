@@ -0,0 +1,67 @@
+# gestalt benchmark: fire-and-forget commands
+#
+# Sends a stream of commands, which the nodes don't answer, round-robin to several nodes on a fast virtual serial line.
+# Each is sent three ways: as an actionObject which commits itself, waits for channel access and then transmits, as
+# resetRequest and identifyRequest originally did; as a core.commandObject, which returns once committed; and gathered
+# into core.commandBatches, each of which is committed, and handed to the serial port, in a single queue operation.
+#
+# Reported for each are the time the sending thread spends on each command, the time until every command has been
+# written to the line, and the number of writes made to the serial port.
+#
+# usage: python commands.py [commandCount] [batchSize]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from gestalt import core
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+#----BENCHMARK------------
+def drainPort(devicePort):
+	while True:
+		devicePort.read(1024)
+
+def sendAcknowledged(commandNodes, commandCount, batchSize):
+	for count in xrange(commandCount):
+		commandNodes[count % len(commandNodes)].pingRequest(count)	#returns once transmitted
+
+def sendCommands(commandNodes, commandCount, batchSize):
+	for count in xrange(commandCount):
+		commandNodes[count % len(commandNodes)].pingCommand(count)	#returns once committed
+
+def sendBatches(commandNodes, commandCount, batchSize):
+	for batchStart in xrange(0, commandCount, batchSize):
+		commands = [commandNodes[count % len(commandNodes)].pingCommand(count, external = True) for count in xrange(batchStart, min(batchStart + batchSize, commandCount))]
+		core.commandBatch(commands).send()
+
+def runBenchmark(name, send, commandCount, batchSize, nodeCount = 8, packetLength = 8):
+	interface, devicePort = openVirtual(1000000)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	commandNodes = [addNode(interface, [1, node + 1]) for node in range(nodeCount)]
+	serialInterface = interface.interface
+	serialInterface.resetTransmitStatistics()
+
+	startTime = time.time()
+	send(commandNodes, commandCount, batchSize)
+	sendTime = time.time() - startTime
+	while serialInterface.transmitStatistics()['bytes'] < commandCount*packetLength and time.time() - startTime < 60: time.sleep(0.001)
+	elapsedTime = time.time() - startTime
+
+	statistics = serialInterface.transmitStatistics()
+	print "  " + name + ":"
+	print "    sender spent " + milliseconds(sendTime/commandCount) + " per command, all " + str(statistics['bytes']/packetLength) + " written after " + milliseconds(elapsedTime) + ", in " + str(statistics['writes']) + " writes"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: commandCount = int(sys.argv[1])
+	else: commandCount = 2000
+	if len(sys.argv) > 2: batchSize = int(sys.argv[2])
+	else: batchSize = 32
+	print str(commandCount) + " commands to 8 nodes at 1000000 baud:"
+	runBenchmark('waiting for channel access', sendAcknowledged, commandCount, batchSize)
+	runBenchmark('commandObject', sendCommands, commandCount, batchSize)
+	runBenchmark('commandBatch of ' + str(batchSize), sendBatches, commandCount, batchSize)
+	closeInterfaces()
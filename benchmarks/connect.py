@@ -0,0 +1,40 @@
+# gestalt benchmark: connecting interfaces
+#
+# Connects several gestalt interfaces, each to its own pseudo-terminal with a responder on the far side, and measures
+# the time from creating the first interface until every interface has had a query answered. This stands in for the
+# startup of a machine with several buses, from virtualMachine() to its first move.
+#
+# The interfaces are connected the original way, which waits a fixed 2 s after opening each port, then by writing a
+# readiness probe and waiting for a node to answer it, one interface after another and then all in the background at
+# once. The probe is answered by the harness, standing in for a node on each line.
+#
+# usage: python connect.py [interfaceCount]
+
+#----IMPORTS------------
+import sys
+import time
+from harness import openLoopback, addNode, responder, closeInterfaces
+
+#----BENCHMARK------------
+def runBenchmark(name, interfaceCount, **kwargs):
+	startTime = time.time()
+	loopbacks = [openLoopback(115200, resetDelay = kwargs.get('resetDelay'), connectInBackground = kwargs.get('connectInBackground', False)) for count in range(interfaceCount)]
+	connectedTime = time.time()
+	queries = []
+	for interface, masterFile in loopbacks:
+		responder(interface, masterFile, serviceTime = 0.0)
+		node = addNode(interface, [1, 1])
+		queries.append(node.queryRequest(0, timeout = 2.0))
+	answeredCount = sum([query.waitForResponse(5.0) for query in queries])
+	elapsedTime = time.time() - startTime
+	print "  " + name + ": " + str(answeredCount) + " of " + str(interfaceCount) + " answered in " + str(round(elapsedTime, 3)) + " s, of which " + str(round(connectedTime - startTime, 3)) + " s creating the interfaces"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: interfaceCount = int(sys.argv[1])
+	else: interfaceCount = 4
+	print str(interfaceCount) + " interfaces:"
+	runBenchmark('fixed 2 s wait', interfaceCount, resetDelay = 2.0)
+	runBenchmark('readiness probe', interfaceCount)
+	runBenchmark('readiness probe, in the background', interfaceCount, connectInBackground = True)
+	closeInterfaces()
@@ -0,0 +1,81 @@
+# gestalt benchmark: CRC
+#
+# Compares gestalt.interfaces.CRC with the original CRC, which is reproduced here, on the packets the interface
+# generates and checks CRCs for: a single spin packet, and the burst of packets in a multi-axis move. A batch as large as
+# a firmware image, 256 pages, is also run, to show what generateBatch gains where it applies. The bootloader doesn't
+# hand its pages over at once, but sends each in its own request, so loading a program only sees the single-packet
+# rate. Every CRC is checked against the original.
+#
+# usage: python crc.py [iterations]
+
+#----IMPORTS------------
+import sys
+import time
+import random
+from gestalt import interfaces
+
+#----ORIGINAL CRC------------
+class legacyCRC(interfaces.CRC):
+	'''The original CRC, which looked up each byte in turn, and copied each byte into a new output list.'''
+	def __call__(self, packet):
+		crc = 0
+		crcByte = 0
+		output = []
+		for byte in packet:
+			crcByte = byte^crc
+			crc = self.crcTable[crcByte]
+			output += [byte]
+		output += [crc]
+		return output
+	
+	def validate(self, packet):
+		crc = 0
+		crcByte = 0
+		packetLength = len(packet)
+		for char in packet[0:packetLength]:
+			crcByte = char^crc
+			crc = self.crcTable[crcByte]
+		if crc != 0:	return False
+		else:	return True
+
+#----BENCHMARK------------
+def randomPacket(length):
+	return bytearray([random.randint(0, 255) for index in range(length)])
+
+def rate(function, argument, iterations):
+	'''Returns the number of calls to function per second.'''
+	startTime = time.time()
+	for iteration in xrange(iterations):
+		function(argument)
+	return iterations/(time.time() - startTime)
+
+def runBenchmark(name, packets, iterations):
+	legacy = legacyCRC()
+	crc = interfaces.CRC()
+	legacyCRCs = [legacy(list(packet))[-1] for packet in packets]
+	assert crc.generateBatch(packets) == legacyCRCs
+	assert [crc.generate(packet) for packet in packets] == legacyCRCs
+	checkedPackets = [packet + bytearray([packetCRC]) for packet, packetCRC in zip(packets, legacyCRCs)]
+	assert all([crc.validate(packet) for packet in checkedPackets])
+	
+	listPackets = [list(packet) for packet in packets]
+	listCheckedPackets = [list(packet) for packet in checkedPackets]
+	iterations = max(iterations//len(packets), 1)
+	legacyGenerate = rate(lambda packetList: [legacy(packet) for packet in packetList], listPackets, iterations)
+	generate = rate(lambda packetList: [crc.generate(packet) for packet in packetList], packets, iterations)
+	generateBatch = rate(crc.generateBatch, packets, iterations)
+	legacyValidate = rate(lambda packetList: [legacy.validate(packet) for packet in packetList], listCheckedPackets, iterations)
+	validate = rate(lambda packetList: [crc.validate(packet) for packet in packetList], checkedPackets, iterations)
+	
+	packetRate = lambda callRate: str(int(callRate*len(packets))) + " packets/s"
+	print name + " (" + str(len(packets)) + " x " + str(len(packets[0])) + " bytes):"
+	print "  generate: original " + packetRate(legacyGenerate) + ", generate " + packetRate(generate) + " (" + str(round(generate/legacyGenerate, 1)) + "x), generateBatch " + packetRate(generateBatch) + " (" + str(round(generateBatch/legacyGenerate, 1)) + "x)"
+	print "  validate: original " + packetRate(legacyValidate) + ", validate " + packetRate(validate) + " (" + str(round(validate/legacyValidate, 1)) + "x)"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: iterations = int(sys.argv[1])
+	else: iterations = 20000
+	runBenchmark("spin packet", [randomPacket(12)], iterations)
+	runBenchmark("four axis move", [randomPacket(12) for axis in range(4)] + [randomPacket(5)], iterations)
+	runBenchmark("batch the size of a firmware image", [randomPacket(136) for page in range(256)], iterations)	#a 32 KB image, in 128 byte pages
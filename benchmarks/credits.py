@@ -0,0 +1,96 @@
+# gestalt benchmark: credit-based flow control
+#
+# Streams synchronized multi-axis moves to a network of emulated 086-005a stepper nodes faster than the nodes can run
+# them, so that their move buffers fill and stay full. With credit-based flow control, the driver only sends a spin
+# request once a node's buffer has room for it, and asks for the state of the buffer with a status query while it is
+# full. The benchmark is also run with the driver's original behaviour, which sends the spin request regardless, and
+# after a full buffer waits 20 ms before sending it again.
+#
+# Reported for each are the rate at which moves were run, the spin requests refused by a full buffer, the bytes sent
+# on the bus for each move, and the time taken by status queries made from another thread during the stream.
+#
+# usage: python credits.py [moveCount] [axisCount]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+import threading
+from gestalt import core
+from gestalt import emulators
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class retryingNode(stepperDriver.virtualNode):
+	'''The stepper driver, with spin requests which retry into a full buffer as the driver originally did.'''
+	class spinRequest(stepperDriver.virtualNode.spinRequest):
+		class actionObject(stepperDriver.virtualNode.spinRequest.actionObject):
+			def waitForCredit(self):
+				if getattr(self, 'refused', False): time.sleep(0.02)	#wait before retransmitting
+				self.refused = True
+
+
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def queryStatus(node, streaming, latencies):
+	while streaming.is_set():
+		startTime = time.time()
+		node.spinStatusRequest()
+		latencies += [time.time() - startTime]
+		time.sleep(0.05)
+
+def runBenchmark(name, nodeClass, moveCount, axisCount, baudRate = 115200, timeScale = 1.0):
+	interface, devicePort = openVirtual(baudRate)
+	emulatedNodes = [emulators.stepperNodeEmulator([1, axis + 1], timeScale = timeScale) for axis in range(axisCount)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], nodeClass) for axis in range(axisCount)]
+
+	expectedPositions = [0]*axisCount
+	latencies = []
+	streaming = threading.Event()
+	streaming.set()
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		querier = threading.Thread(target = queryStatus, args = (axisNodes[0], streaming, latencies))
+		querier.daemon = True
+		querier.start()
+		startTime = time.time()
+		for move in range(moveCount):
+			axesSteps = [(50 + 10*axis + move % 40)*(1 if move % 2 else -1) for axis in range(axisCount)]
+			expectedPositions = [position + steps for position, steps in zip(expectedPositions, axesSteps)]
+			syncToken = core.syncToken()
+			moveSet = core.actionSet([node.spinRequest(steps, external = True, sync = syncToken) for node, steps in zip(axisNodes, axesSteps)])
+			moveSet.commit()
+			moveSet.release()
+		while not all([node.isIdle() and node.moveCount >= moveCount for node in emulatedNodes]) and time.time() - startTime < 120: time.sleep(0.01)
+		elapsedTime = time.time() - startTime
+		streaming.clear()
+		querier.join()
+	finally:
+		sys.stdout = stdout
+
+	statistics = interface.interface.transmitStatistics()
+	positions = [node.position for node in emulatedNodes]
+	latencies.sort()
+	print name + ":"
+	print "  " + str(moveCount) + " moves in " + str(round(elapsedTime, 2)) + " s, " + str(round(moveCount/elapsedTime, 1)) + " moves/s, positions " + ("match" if positions == expectedPositions else "DON'T MATCH")
+	print "  " + str(sum([node.rejectedCount for node in emulatedNodes])) + " spin requests refused by a full buffer, " + str(statistics['bytes']/moveCount) + " bytes sent per move"
+	print "  status queries during the stream: median " + milliseconds(latencies[len(latencies)/2]) + ", max " + milliseconds(latencies[-1])
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 150
+	if len(sys.argv) > 2: axisCount = int(sys.argv[2])
+	else: axisCount = 4
+	runBenchmark('credits', stepperDriver.virtualNode, moveCount, axisCount)
+	runBenchmark('retrying into a full buffer', retryingNode, moveCount, axisCount)
+	closeInterfaces()
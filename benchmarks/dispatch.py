@@ -0,0 +1,83 @@
+# gestalt benchmark: dispatching inbound packets
+#
+# Streams queries to several nodes on one interface, one of which is slow to handle its responses: its service routine
+# takes handlingTime seconds for every packet. The other nodes each make one query at a time, and the latency of their
+# queries is measured, along with the number of their queries which timed out and were retransmitted.
+#
+# The service routines are run either in the router thread, as they originally were, or by the router's pool of
+# dispatch workers, which keeps the slow node from holding up the responses of the others.
+#
+# usage: python dispatch.py [requestCount] [handlingTime]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from gestalt import interfaces
+from gestalt import functions
+from harness import openLoopback, addNode, responder, benchmarkNode, milliseconds, closeInterfaces
+
+#----BENCHMARK------------
+class slowNode(benchmarkNode):
+	'''A benchmark node which takes handlingTime seconds to handle each response to its statusQuery.'''
+	handlingTime = 0.05
+	
+	def initPorts(self):
+		self.bindPort(port = 42, outboundFunction = self.statusQuery, outboundPacket = self.pingPacket, inboundFunction = self.statusResponse, inboundPacket = self.pingPacket)
+	
+	class statusResponse(functions.serviceRoutine):
+		def receive(self, packet):
+			time.sleep(self.virtualNode.handlingTime)
+
+
+class latencyRecorder(object):
+	'''Makes one query at a time to a node, and records how long each took to be answered.'''
+	def __init__(self, node, requestCount):
+		self.node = node
+		self.latencies = []
+		self.finished = threading.Event()
+		self.thread = threading.Thread(target = self.run, args = (requestCount,))
+		self.thread.start()
+	
+	def run(self, requestCount):
+		for count in range(requestCount):
+			self.finished.clear()
+			startTime = time.time()
+			self.node.queryRequest(count, lambda actionObject: self.finished.set(), tries = 10, timeout = None)
+			self.finished.wait(30)
+			self.latencies.append(time.time() - startTime)
+
+
+def runBenchmark(dispatchWorkers, requestCount, handlingTime, fastCount = 3):
+	interfaceClass = type('dispatchInterface', (interfaces.gestaltInterface,), {'dispatchWorkers':dispatchWorkers})
+	interface, masterFile = openLoopback(1000000, interfaceClass)
+	responder(interface, masterFile, serviceTime = 0.0005)
+	slow = addNode(interface, [1, 1], slowNode)
+	slow.handlingTime = handlingTime
+	fastNodes = [addNode(interface, [2, number + 1]) for number in range(fastCount)]
+	
+	for count in range(int(requestCount*0.004/handlingTime) + 1):
+		slow.statusQuery(count)	#keeps the slow node busy for about as long as the fast nodes are
+	recorders = [latencyRecorder(node, requestCount) for node in fastNodes]
+	for recorder in recorders: recorder.thread.join()
+	
+	latencies = sorted(sum([recorder.latencies for recorder in recorders], []))
+	timeoutCount = sum([node.rttEstimator.report()['timeouts'] for node in fastNodes])
+	if dispatchWorkers: print "  " + str(dispatchWorkers) + " dispatch workers:"
+	else: print "  in the router thread:"
+	print "    fast node latency: median " + milliseconds(latencies[len(latencies)/2]) + ", 99th percentile " + milliseconds(latencies[int(len(latencies)*0.99)]) + ", max " + milliseconds(latencies[-1]) + ", " + str(timeoutCount) + " timeouts"
+	report = interface.packetRouter.report()
+	print "    router queue: deepest " + str(report['maxQueueDepth'])
+	for name, handlerReport in sorted(report['handlers'].items()):
+		print "    " + name + ": " + str(handlerReport['count']) + " packets, mean wait " + milliseconds(handlerReport['meanWait']) + ", mean run " + milliseconds(handlerReport['meanRun'])
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 200
+	if len(sys.argv) > 2: handlingTime = float(sys.argv[2])
+	else: handlingTime = 0.05
+	print "slow node takes " + str(handlingTime*1000.0) + " ms to handle each response:"
+	for dispatchWorkers in [0, 4]:
+		runBenchmark(dispatchWorkers, requestCount, handlingTime)
+	closeInterfaces()
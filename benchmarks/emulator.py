@@ -0,0 +1,69 @@
+# gestalt benchmark: emulated stepper nodes
+#
+# Streams synchronized multi-axis moves to a network of emulated 086-005a stepper nodes, using the virtual node driver
+# from examples/nodes/compoundnode. Each move is an actionSet of one spin request per axis followed by a sync packet,
+# as a compoundNode move is. The emulated nodes drain their move buffers in emulated time, and push back with a full
+# buffer when the moves arrive faster than they can be run.
+#
+# Once every move has run, the position of each emulated node is checked against the steps which were requested. A spin
+# request which is retransmitted after its response was merely late is run twice, and shows up here.
+#
+# usage: python emulator.py [moveCount] [axisCount]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+from gestalt import core
+from gestalt import emulators
+from harness import openVirtual, addNode, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def runBenchmark(baudRate, moveCount, axisCount, stepRate, timeScale):
+	interface, devicePort = openVirtual(baudRate)
+	emulatedNodes = [emulators.stepperNodeEmulator([1, axis + 1], stepRate = stepRate, timeScale = timeScale) for axis in range(axisCount)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], stepperDriver.virtualNode) for axis in range(axisCount)]
+
+	expectedPositions = [0]*axisCount
+	startTime = time.time()
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		for move in range(moveCount):
+			axesSteps = [(50 + 10*axis + move % 40)*(1 if move % 2 else -1) for axis in range(axisCount)]
+			expectedPositions = [position + steps for position, steps in zip(expectedPositions, axesSteps)]
+			syncToken = core.syncToken()
+			moveSet = core.actionSet([node.spinRequest(steps, external = True, sync = syncToken) for node, steps in zip(axisNodes, axesSteps)])
+			moveSet.commit()
+			moveSet.release()
+		while not all([node.isIdle() and node.moveCount >= moveCount for node in emulatedNodes]) and time.time() - startTime < 120: time.sleep(0.01)
+	finally:
+		sys.stdout = stdout
+	elapsedTime = time.time() - startTime
+
+	positions = [node.position for node in emulatedNodes]
+	print str(baudRate) + " baud, " + str(axisCount) + " axes, " + str(stepRate*timeScale) + " steps/s:"
+	print "  " + str(moveCount) + " moves in " + str(round(elapsedTime, 2)) + " s, " + str(round(moveCount/elapsedTime, 1)) + " moves/s"
+	print "  " + str(sum([node.rejectedCount for node in emulatedNodes])) + " spin requests refused by a full buffer, " + str(sum([node.moveCount - moveCount for node in emulatedNodes])) + " moves run twice after a retransmission"
+	print "  positions " + ("match" if positions == expectedPositions else "DON'T MATCH: " + str(positions) + " != " + str(expectedPositions))
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 200
+	if len(sys.argv) > 2: axisCount = int(sys.argv[2])
+	else: axisCount = 4
+	for baudRate in [115200, 1000000]:
+		for timeScale in [10.0, 1000.0]:	#buffer bound, and line bound
+			runBenchmark(baudRate, moveCount, axisCount, 2000.0, timeScale)
+	closeInterfaces()
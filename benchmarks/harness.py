@@ -0,0 +1,243 @@
+# gestalt benchmark harness
+#
+# Shared pieces for the scripts in this folder: a pseudo-terminal loopback which stands in for a serial port,
+# and a minimal virtual node whose requests exercise the interface without needing real hardware.
+
+#----IMPORTS------------
+import os
+import tty
+import time
+import random
+import Queue
+import threading
+from gestalt import interfaces
+from gestalt import nodes
+from gestalt import functions
+from gestalt import packets
+from gestalt import core
+
+functions.move.plannerDebugFile = None	#keeps the motion planners of the benchmarks from writing into the working tree
+openedInterfaces = []	#every interface opened by openLoopback and openVirtual, until closeInterfaces
+
+#----LOOPBACK------------
+def openLoopback(baudRate, interfaceClass = interfaces.gestaltInterface, **kwargs):
+	'''Returns a gestalt interface connected to the slave side of a new pseudo-terminal, and the master file descriptor.
+
+	Bytes written by the interface can be read from the master descriptor, and vice versa. Additional keyword
+	arguments are passed to the serialInterface. Unless a resetDelay is given, the readiness probe which the interface
+	writes as it connects is answered, as a node on the line would.'''
+	masterFile, slaveFile = os.openpty()
+	tty.setraw(masterFile)
+	tty.setraw(slaveFile)
+	if kwargs.get('resetDelay') == None:
+		probeThread = threading.Thread(target = answerProbe, args = (masterFile,))
+		probeThread.daemon = True
+		probeThread.start()
+	interface = interfaceClass('benchmark', interfaces.serialInterface(baudRate = baudRate, portName = os.ttyname(slaveFile), **kwargs))
+	openedInterfaces.append(interface)
+	return interface, masterFile
+
+def answerProbe(masterFile, address = (1, 1)):
+	'''Answers the first readiness probe written to masterFile with a status response from the node at address.'''
+	crc = interfaces.CRC()
+	buffer = bytearray()
+	while True:
+		buffer += os.read(masterFile, 1024)
+		for position in range(len(buffer) - 5):
+			if buffer[position] in (72, 138) and buffer[position + 3] == 1 and crc.validate(buffer[position:position + buffer[position + 4] + 1]):
+				os.write(masterFile, str(crc(bytearray([72, address[0], address[1], 1, 7, ord('A'), 170]))))
+				return
+
+def openVirtual(baudRate, interfaceClass = interfaces.gestaltInterface, **kwargs):
+	'''Returns a gestalt interface connected to a simulated serial line, and the port at the far end of the line.
+	
+	Additional keyword arguments are passed to the virtualSerialInterface, and set the faults on the line.'''
+	serialInterface = interfaces.virtualSerialInterface(baudRate = baudRate, **kwargs)
+	interface = interfaceClass('benchmark', serialInterface)
+	openedInterfaces.append(interface)
+	return interface, serialInterface.devicePort
+
+def closeInterfaces(timeout = 1.0):
+	'''Closes every interface opened by openLoopback and openVirtual, so that their threads have stopped before python
+	exits. Called at the end of each benchmark.'''
+	while openedInterfaces: openedInterfaces.pop().close(timeout)
+
+def drain(fileDescriptor, byteCount, timeout = 5.0):
+	'''Reads byteCount bytes from fileDescriptor, or as many as arrive before timeout.'''
+	received = 0
+	endTime = time.time() + timeout
+	while received < byteCount and time.time() < endTime:
+		received += len(os.read(fileDescriptor, byteCount - received))
+	return received
+
+def addNode(interface, address, nodeClass = None, name = None):
+	'''Creates a virtual node on interface at address.'''
+	if nodeClass == None: nodeClass = benchmarkNode
+	node = nodeClass()
+	node.name = name if name else 'node' + str(address)
+	node.interface = interface
+	node._init()
+	node.init()
+	interface.assignNode(node, address)
+	return node
+
+def cpuTime():
+	times = os.times()
+	return times[0] + times[1]
+
+def milliseconds(seconds):
+	return str(round(seconds*1000.0, 3)) + " ms"
+
+#----RESPONDER------------
+class responder(threading.Thread):
+	'''Answers requests written to the master side of a pseudo-terminal, or to the device port of a virtual serial line,
+	standing in for the nodes on a network.
+	
+	Each node answers its unicast requests in the order they arrive, serviceTime seconds after it starts on each, by
+	echoing the request back to the interface. A node can't start on a request until latency seconds after it was
+	written, which stands in for the round trip on the line. A fraction lossRate of the requests are dropped without
+	being answered. Multicast packets aren't answered.'''
+	def __init__(self, interface, masterFile, serviceTime = 0.005, latency = 0.0, lossRate = 0.0):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.interface = interface
+		self.masterFile = masterFile	#a file descriptor, or a virtual serial port
+		self.serviceTime = serviceTime
+		self.latency = latency
+		self.lossRate = lossRate
+		self.random = random.Random(0)	#drops the same requests on every run
+		self.crc = interfaces.CRC()
+		self.writeLock = threading.Lock()
+		self.nodeQueues = {}	#{(address0, address1): Queue of requests}
+		self.start()
+	
+	def run(self):
+		buffer = bytearray()
+		while True:
+			buffer += self.read()
+			while len(buffer) >= 6:
+				if buffer[0] not in (72, 138):
+					del buffer[0]
+					continue
+				packetLength = buffer[4]
+				if len(buffer) <= packetLength: break
+				packet = buffer[:packetLength + 1]
+				if not self.crc.validate(packet):
+					del buffer[0]	#resynchronize on the next start byte
+					continue
+				del buffer[:packetLength + 1]
+				if self.lossRate and self.random.random() < self.lossRate: continue
+				if packet[0] == 72: self.getNodeQueue((packet[1], packet[2])).put((packet[:-1], time.time()))
+	
+	def read(self):
+		if type(self.masterFile) == int: return os.read(self.masterFile, 1024)
+		return self.masterFile.read(1024)
+	
+	def write(self, data):
+		if type(self.masterFile) == int: os.write(self.masterFile, data)
+		else: self.masterFile.write(data)
+	
+	def getNodeQueue(self, address):
+		if address not in self.nodeQueues:
+			self.nodeQueues[address] = Queue.Queue()
+			nodeThread = threading.Thread(target = self.serveNode, args = (self.nodeQueues[address],))
+			nodeThread.daemon = True
+			nodeThread.start()
+		return self.nodeQueues[address]
+	
+	def serveNode(self, nodeQueue):
+		while True:
+			request, arrivalTime = nodeQueue.get()
+			delay = arrivalTime + self.latency - time.time()
+			if delay > 0: time.sleep(delay)
+			time.sleep(self.serviceTime)
+			response = self.crc(request)
+			with self.writeLock:
+				self.write(str(response))
+
+#----VIRTUAL NODE------------
+class benchmarkNode(nodes.baseGestaltNode):
+	'''A virtual node with requests that transmit without waiting for a response.
+
+	pingRequest transmits as soon as it has channel access, and pingCommand sends the same ping as a command. spinRequest
+	mimics the externally-committed spin requests of a stepper node, which are grouped into actionSets and followed by a
+	multicast syncRequest.
+	queryRequest holds the channel until a response arrives, as the spin requests of a stepper node do, and tags each
+	request with its count so that the response can be matched to it. statusQuery is an untagged query on a second port.'''
+	def initPackets(self):
+		self.pingPacket = packets.packet(template = [packets.pInteger('count', 2)])
+		self.spinPacket = packets.packet(template = [packets.pInteger('majorSteps',1),
+													packets.pInteger('directions',1),
+													packets.pInteger('steps', 1),
+													packets.pInteger('accel',1),
+													packets.pInteger('accelSteps',1),
+													packets.pInteger('decelSteps',1),
+													packets.pInteger('sync', 1)])
+
+	def initPorts(self):
+		self.bindPort(port = 40, outboundFunction = self.pingRequest, outboundPacket = self.pingPacket)
+		self.bindPort(port = 23, outboundFunction = self.spinRequest, outboundPacket = self.spinPacket)
+		self.bindPort(port = 30, outboundFunction = self.syncRequest)
+		self.bindPort(port = 41, outboundFunction = self.queryRequest, outboundPacket = self.pingPacket, inboundPacket = self.pingPacket)
+		self.bindPort(port = 42, outboundFunction = self.statusQuery, outboundPacket = self.pingPacket, inboundPacket = self.pingPacket)
+		self.bindPort(port = 43, outboundFunction = self.pingCommand, outboundPacket = self.pingPacket)
+
+	class pingRequest(functions.serviceRoutine):
+		class actionObject(core.actionObject):
+			def init(self, count):
+				self.setPacket({'count':count})
+				self.commitAndRelease()
+				self.waitForChannelAccess()
+				self.transmit()
+
+	class pingCommand(functions.serviceRoutine):
+		class actionObject(core.commandObject):
+			def init(self, count):
+				self.setPacket({'count':count})
+
+	class spinRequest(functions.serviceRoutine):
+		class actionObject(core.actionObject):
+			def init(self, steps, sync = None):
+				self.steps = steps
+				self.sync = sync
+
+			def syncPush(self):
+				pass
+
+			def syncPull(self):
+				return self
+
+			def channelAccess(self):
+				self.setPacket({'majorSteps':abs(self.steps), 'directions':int(self.steps > 0), 'steps':abs(self.steps), 'accel':0,
+								'accelSteps':0, 'decelSteps':0, 'sync':1})
+				self.transmit()
+
+	class queryRequest(functions.serviceRoutine):
+		def getResponseTag(self, packet):
+			return packet['count']
+		
+		class actionObject(core.actionObject):
+			def init(self, count, finished = None, tries = 1, timeout = 2.0):
+				self.setPacket({'count':count})
+				self.count = count
+				self.responseTag = count
+				self.finished = finished	#a callback for when the response arrives
+				self.tries = tries
+				self.timeout = timeout	#None for an adaptive timeout
+				self.commitAndRelease()
+			
+			def channelAccess(self):
+				self.responded = self.transmitPersistent(tries = self.tries, timeout = self.timeout)
+				if self.finished: self.finished(self)
+	
+	class statusQuery(queryRequest):
+		def getResponseTag(self, packet):
+			return None
+
+	class syncRequest(functions.serviceRoutine):
+		class actionObject(core.commandObject):
+			__slots__ = ()
+			recyclable = True	#syncRequests are made and dropped by the interface
+			external = True	#committed by the interface, after the moves it synchronizes
+			def init(self):
+				self.mode = 'multicast'
@@ -0,0 +1,132 @@
+# gestalt benchmark: port discovery
+#
+# Plugs ports into a temporary folder, which stands in for /dev/, and measures how long it takes for them to be
+# discovered: by the original loop which lists the folder every 0.25 s, which is reproduced here, and by a portWatcher
+# which either polls or is woken by inotify. The times include closing the watcher, and closing an inotify descriptor
+# waits on the kernel for several milliseconds.
+#
+# Then tests a mix of ports and files which can't be opened as ports: one at a time as the original
+# serialInterface.getAvailablePorts did, all at once, each on a probe thread of its own, and with getAvailablePorts,
+# which tests them one at a time until one is slow to test. The ports are pseudo-terminals which open quickly, for
+# which probe threads cost more than they save.
+#
+# usage: python hotplug.py [plugCount] [probeCount]
+
+#----IMPORTS------------
+import os
+import sys
+import time
+import random
+import shutil
+import tempfile
+import threading
+import serial
+from gestalt import interfaces
+from harness import milliseconds
+
+#----DISCOVERY------------
+def legacyWaitForNewPort(directory, searchTerm, timeout = 10):
+	'''Waits for a new port the way devInterface.waitForNewPort originally did.'''
+	def deviceScan():
+		return [os.path.join(directory, port) for port in os.listdir(directory) if searchTerm in port]
+	timerCount = 0
+	devPorts = deviceScan()
+	while True:
+		time.sleep(0.25)
+		timerCount += 0.25
+		if timerCount > timeout: return False
+		currentDevPorts = deviceScan()
+		if len(currentDevPorts) < len(devPorts): devPorts = list(currentDevPorts)
+		elif len(currentDevPorts) > len(devPorts): return list(set(currentDevPorts) - set(devPorts))
+
+def plugIn(port, delay, plugTimes):
+	'''Creates port after delay seconds, and records when it was created.'''
+	time.sleep(delay)
+	open(port, 'w').close()
+	plugTimes[port] = time.time()
+
+def measureDiscovery(name, waitForNewPort, plugCount):
+	'''Returns the mean and maximum time from plugging in a port to its discovery.'''
+	directory = tempfile.mkdtemp()
+	randomGenerator = random.Random(0)
+	plugTimes = {}
+	latencies = []
+	try:
+		for plug in range(plugCount):
+			port = os.path.join(directory, 'ttyUSB' + str(plug))
+			plugThread = threading.Thread(target = plugIn, args = (port, randomGenerator.uniform(0.05, 0.3), plugTimes))
+			plugThread.start()
+			newPorts = waitForNewPort(directory, 'ttyUSB')
+			foundTime = time.time()
+			plugThread.join()
+			if newPorts == [port]: latencies.append(foundTime - plugTimes[port])
+	finally:
+		shutil.rmtree(directory)
+	print "  " + name + ": " + str(len(latencies)) + " of " + str(plugCount) + " found, mean " + milliseconds(sum(latencies)/max(len(latencies), 1)) + ", max " + milliseconds(max(latencies + [0]))
+
+def watcherWaitForNewPort(useInotify):
+	def waitForNewPort(directory, searchTerm):
+		watcher = interfaces.portWatcher([directory], useInotify = useInotify)
+		try:
+			return watcher.waitForNewPort(searchTerm, 10)
+		finally:
+			watcher.close()
+	return waitForNewPort
+
+#----PROBING------------
+def legacyGetAvailablePorts(ports):
+	'''Tests ports one at a time, as serialInterface.getAvailablePorts originally did.'''
+	availablePorts = []
+	for port in ports:
+		try:
+			openPort = serial.Serial(port)
+			openPort.close()
+			availablePorts += [port]
+		except serial.SerialException, e:
+			continue
+	return availablePorts
+
+def parallelGetAvailablePorts(interface):
+	'''Tests every port at once, each on a probe thread.'''
+	def getAvailablePorts(ports, timeout = 0.5):
+		probes = [interface.portProbe(interface, port) for port in ports]
+		endTime = time.time() + timeout
+		for probe in probes:
+			probe.join(max(endTime - time.time(), 0))
+		return [probe.port for probe in probes if probe.available]
+	return getAvailablePorts
+
+def measureProbing(probeCount):
+	directory = tempfile.mkdtemp()
+	terminals = []
+	try:
+		for index in range(probeCount):
+			masterFile, slaveFile = os.openpty()
+			terminals += [masterFile, slaveFile]
+			os.symlink(os.ttyname(slaveFile), os.path.join(directory, 'ttyUSB' + str(index)))
+			open(os.path.join(directory, 'ttyS' + str(index)), 'w').close()	#not a port
+		interface = interfaces.serialInterface(115200)
+		interface.devDirectory = directory
+		ports = interface.deviceScan('tty')
+		for name, getAvailablePorts in [('one at a time', legacyGetAvailablePorts), ('all at once', parallelGetAvailablePorts(interface)),
+														('getAvailablePorts', interface.getAvailablePorts)]:
+			startTime = time.time()
+			availablePorts = getAvailablePorts(ports)
+			print "  " + name + ": " + str(len(availablePorts)) + " of " + str(len(ports)) + " available, in " + milliseconds(time.time() - startTime)
+	finally:
+		for terminal in terminals: os.close(terminal)
+		shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: plugCount = int(sys.argv[1])
+	else: plugCount = 10
+	if len(sys.argv) > 2: probeCount = int(sys.argv[2])
+	else: probeCount = 16
+	print "time from plugging in a port to its discovery:"
+	measureDiscovery('listing every 0.25 s', legacyWaitForNewPort, plugCount)
+	measureDiscovery('portWatcher, polling', watcherWaitForNewPort(False), plugCount)
+	if interfaces.inotify: measureDiscovery('portWatcher, inotify', watcherWaitForNewPort(True), plugCount)
+	else: print "  inotify isn't available on this system"
+	print "testing which ports can be opened:"
+	measureProbing(probeCount)
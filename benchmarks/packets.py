@@ -0,0 +1,71 @@
+# gestalt benchmark: packet codecs
+#
+# Compares the token-by-token encode and decode path of gestalt.packets with the compiled struct codec, for the
+# packet templates used on every move: the gestalt frame, a stepper spin request, a status response, and a
+# bootloader page write.
+#
+# usage: python packets.py [iterations]
+
+#----IMPORTS------------
+import sys
+import time
+from gestalt import packets
+
+#----TEMPLATES------------
+gestaltPacket = packets.packet(template = [packets.pInteger('startByte', 1),
+										packets.pList('address', 2),
+										packets.pInteger('port', 1),
+										packets.pLength(),
+										packets.pList('payload')])
+
+spinPacket = packets.packet(template = [packets.pInteger('majorSteps',1),
+									packets.pInteger('directions',1),
+									packets.pInteger('steps', 1),
+									packets.pInteger('accel',1),
+									packets.pInteger('accelSteps',1),
+									packets.pInteger('decelSteps',1),
+									packets.pInteger('sync', 1)])
+
+statusPacket = packets.packet(template = [packets.pInteger('statusCode',1),
+										packets.pInteger('currentKey',1),
+										packets.pInteger('stepsRemaining',1),
+										packets.pInteger('readPosition',1),
+										packets.pInteger('writePosition',1)])
+
+bootWritePacket = packets.packet(template = [packets.pInteger('commandCode', 1),
+										packets.pInteger('pageNumber', 2),
+										packets.pList('writeData', 128)])
+
+spinValues = {'majorSteps':120, 'directions':5, 'steps':100, 'accel':3, 'accelSteps':10, 'decelSteps':10, 'sync':1}
+
+benchmarks = [('gestaltPacket', gestaltPacket, {'startByte':72, 'address':[1, 2], 'port':23, 'payload':spinPacket(spinValues)}),
+			('spinPacket', spinPacket, spinValues),
+			('statusPacket', statusPacket, {'statusCode':1, 'currentKey':7, 'stepsRemaining':40, 'readPosition':10, 'writePosition':20}),
+			('bootWritePacket', bootWritePacket, {'commandCode':2, 'pageNumber':17, 'writeData':range(128)})]
+
+#----BENCHMARK------------
+def rate(function, argument, iterations):
+	startTime = time.time()
+	for iteration in xrange(iterations):
+		function(argument)
+	return iterations/(time.time() - startTime)
+
+def runBenchmark(name, template, inputDict, iterations):
+	encoded = template(inputDict)
+	assert list(encoded) == list(template.encodeTokens(inputDict))
+	assert template.decode(list(encoded)) == template.decodeTokens(list(encoded))
+	encodeList = list(encoded)
+	tokenEncode = rate(template.encodeTokens, inputDict, iterations)
+	codecEncode = rate(template, inputDict, iterations)
+	tokenDecode = rate(template.decodeTokens, encodeList, iterations)
+	codecDecode = rate(template.decode, encodeList, iterations)
+	print name + " (" + str(len(encoded)) + " bytes):"
+	print "  encode: " + str(int(tokenEncode)) + " -> " + str(int(codecEncode)) + " packets/s (" + str(round(codecEncode/tokenEncode, 1)) + "x)"
+	print "  decode: " + str(int(tokenDecode)) + " -> " + str(int(codecDecode)) + " packets/s (" + str(round(codecDecode/tokenDecode, 1)) + "x)"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: iterations = int(sys.argv[1])
+	else: iterations = 20000
+	for name, template, inputDict in benchmarks:
+		runBenchmark(name, template, inputDict, iterations)
@@ -0,0 +1,63 @@
+# gestalt benchmark: pipelined requests
+#
+# Streams requests which wait on a response from their node, alternating between a query whose responses are matched
+# to it by tag and an untagged query on a second port, to a single node. The node starts on each request a fixed
+# latency after it was written, and answers its requests one at a time, a fixed service time after starting on each.
+#
+# The node is run with a growing pipelineDepth, which is the number of its requests that can wait on a response at
+# once. Every response is checked against the request it was delivered to.
+#
+# usage: python pipeline.py [requestCount] [latency] [serviceTime]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from harness import openLoopback, addNode, responder, closeInterfaces
+
+#----BENCHMARK------------
+class requestChecker(object):
+	'''Counts finished requests, along with those which timed out or were handed another request's response.'''
+	def __init__(self, requestCount):
+		self.requestCount = requestCount
+		self.finishedCount = 0
+		self.timeoutCount = 0
+		self.mismatchCount = 0
+		self.lock = threading.Lock()
+		self.finished = threading.Event()
+
+	def __call__(self, actionObject):
+		with self.lock:
+			self.finishedCount += 1
+			if not actionObject.responded: self.timeoutCount += 1
+			elif actionObject.getPacket()['count'] != actionObject.count: self.mismatchCount += 1
+			if self.finishedCount == self.requestCount: self.finished.set()
+
+
+def runBenchmark(pipelineDepth, requestCount, latency, serviceTime):
+	interface, masterFile = openLoopback(1000000)
+	responder(interface, masterFile, serviceTime, latency)
+	node = addNode(interface, [1, 1])
+	node.pipelineDepth = pipelineDepth
+	checker = requestChecker(requestCount)
+
+	startTime = time.time()
+	for count in range(requestCount):
+		if count % 2: node.statusQuery(count, checker)
+		else: node.queryRequest(count, checker)
+	checker.finished.wait(60)
+	elapsedTime = time.time() - startTime
+	print "  pipelineDepth " + str(pipelineDepth) + ": " + str(checker.finishedCount) + " requests, " + str(round(checker.finishedCount/elapsedTime, 1)) + " requests/s, " + str(checker.mismatchCount) + " mismatched, " + str(checker.timeoutCount) + " timed out"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 200
+	if len(sys.argv) > 2: latency = float(sys.argv[2])
+	else: latency = 0.010
+	if len(sys.argv) > 3: serviceTime = float(sys.argv[3])
+	else: serviceTime = 0.001
+	print "latency " + str(latency*1000.0) + " ms, service time " + str(serviceTime*1000.0) + " ms per request:"
+	for pipelineDepth in [1, 2, 4, 8]:
+		runBenchmark(pipelineDepth, requestCount, latency, serviceTime)
+	closeInterfaces()
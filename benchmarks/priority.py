@@ -0,0 +1,95 @@
+# gestalt benchmark: priority classes
+#
+# Streams synchronized multi-axis moves to a network of emulated 086-005a stepper nodes, as benchmarks/emulator.py
+# does, fast enough that the move buffers of the nodes fill and the moves back up in the interface. While the moves
+# stream, a second thread takes turns sending a status query (spinStatusRequest, of the 'interactive' class) and a
+# disable request (disableRequest, of the 'urgent' class) to the nodes, and times how long each takes to return.
+#
+# The benchmark is run with the priority classes of the driver, and again with every request in the 'motion' class,
+# where a query waits behind every move committed before it.
+#
+# usage: python priority.py [moveCount] [axisCount]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+import threading
+from gestalt import core
+from gestalt import emulators
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+prioritizedRequests = [stepperDriver.virtualNode.spinStatusRequest, stepperDriver.virtualNode.disableRequest]
+
+#----BENCHMARK------------
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def streamMoves(axisNodes, moveCount):
+	for move in range(moveCount):
+		axesSteps = [(50 + 10*axis + move % 40)*(1 if move % 2 else -1) for axis in range(len(axisNodes))]
+		syncToken = core.syncToken()
+		moveSet = core.actionSet([node.spinRequest(steps, external = True, sync = syncToken) for node, steps in zip(axisNodes, axesSteps)])
+		moveSet.commit()
+		moveSet.release()
+
+def sendRequests(axisNodes, streaming, latencies, interval):
+	'''Takes turns sending a status query and a disable request to each node, until streaming is cleared.'''
+	count = 0
+	while streaming.is_set():
+		node = axisNodes[count % len(axisNodes)]
+		name = 'status' if count % 2 == 0 else 'disable'
+		startTime = time.time()
+		if name == 'status': node.spinStatusRequest()
+		else: node.disableRequest()
+		latencies[name] += [time.time() - startTime]
+		count += 1
+		time.sleep(interval)
+
+def runBenchmark(name, baudRate, moveCount, axisCount, timeScale, interval = 0.05):
+	interface, devicePort = openVirtual(baudRate)
+	emulatedNodes = [emulators.stepperNodeEmulator([1, axis + 1], timeScale = timeScale) for axis in range(axisCount)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], stepperDriver.virtualNode) for axis in range(axisCount)]
+
+	latencies = {'status':[], 'disable':[]}
+	streaming = threading.Event()
+	streaming.set()
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		requester = threading.Thread(target = sendRequests, args = (axisNodes, streaming, latencies, interval))
+		requester.daemon = True
+		startTime = time.time()
+		requester.start()
+		streamMoves(axisNodes, moveCount)
+		while not all([node.isIdle() and node.moveCount >= moveCount for node in emulatedNodes]) and time.time() - startTime < 120: time.sleep(0.01)
+		elapsedTime = time.time() - startTime
+		streaming.clear()
+		requester.join()
+	finally:
+		sys.stdout = stdout
+
+	print name + ": " + str(moveCount) + " moves in " + str(round(elapsedTime, 2)) + " s"
+	for requestName in ['status', 'disable']:
+		samples = sorted(latencies[requestName])
+		if not samples: continue
+		print "  " + requestName + ": " + str(len(samples)) + " requests, median " + milliseconds(samples[len(samples)/2]) + ", max " + milliseconds(samples[-1])
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 300
+	if len(sys.argv) > 2: axisCount = int(sys.argv[2])
+	else: axisCount = 4
+	baudRate = 115200
+	print str(baudRate) + " baud, " + str(axisCount) + " axes. One packet takes about " + milliseconds(12*10.0/baudRate) + " on the line."
+	runBenchmark('priority classes', baudRate, moveCount, axisCount, 10.0)
+	for request in prioritizedRequests: request.actionObject.priority = 'motion'
+	runBenchmark('all requests in the motion class', baudRate, moveCount, axisCount, 10.0)
+	closeInterfaces()
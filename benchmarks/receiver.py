@@ -0,0 +1,117 @@
+# gestalt benchmark: receiver throughput
+#
+# Measures how quickly gestaltInterface.receiveThread turns a stream of bytes into routed packets.
+# A pseudo-terminal pair stands in for the serial port: the interface opens the slave side, and this script
+# writes status-sized response packets into the master side, paced to the line rate of the requested baud rate.
+#
+# The original byte-at-a-time receiver is run alongside for comparison.
+#
+# Reported for each baud rate and receiver:
+#	packets/s:	routed packets per second of wall time
+#	latency:	time from the last byte of a packet being written to the packet arriving at its virtual node
+#
+# usage: python receiver.py [packetCount]
+
+#----IMPORTS------------
+import os
+import sys
+import time
+import struct
+import threading
+from gestalt import interfaces
+from harness import openLoopback, closeInterfaces
+
+#----BENCHMARK------------
+class timingNode(object):
+	'''Stands in for a virtual node, recording the arrival time of every packet routed to it.'''
+	def __init__(self, packetCount):
+		self.name = 'timingNode'
+		self.packetCount = packetCount
+		self.arrivalTimes = {}
+		self.finished = threading.Event()
+
+	def route(self, port, data):
+		sequenceNumber = struct.unpack('<I', str(bytearray(data[:4])))[0]
+		self.arrivalTimes[sequenceNumber] = time.time()
+		if len(self.arrivalTimes) == self.packetCount: self.finished.set()
+
+
+class legacyInterface(interfaces.gestaltInterface):
+	'''A gestalt interface using the original receiver, which reads and frames one byte at a time.'''
+	class receiveThread(interfaces.gestaltInterface.receiveThread):
+		def run(self):
+			packet = []
+			inPacket = False
+			packetPosition = 0
+			packetLength = 5
+			while not self.stopEvent.is_set():
+				byte = self.interface.interface.receive()
+				if byte:
+					byte = ord(byte)
+					if not inPacket:
+						if byte == 72 or byte == 138:
+							inPacket = True
+							packet += [byte]
+							packetPosition += 1
+							continue
+					else:
+						packet += [byte]
+						if packetPosition == 4:
+							packetLength = byte
+							packetPosition += 1
+							continue
+						if packetPosition < packetLength:
+							packetPosition += 1
+							continue
+						if packetPosition == packetLength:
+							if self.interface.CRC.validate(packet): self.interface.packetRouter.routerQueue.put(bytearray(packet[:len(packet)-1]))
+				packet = []
+				inPacket = False
+				packetPosition = 0
+				packetLength = 5
+				time.sleep(0.0005)
+
+
+def buildPacket(interface, sequenceNumber):
+	'''Returns a unicast response packet carrying sequenceNumber in a seven byte payload.'''
+	payload = list(bytearray(struct.pack('<IBBB', sequenceNumber, 1, 0, 0)))
+	packet = interface.gestaltPacket({'startByte':72, 'address':[1, 2], 'port':26, 'payload':payload})
+	return interfaces.serialize(interface.CRC(packet))
+
+
+def runBenchmark(interfaceType, baudRate, packetCount):
+	interface, masterFile = openLoopback(baudRate, interfaceType)
+	node = timingNode(packetCount)
+	interface.assignNode(node, [1, 2])
+
+	packets = [buildPacket(interface, sequenceNumber) for sequenceNumber in range(packetCount)]
+	byteTime = 10.0 / baudRate	#start bit, eight data bits, stop bit
+	sendTimes = {}
+
+	startTime = time.time()
+	lineTime = startTime	#the time at which the simulated line becomes free
+	for sequenceNumber, packet in enumerate(packets):
+		lineTime += len(packet) * byteTime
+		delay = lineTime - time.time()
+		if delay > 0: time.sleep(delay)
+		os.write(masterFile, packet)
+		sendTimes[sequenceNumber] = time.time()
+	node.finished.wait(10 + packetCount * 0.01)
+	endTime = time.time()
+
+	latencies = sorted([node.arrivalTimes[key] - sendTimes[key] for key in node.arrivalTimes])
+
+	print str(baudRate) + " baud, " + interfaceType.__name__ + ":"
+	print "  routed " + str(len(latencies)) + " of " + str(packetCount) + " packets"
+	if latencies:
+		print "  packets/s: " + str(round(len(latencies) / (endTime - startTime), 1))
+		print "  latency (ms): median " + str(round(latencies[len(latencies)//2]*1000.0, 3)) + ", 99th " + str(round(latencies[int(len(latencies)*0.99)]*1000.0, 3)) + ", max " + str(round(latencies[-1]*1000.0, 3))
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: packetCount = int(sys.argv[1])
+	else: packetCount = 2000
+	for baudRate in [115200, 1000000]:
+		for interfaceType in [interfaces.gestaltInterface, legacyInterface]:
+			runBenchmark(interfaceType, baudRate, packetCount)
+	closeInterfaces()
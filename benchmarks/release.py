@@ -0,0 +1,88 @@
+# gestalt benchmark: head-of-line blocking on release
+#
+# Two machines share an interface. The first is driven by a motion planner, which commits its moves ahead of time and
+# releases them one at a time as they are planned, so that most of its moves wait unreleased in the channelPriority
+# queue. The second sends a stream of requests, each committed and released at once, to a node of its own. Reported is
+# how long the requests of the second machine take to be granted channel access, and how long the interface held
+# released actionObjects up behind others.
+#
+# The benchmark is run with the channelPriorityThread of gestalt.interfaces, which only keeps actionObjects in order
+# among those to the same nodes, and with one which releases every actionObject in the order it was committed, as the
+# channelPriorityThread originally did.
+#
+# usage: python release.py [requestCount] [releaseInterval]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from gestalt import interfaces
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+#----BENCHMARK------------
+class committedOrderChannelPriority(interfaces.gestaltInterface.channelPriorityThread):
+	'''Releases actionObjects strictly in the order they were committed within each class.'''
+	def findReleased(self, queuedObjects, now):
+		for queuedObject in queuedObjects[1:]:
+			if queuedObject.isReleased() and queuedObject not in self.blockedSince: self.blockedSince[queuedObject] = now
+		if queuedObjects and queuedObjects[0].isReleased(): return queuedObjects[0]
+		return None
+
+
+def drainPort(devicePort):
+	while True:
+		devicePort.read(1024)
+
+def planMoves(node, planning, lookahead, releaseInterval):
+	'''Commits moves lookahead ahead of the one being released, and releases one at a time, as a motion planner does,
+	until planning is cleared.'''
+	moves = []
+	while planning.is_set() or moves:
+		if planning.is_set():
+			moves += [node.spinRequest(50)]
+			moves[-1].commit()
+		if len(moves) > lookahead or not planning.is_set():
+			time.sleep(releaseInterval)
+			moves.pop(0).release()
+
+def runBenchmark(name, channelPriorityThread, requestCount, releaseInterval, lookahead = 50):
+	interfaceClass = type('releaseInterface', (interfaces.gestaltInterface,), {'channelPriorityThread':channelPriorityThread})
+	interface, devicePort = openVirtual(1000000, interfaceClass)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	plannedNode = addNode(interface, [1, 1])
+	requestNode = addNode(interface, [2, 1])
+
+	planning = threading.Event()
+	planning.set()
+	planner = threading.Thread(target = planMoves, args = (plannedNode, planning, lookahead, releaseInterval))
+	planner.daemon = True
+	planner.start()
+	time.sleep(lookahead*releaseInterval)	#until the lookahead has filled
+
+	latencies = []
+	for count in range(requestCount):
+		startTime = time.time()
+		requestNode.pingRequest(count)	#returns once granted channel access
+		latencies += [time.time() - startTime]
+		time.sleep(releaseInterval/2.0)
+	planning.clear()
+	planner.join()
+
+	latencies.sort()
+	report = interface.channelPriority.report()
+	print "  " + name + ":"
+	print "    requests granted access after: median " + milliseconds(latencies[len(latencies)/2]) + ", max " + milliseconds(latencies[-1])
+	print "    " + str(report['blocked']) + " of " + str(report['released']) + " released actionObjects held up, for a mean " + milliseconds(report['meanBlockedTime']) + " and max " + milliseconds(report['maxBlockedTime'])
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 20
+	if len(sys.argv) > 2: releaseInterval = float(sys.argv[2])
+	else: releaseInterval = 0.01
+	print "planner lookahead of 50 moves, one released every " + milliseconds(releaseInterval) + ":"
+	runBenchmark('ordered by node', interfaces.gestaltInterface.channelPriorityThread, requestCount, releaseInterval)
+	runBenchmark('ordered by commit', committedOrderChannelPriority, requestCount, releaseInterval)
+	closeInterfaces()
@@ -0,0 +1,125 @@
+# gestalt benchmark: retransmission timeouts
+#
+# Streams requests which wait on a response from their node, over a line which drops a fraction of the requests. Each
+# dropped request is retransmitted, either after the original fixed timeout of 0.2 s or after the adaptive timeout set
+# by the round trip times measured for the node.
+#
+# Spin requests, which a node runs again each time one arrives, are then sent to an emulated 086-005a stepper node
+# which is late with some of its responses, and the moves it took on are counted. A spin request must not be sent again
+# just because its response is late. For comparison, the same is done with spin requests treated as idempotent, which
+# are retransmitted as soon as the adaptive timeout runs out.
+#
+# usage: python retransmit.py [requestCount] [lossRate] [serviceTime]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+import threading
+from gestalt import emulators
+from harness import openLoopback, openVirtual, addNode, responder, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class latencyRecorder(object):
+	'''Records how long each request took from being made until its response arrived.'''
+	def __init__(self):
+		self.latencies = []
+		self.failedCount = 0
+		self.finished = threading.Event()
+	
+	def __call__(self, actionObject):
+		if actionObject.responded: self.latencies.append(time.time() - self.startTime)
+		else: self.failedCount += 1
+		self.finished.set()
+
+
+def runBenchmark(timeout, requestCount, lossRate, serviceTime):
+	interface, masterFile = openLoopback(1000000)
+	responder(interface, masterFile, serviceTime, lossRate = lossRate)
+	node = addNode(interface, [1, 1])
+	recorder = latencyRecorder()
+	
+	startTime = time.time()
+	for count in range(requestCount):
+		recorder.finished.clear()
+		recorder.startTime = time.time()
+		node.queryRequest(count, recorder, tries = 10, timeout = timeout)
+		recorder.finished.wait(30)
+	elapsedTime = time.time() - startTime
+	
+	latencies = sorted(recorder.latencies)
+	if timeout == None: print "adaptive timeout:"
+	else: print "fixed " + str(timeout) + " s timeout:"
+	print "  " + str(len(latencies)) + " answered, " + str(recorder.failedCount) + " failed, " + str(round(requestCount/elapsedTime, 1)) + " requests/s"
+	print "  request latency: median " + milliseconds(latencies[len(latencies)/2]) + ", 99th percentile " + milliseconds(latencies[int(len(latencies)*0.99)]) + ", max " + milliseconds(latencies[-1])
+	if timeout == None:
+		report = node.rttEstimator.report()
+		print "  round trip: smoothed " + milliseconds(report['smoothedRTT']) + ", 50/90/99th percentile " + ", ".join([milliseconds(report['percentiles'][percent]) for percent in (50, 90, 99)])
+		print "  " + str(report['samples']) + " samples, " + str(report['timeouts']) + " timeouts, current timeout " + milliseconds(report['timeout'])
+
+
+class lateStepperNode(emulators.stepperNodeEmulator):
+	'''A stepper node which takes on every spin request straight away, but holds up the response to every lateEvery'th.'''
+	def __init__(self, address, lateEvery = 10, lateness = 0.12, **kwargs):
+		self.lateEvery = lateEvery
+		self.lateness = lateness
+		self.spinCount = 0
+		emulators.stepperNodeEmulator.__init__(self, address, **kwargs)
+	
+	def transmit(self, port, payload = None, multicast = False):
+		if port == 23:
+			self.spinCount += 1
+			if self.spinCount % self.lateEvery == 0: time.sleep(self.lateness)
+		emulators.stepperNodeEmulator.transmit(self, port, payload, multicast)
+
+class idempotentNode(stepperDriver.virtualNode):
+	'''The stepper driver, with spin requests which are retransmitted as if the node could take them on twice harmlessly.'''
+	class spinRequest(stepperDriver.virtualNode.spinRequest):
+		class actionObject(stepperDriver.virtualNode.spinRequest.actionObject):
+			idempotent = True
+
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def runLateSpins(name, nodeClass, spinCount = 100):
+	interface, devicePort = openVirtual(1000000)
+	emulatedNode = lateStepperNode([1, 1], stepRate = 1000000.0)	#runs each move at once, so that the buffer never fills
+	emulators.emulatedNetwork(devicePort, [emulatedNode])
+	node = addNode(interface, [1, 1], nodeClass)
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		for count in range(spinCount):
+			spin = node.spinRequest(10, external = True)
+			spin.commit()
+			spin.release()
+		startTime = time.time()
+		while emulatedNode.moveCount < spinCount and time.time() - startTime < 60: time.sleep(0.01)
+		time.sleep(1.0)	#for any retransmission still on its way
+	finally:
+		sys.stdout = stdout
+	report = node.rttEstimator.report()
+	print "  " + name + ": " + str(spinCount) + " spin requests, " + str(emulatedNode.moveCount) + " moves taken on by the node, " + str(report['timeouts']) + " timeouts"
+	return emulatedNode.moveCount == spinCount
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 500
+	if len(sys.argv) > 2: lossRate = float(sys.argv[2])
+	else: lossRate = 0.02
+	if len(sys.argv) > 3: serviceTime = float(sys.argv[3])
+	else: serviceTime = 0.001
+	print str(lossRate*100.0) + "% of requests lost, service time " + str(serviceTime*1000.0) + " ms per request:"
+	for timeout in [0.2, None]:
+		runBenchmark(timeout, requestCount, lossRate, serviceTime)
+	print "spin requests to a node which is 120 ms late with every 10th response:"
+	runLateSpins('spin requests treated as idempotent', idempotentNode)
+	assert runLateSpins('spin requests', stepperDriver.virtualNode), "a late response had a spin request run twice"
+	closeInterfaces()
@@ -0,0 +1,146 @@
+# gestalt benchmark: packet routing
+#
+# Registers a growing number of virtual nodes on one interface, and routes response packets to them in a single thread,
+# from the framed packet to the inbound service routine of its port. Routing is run twice: once the original way, which
+# is reproduced here, by looking the node up under its address turned into a string and then its port in the node, and
+# once thru the address index of the interface's nodeManager. The lookup of the service routine is also timed on its
+# own, since decoding the payload and delivering it to a waiting request take most of the time spent routing.
+#
+# Also times validateIP, which is called for each random address tried while assigning addresses to new nodes.
+#
+# Finally the router is stalled, as a slow service routine run in its thread would, and more responses are written to
+# the port than its queue holds. Those which don't fit are checked to be dropped, rather than holding up the receive
+# thread, and the rest to be routed once the router is running again.
+#
+# usage: python router.py [packetCount]
+
+#----IMPORTS------------
+import sys
+import os
+import time
+import random
+import threading
+from gestalt import interfaces
+from harness import openLoopback, addNode, closeInterfaces
+
+#----ROUTING------------
+def legacyRouter(interface):
+	'''Returns a function which routes a packet the way packetRouterThread originally did.'''
+	address_node = dict([(str(address), node) for node, address in interface.nodeManager.node_address.iteritems()])
+	headerLength = interface.receiver.headerLength
+	def route(routerPacket):
+		address = [routerPacket[1], routerPacket[2]]
+		port = routerPacket[3]
+		data = memoryview(routerPacket)[headerLength:]
+		destinationNode = address_node.get(str(address), False)
+		if not destinationNode: return
+		destinationNode.route(port, data)
+	return route
+
+def indexRouter(interface):
+	'''Returns a function which routes a packet the way packetRouterThread does.'''
+	nodeManager = interface.nodeManager
+	headerLength = interface.receiver.headerLength
+	def route(routerPacket):
+		index = (routerPacket[1] << 8) | routerPacket[2]
+		port = routerPacket[3]
+		data = memoryview(routerPacket)[headerLength:]
+		route = nodeManager.getRoute(index, port)
+		if route != None: route.receiver(data)
+	return route
+
+def legacyLookup(interface):
+	'''Returns a function which finds the service routine for a packet the way the original router and node.route did.'''
+	address_node = dict([(str(address), node) for node, address in interface.nodeManager.node_address.iteritems()])
+	def lookup(routerPacket):
+		return address_node[str([routerPacket[1], routerPacket[2]])].bindPort.inPorts[routerPacket[3]]
+	return lookup
+
+def indexLookup(interface):
+	nodeManager = interface.nodeManager
+	def lookup(routerPacket):
+		return nodeManager.getRoute((routerPacket[1] << 8) | routerPacket[2], routerPacket[3])
+	return lookup
+
+def legacyValidateIP(interface):
+	address_node = dict([(str(address), node) for node, address in interface.nodeManager.node_address.iteritems()])
+	def validateIP(IP):
+		return str(IP) not in address_node
+	return validateIP
+
+class countingRoute(object):
+	'''Stands in for the inbound service routine of a port, counting the packets routed to it.'''
+	def __init__(self):
+		self.count = 0
+	
+	def receiver(self, data):
+		self.count += 1
+
+#----BENCHMARK------------
+def runBenchmark(nodeCount, packetCount):
+	interface, masterFile = openLoopback(1000000)
+	addresses = random.Random(0).sample([[address0, address1] for address0 in range(256) for address1 in range(256)], nodeCount)
+	for address in addresses:
+		addNode(interface, address)
+	routerPackets = []
+	for count in range(packetCount):
+		address = addresses[count % nodeCount]
+		packet = interface.gestaltPacket({'startByte':72, 'address':address, 'port':41, 'payload':[count % 256, 0]})
+		routerPackets.append(packet)	#as the receive thread hands it to the router, without the CRC
+	randomAddresses = [[random.randint(0, 255), random.randint(0, 255)] for count in range(packetCount)]
+	
+	print str(nodeCount) + " nodes:"
+	for name, router, lookup, validateIP in [('string keys', legacyRouter(interface), legacyLookup(interface), legacyValidateIP(interface)),
+									('address index', indexRouter(interface), indexLookup(interface), interface.validateIP)]:
+		startTime = time.time()
+		for routerPacket in routerPackets:
+			router(routerPacket)
+		routeRate = packetCount/(time.time() - startTime)
+		startTime = time.time()
+		for routerPacket in routerPackets:
+			lookup(routerPacket)
+		lookupRate = packetCount/(time.time() - startTime)
+		startTime = time.time()
+		for IP in randomAddresses:
+			validateIP(IP)
+		validateRate = packetCount/(time.time() - startTime)
+		print "  " + name + ": " + str(int(routeRate)) + " packets routed/s, " + str(int(lookupRate)) + " routines looked up/s, " + str(int(validateRate)) + " addresses validated/s"
+
+
+def runOverflow(extraCount = 200, timeout = 10.0):
+	'''Stalls the router thread while more packets than its queue holds are received, and returns whether those dropped
+	and those routed add up to all of them.'''
+	interfaceClass = type('stalledInterface', (interfaces.gestaltInterface,), {'dispatchWorkers':0})	#routes in the router thread
+	interface, masterFile = openLoopback(1000000, interfaceClass)
+	addNode(interface, [1, 1])
+	route = countingRoute()
+	running = threading.Event()
+	def stalledGetRoute(index, port):
+		running.wait()
+		return route
+	interface.nodeManager.getRoute = stalledGetRoute
+	routerQueue = interface.packetRouter.routerQueue
+	packetCount = routerQueue.maxsize + extraCount
+	packet = interface.CRC(interface.gestaltPacket({'startByte':72, 'address':[1, 1], 'port':41, 'payload':[0, 0]}))
+	startTime = time.time()
+	for count in range(packetCount):
+		os.write(masterFile, str(packet))
+	while time.time() - startTime < timeout:
+		report = routerQueue.report()
+		if report['puts'] + report['rejected'] == packetCount: break
+		time.sleep(0.01)
+	running.set()
+	while route.count + report['rejected'] < packetCount and time.time() - startTime < timeout:
+		time.sleep(0.01)
+	print "router stalled, with a queue of " + str(routerQueue.maxsize) + " packets:"
+	print "  " + str(packetCount) + " packets received, " + str(report['rejected']) + " dropped, " + str(route.count) + " routed once running again"
+	return report['rejected'] > 0 and route.count + report['rejected'] == packetCount
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: packetCount = int(sys.argv[1])
+	else: packetCount = 50000
+	for nodeCount in [10, 100, 500]:
+		runBenchmark(nodeCount, packetCount)
+	assert runOverflow(), "packets which didn't fit in the router queue weren't accounted for"
+	closeInterfaces()
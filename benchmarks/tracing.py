@@ -0,0 +1,128 @@
+# gestalt benchmark: latency tracing
+#
+# Streams synchronized moves to a pair of emulated 086-005a stepper nodes, as benchmarks/priority.py does, while a
+# second thread sends status queries alongside them, with utilities.trace following every actionObject thru its
+# lifecycle. Reported for each service routine, and for each node, are the median, 99th percentile and max time taken
+# to reach each stage from the stage before it. The traces are then exported in the Chrome trace event format, which
+# can be opened with chrome://tracing or Perfetto, and the file is read back to check it.
+#
+# The cost of tracing is measured separately, by sending fire-and-forget commands to nodes on a fast virtual line with
+# tracing off and then on, and comparing the time the sender spends on each command.
+#
+# usage: python tracing.py [moveCount] [traceFile]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import json
+import time
+import threading
+from gestalt import core
+from gestalt import emulators
+from gestalt import utilities
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+def streamMoves(axisNodes, moveCount):
+	for move in range(moveCount):
+		axesSteps = [(50 + 10*axis + move % 40)*(1 if move % 2 else -1) for axis in range(len(axisNodes))]
+		syncToken = core.syncToken()
+		moveSet = core.actionSet([node.spinRequest(steps, external = True, sync = syncToken) for node, steps in zip(axisNodes, axesSteps)])
+		moveSet.commit()
+		moveSet.release()
+
+def queryStatus(axisNodes, streaming, interval):
+	count = 0
+	while streaming.is_set():
+		axisNodes[count % len(axisNodes)].spinStatusRequest()
+		count += 1
+		time.sleep(interval)
+
+def printStages(name, stageReports):
+	print "  " + name + ":"
+	for stage in utilities.trace.stages:
+		if stage not in stageReports: continue
+		stageReport = stageReports[stage]
+		print "    " + stage + ": median " + milliseconds(stageReport['median']) + ", 99th percentile " + milliseconds(stageReport['p99']) + ", max " + milliseconds(stageReport['max']) + " over " + str(stageReport['count'])
+
+def traceMoves(moveCount, traceFile, baudRate = 115200, axisCount = 2, interval = 0.05):
+	interface, devicePort = openVirtual(baudRate)
+	emulatedNodes = [emulators.stepperNodeEmulator([1, axis + 1]) for axis in range(axisCount)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], stepperDriver.virtualNode) for axis in range(axisCount)]
+
+	streaming = threading.Event()
+	streaming.set()
+	utilities.trace.enable()
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		requester = threading.Thread(target = queryStatus, args = (axisNodes, streaming, interval))
+		requester.daemon = True
+		startTime = time.time()
+		requester.start()
+		streamMoves(axisNodes, moveCount)
+		while not all([node.isIdle() and node.moveCount >= moveCount for node in emulatedNodes]) and time.time() - startTime < 120: time.sleep(0.01)
+		streaming.clear()
+		requester.join()
+		time.sleep(0.1)	#for the last syncRequest to finish with the channel
+	finally:
+		sys.stdout = stdout
+		utilities.trace.disable()
+
+	report = utilities.trace.report()
+	print str(moveCount) + " moves to " + str(axisCount) + " nodes at " + str(baudRate) + " baud, " + str(report['traced']) + " actionObjects traced in " + str(round(report['elapsedTime'], 2)) + " s."
+	print "time taken to reach each stage from the one before it, by service routine:"
+	for routineName in sorted(report['serviceRoutines']):
+		printStages(routineName, report['serviceRoutines'][routineName])
+	print "by node:"
+	for nodeName in sorted(report['nodes']):
+		printStages(nodeName, report['nodes'][nodeName])
+
+	utilities.trace.export(traceFile)
+	with open(traceFile) as exportedFile: traceEvents = json.load(exportedFile)['traceEvents']
+	print "exported " + str(len(traceEvents)) + " trace events to " + traceFile + ", " + str(os.path.getsize(traceFile)/1024) + " kB"
+
+def drainPort(devicePort):
+	while True:
+		devicePort.read(1024)
+
+def sendCommands(commandCount, tracing, nodeCount = 8):
+	'''Returns the time the sender spends on each command.'''
+	interface, devicePort = openVirtual(1000000)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	commandNodes = [addNode(interface, [1, node + 1]) for node in range(nodeCount)]
+	if tracing: utilities.trace.enable()
+	try:
+		startTime = time.time()
+		for count in xrange(commandCount):
+			commandNodes[count % nodeCount].pingCommand(count)
+		sendTime = time.time() - startTime
+		time.sleep(0.5)	#lets the commands be written before tracing is turned off
+		return sendTime/commandCount
+	finally:
+		utilities.trace.disable()
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 300
+	if len(sys.argv) > 2: traceFile = sys.argv[2]
+	else: traceFile = 'gestaltTrace.json'
+	traceMoves(moveCount, traceFile)
+	commandCount = 5000
+	print "cost of tracing, over " + str(commandCount) + " commands to 8 nodes at 1000000 baud:"
+	for name, tracing in [('tracing off', False), ('tracing on', True)]:
+		print "  " + name + ": sender spent " + milliseconds(sendCommands(commandCount, tracing)) + " per command"
+	closeInterfaces()
@@ -0,0 +1,162 @@
+# gestalt benchmark: transactions
+#
+# Runs a script which first configures several nodes, sending each a series of setup commands, and then queues many
+# small synchronized moves across them. The script is run with every command and move committed on its own, and again
+# inside a core.transaction, which gathers them and commits them as one unit.
+#
+# Reported for each are the time the script spends on each request, the time until every packet has been written to
+# the line, and the number of items which passed thru the channelPriority queue. A transaction which is committed and
+# then cancelled before it is released is also checked to send nothing.
+#
+# Moves made with functions.move inside a transaction are checked to wait for the motion planner, by driving a pair of
+# emulated 086-005a stepper nodes back and forth, and counting the spin requests which reach the nodes with no
+# acceleration or deceleration. A transaction mustn't send the spin requests of its moves before the planner has set
+# their ramps and released them. A transaction with requests for nodes on two interfaces is checked to be refused.
+#
+# usage: python transactions.py [setupCount] [moveCount]
+
+#----IMPORTS------------
+import os
+import sys
+import imp
+import time
+import threading
+from gestalt import core
+from gestalt import emulators
+from gestalt import functions
+from gestalt import interfaces
+from gestalt import machines
+from gestalt import nodes
+from harness import openVirtual, addNode, milliseconds, closeInterfaces
+
+driverFile = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'examples', 'nodes', 'compoundnode', '086-005a.py')
+stepperDriver = imp.load_source('stepperDriver', driverFile)
+
+#----BENCHMARK------------
+class quiet(object):
+	'''Swallows the responses which the driver prints.'''
+	def write(self, text):
+		pass
+
+
+class rampRecorder(emulators.stepperNodeEmulator):
+	'''A stepper node which records the acceleration and deceleration steps of every spin request it receives.'''
+	def reset(self):
+		emulators.stepperNodeEmulator.reset(self)
+		self.ramps = []	#[(accelSteps, decelSteps)]
+	
+	def svcSpin(self, payload):
+		spin = self.spinRequestPacket.decode(payload)
+		self.ramps.append((spin['accelSteps'], spin['decelSteps']))
+		emulators.stepperNodeEmulator.svcSpin(self, payload)
+
+
+def drainPort(devicePort):
+	while True:
+		devicePort.read(1024)
+
+def runScript(benchmarkNodes, setupCount, moveCount):
+	'''Sends setupCount commands to each node, and then moveCount moves across all of them. Returns the packets sent.'''
+	for count in xrange(setupCount):
+		for node in benchmarkNodes: node.pingCommand(count)
+	for move in xrange(moveCount):
+		moveSet = core.actionSet([node.spinRequest(10 + move % 20) for node in benchmarkNodes])
+		moveSet.commit()
+		moveSet.release()
+	return setupCount*len(benchmarkNodes) + moveCount*(len(benchmarkNodes) + 1)	#each move is followed by a syncRequest
+
+def sendAlone(benchmarkNodes, setupCount, moveCount):
+	return runScript(benchmarkNodes, setupCount, moveCount)
+
+def sendTransaction(benchmarkNodes, setupCount, moveCount):
+	with core.transaction():
+		return runScript(benchmarkNodes, setupCount, moveCount)
+
+def openNetwork(nodeCount):
+	interface, devicePort = openVirtual(1000000)
+	drainThread = threading.Thread(target = drainPort, args = (devicePort,))
+	drainThread.daemon = True
+	drainThread.start()
+	return interface, [addNode(interface, [1, node + 1]) for node in range(nodeCount)]
+
+def runBenchmark(name, send, setupCount, moveCount, nodeCount = 4):
+	interface, benchmarkNodes = openNetwork(nodeCount)
+	serialInterface = interface.interface
+	serialInterface.resetTransmitStatistics()
+
+	startTime = time.time()
+	packetCount = send(benchmarkNodes, setupCount, moveCount)
+	sendTime = time.time() - startTime
+	while serialInterface.transmitStatistics()['packets'] < packetCount and time.time() - startTime < 60: time.sleep(0.001)
+	elapsedTime = time.time() - startTime
+
+	report = interface.channelPriority.report()
+	print "  " + name + ":"
+	print "    script spent " + milliseconds(sendTime/(setupCount*nodeCount + moveCount)) + " per request, " + str(serialInterface.transmitStatistics()['packets']) + " of " + str(packetCount) + " packets written after " + milliseconds(elapsedTime)
+	print "    " + str(report['released']) + " items passed thru the channelPriority queue"
+
+def checkCancel(setupCount, nodeCount = 4):
+	interface, benchmarkNodes = openNetwork(nodeCount)
+	serialInterface = interface.interface
+	serialInterface.resetTransmitStatistics()
+	with core.transaction(release = False) as unit:
+		for count in xrange(setupCount):
+			for node in benchmarkNodes: node.pingCommand(count)
+	cancelled = unit.cancel()
+	time.sleep(0.2)
+	print "  unreleased transaction " + ("cancelled" if cancelled else "NOT CANCELLED") + ", " + str(serialInterface.transmitStatistics()['packets']) + " packets written"
+
+def makeAxis():
+	'''Returns an axis of 25 steps/mm: a 1.8 degree stepper on a leadscrew of 8 mm lead.'''
+	elements = machines.elements
+	return elements.elementChain.forward([elements.microstep.forward(1), elements.stepper.forward(1.8), elements.leadscrew.forward(8), elements.invert.forward(False)])
+
+def checkMoves(name, inTransaction, moveCount = 40):
+	interface, devicePort = openVirtual(1000000)
+	emulatedNodes = [rampRecorder([1, axis + 1]) for axis in range(2)]
+	emulators.emulatedNetwork(devicePort, emulatedNodes)
+	axisNodes = [addNode(interface, [1, axis + 1], stepperDriver.virtualNode) for axis in range(2)]
+	for node in axisNodes: node.interface = interfaces.interfaceShell(interface)	#as nodes are given their interface by a machine
+	move = functions.move(virtualNode = nodes.compoundNode(*axisNodes), axes = [makeAxis(), makeAxis()], kinematics = machines.kinematics.direct(2),
+						machinePosition = machines.state.coordinate(['mm', 'mm']))
+	stdout, sys.stdout = sys.stdout, quiet()
+	try:
+		startTime = time.time()
+		if inTransaction:
+			with core.transaction():
+				for index in xrange(moveCount): move([4.0*((index + 1) % 2), 2.0*((index + 1) % 2)], 400)
+		else:
+			for index in xrange(moveCount): move([4.0*((index + 1) % 2), 2.0*((index + 1) % 2)], 400)
+		while not all([len(node.ramps) >= moveCount and node.isIdle() for node in emulatedNodes]) and time.time() - startTime < 30: time.sleep(0.01)
+	finally:
+		sys.stdout = stdout
+	ramps = [ramp for node in emulatedNodes for ramp in node.ramps]
+	print "  " + name + ": " + str(len([ramp for ramp in ramps if ramp == (0, 0)])) + " of " + str(len(ramps)) + " spin requests reached the nodes without acceleration or deceleration"
+
+def checkInterfaces():
+	firstInterface, firstNodes = openNetwork(1)
+	secondInterface, secondNodes = openNetwork(1)
+	try:
+		with core.transaction():
+			firstNodes[0].pingCommand(0)
+			secondNodes[0].pingCommand(0)
+	except ValueError:
+		print "  transaction across two interfaces refused"
+	else:
+		print "  transaction across two interfaces NOT REFUSED"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: setupCount = int(sys.argv[1])
+	else: setupCount = 50
+	if len(sys.argv) > 2: moveCount = int(sys.argv[2])
+	else: moveCount = 500
+	print str(setupCount) + " setup commands to each of 4 nodes, then " + str(moveCount) + " moves, at 1000000 baud:"
+	runBenchmark('committed one at a time', sendAlone, setupCount, moveCount)
+	runBenchmark('in a transaction', sendTransaction, setupCount, moveCount)
+	checkCancel(setupCount)
+	print "back and forth moves to 2 stepper nodes:"
+	checkMoves('moved one at a time', False)
+	checkMoves('moved in a transaction', True)
+	checkInterfaces()
+	closeInterfaces()
@@ -0,0 +1,73 @@
+# gestalt benchmark: transmit coalescing
+#
+# Streams multi-axis moves thru a gestalt interface, the way a compoundNode move does: each move is an actionSet of one
+# spin packet per axis, followed by a multicast sync packet. The far side of a pseudo-terminal is read at the line rate
+# of the baud rate, so that the port backs up as a real serial line would.
+#
+# Each run is repeated with maxBurst = 1, which writes one packet at a time as the original transmitter did. The line
+# carries the same bytes either way, so the bytes/s written can't rise; the gain of coalescing is in the writes saved.
+#
+# usage: python transmit.py [moveCount] [axisCount]
+
+#----IMPORTS------------
+import os
+import sys
+import time
+import threading
+from gestalt import core
+from harness import openLoopback, addNode, closeInterfaces
+
+#----BENCHMARK------------
+class lineReader(threading.Thread):
+	'''Reads from the master side of the pseudo-terminal no faster than the line rate.'''
+	def __init__(self, masterFile, baudRate):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.masterFile = masterFile
+		self.byteTime = 10.0/baudRate
+		self.byteCount = 0
+
+	def run(self):
+		lineTime = time.time()
+		while True:
+			data = os.read(self.masterFile, 256)
+			self.byteCount += len(data)
+			lineTime = max(lineTime, time.time() - 0.001) + len(data)*self.byteTime
+			delay = lineTime - time.time()
+			if delay > 0: time.sleep(delay)
+
+
+def runBenchmark(baudRate, maxBurst, moveCount, axisCount):
+	interface, masterFile = openLoopback(baudRate, maxBurst = maxBurst)
+	axisNodes = [addNode(interface, [1, axis]) for axis in range(axisCount)]
+	reader = lineReader(masterFile, baudRate)
+	reader.start()
+
+	packetLength = 13 	#five header bytes, seven payload bytes, and a CRC
+	syncLength = 6
+	expectedBytes = moveCount*(axisCount*packetLength + syncLength)
+
+	interface.interface.resetTransmitStatistics()
+	startTime = time.time()
+	for move in range(moveCount):
+		moveSet = core.actionSet([node.spinRequest(100 + move%50) for node in axisNodes])
+		moveSet.commit()
+		moveSet.release()
+	while reader.byteCount < expectedBytes and time.time() - startTime < 30: time.sleep(0.001)
+	elapsedTime = time.time() - startTime
+
+	statistics = interface.interface.transmitStatistics()
+	print str(baudRate) + " baud, maxBurst " + str(maxBurst) + ":"
+	print "  " + str(statistics['packets']) + " packets in " + str(statistics['writes']) + " writes, " + str(round(statistics['packetsPerWrite'], 2)) + " packets/write"
+	print "  " + str(int(statistics['bytesPerSecond'])) + " bytes/s written, " + str(round(moveCount/elapsedTime, 1)) + " moves/s delivered"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: moveCount = int(sys.argv[1])
+	else: moveCount = 500
+	if len(sys.argv) > 2: axisCount = int(sys.argv[2])
+	else: axisCount = 4
+	for baudRate in [115200, 1000000]:
+		for maxBurst in [32, 1]:
+			runBenchmark(baudRate, maxBurst, moveCount, axisCount)
+	closeInterfaces()
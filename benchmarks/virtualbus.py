@@ -0,0 +1,60 @@
+# gestalt benchmark: virtual serial bus
+#
+# Streams requests which wait on a response from their node over a virtual serial line, under a range of line
+# conditions: a clean line at two baud rates, added latency and jitter, corrupted bytes, and lost writes. Requests are
+# retransmitted with the adaptive timeout of actionObject.transmitPersistent. No hardware or pseudo-terminal is needed.
+#
+# usage: python virtualbus.py [requestCount]
+
+#----IMPORTS------------
+import sys
+import time
+import threading
+from harness import openVirtual, addNode, responder, milliseconds, closeInterfaces
+
+#----BENCHMARK------------
+conditions = [('clean, 115200 baud', 115200, {}),
+			('clean, 1000000 baud', 1000000, {}),
+			('2 ms latency, 1 ms jitter', 115200, {'latency':0.002, 'jitter':0.001}),
+			('1 in 1000 bytes corrupted', 115200, {'corruptionRate':0.001}),
+			('2% of writes lost', 115200, {'lossRate':0.02})]
+
+class requestCounter(object):
+	def __init__(self):
+		self.answeredCount = 0
+		self.failedCount = 0
+		self.finished = threading.Event()
+	
+	def __call__(self, actionObject):
+		if actionObject.responded: self.answeredCount += 1
+		else: self.failedCount += 1
+		self.finished.set()
+
+
+def runBenchmark(name, baudRate, faults, requestCount):
+	interface, devicePort = openVirtual(baudRate, seed = 0, **faults)
+	responder(interface, devicePort, serviceTime = 0.0005)
+	node = addNode(interface, [1, 1])
+	counter = requestCounter()
+	
+	startTime = time.time()
+	for count in range(requestCount):
+		counter.finished.clear()
+		node.queryRequest(count, counter, tries = 10, timeout = None)
+		counter.finished.wait(30)
+	elapsedTime = time.time() - startTime
+	
+	rtt = node.rttEstimator.report()
+	line = interface.interface.link.statistics()
+	print name + ":"
+	print "  " + str(counter.answeredCount) + " answered, " + str(counter.failedCount) + " failed, " + str(round(requestCount/elapsedTime, 1)) + " requests/s"
+	print "  round trip: median " + milliseconds(rtt['percentiles'][50]) + ", 99th percentile " + milliseconds(rtt['percentiles'][99]) + ", " + str(rtt['timeouts']) + " timeouts"
+	print "  line: " + str(sum([direction['lostWrites'] for direction in line.values()])) + " writes lost, " + str(sum([direction['corruptedBytes'] for direction in line.values()])) + " bytes corrupted"
+
+
+if __name__ == '__main__':
+	if len(sys.argv) > 1: requestCount = int(sys.argv[1])
+	else: requestCount = 500
+	for name, baudRate, faults in conditions:
+		runBenchmark(name, baudRate, faults, requestCount)
+	closeInterfaces()
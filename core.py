@@ -4,63 +4,243 @@
 
 #--IMPORTS-----
 import threading
+import time
 from functools import partial	#currying for forwarding function calls to actionObjects
 from gestalt.utilities import notice as notice
+from gestalt.utilities import activity
+from gestalt.utilities import trace
+
+priorityClasses = ('urgent', 'interactive', 'motion')	#highest first. Each class is queued separately by the interface
+
+releasedFlag = 1	#the flags of an actionObject, set once each of these has happened
+accessFlag = 2
+initFlag = 4
+cancelledFlag = 8	#set by cancelGroup, after which the interface drops the actionObject rather than granting it access
+flagLock = threading.Lock()	#guards the setting of flags against the creation of an event for them to be waited on
+blankPacketSet = ([],)	#the packet set of an actionObject which hasn't set a packet. Shared, and never modified
+actionObjectPools = {}	#{actionObject class: [finished actionObjects]}, for the classes which are recyclable
+openTransactions = threading.local()	#the stack of transactions open on each thread
+slotNameCache = {}	#{actionObject subclass: names of the slots declared by it and its bases below actionObject}
+
+def subclassSlotNames(cls):
+	'''Returns the names of the slots declared by cls and its bases, other than those of actionObject, which __init__ sets.'''
+	names = slotNameCache.get(cls)
+	if names == None:
+		names = []
+		for klass in cls.__mro__[:cls.__mro__.index(actionObject)]:
+			slots = klass.__dict__.get('__slots__', ())
+			if isinstance(slots, str): slots = (slots,)
+			names.extend([name for name in slots if name not in ('__dict__', '__weakref__')])
+		names = slotNameCache[cls] = tuple(names)
+	return names
 
 class actionObject(object):
+	'''A request made by a serviceRoutine, which is executed on the network once granted access to the channel.
+	
+		Node drivers subclass actionObject, and may set any attributes of their own in init. The attributes common to
+		every actionObject, and those set on it by the interface, are kept in slots, and the events which wait on its
+		flags are only created if something waits on a flag before it has been set. A subclass which declares no
+		__slots__ of its own keeps its other attributes in a dictionary as usual; the requests made for every move,
+		such as spin and sync requests, list theirs in __slots__. Subclasses which set recyclable are reused once finished.'''
+	__slots__ = ('serviceRoutine', 'virtualNode', 'interface', 'port', 'packetSet', 'mode', 'mailbox', 'flags', 'events',
+				'commitTime', 'releaseTime', 'readyTime', 'blockedTime', 'transmitCallback', 'releaseCallback', 'writeCallback',
+				'traceStamps', 'synchronizes', 'transactionPriority')
+	_type_ = 'actionObject'	#used by the channelPriority queue
+	responseTag = None	#if set, only a response carrying this tag is matched to this actionObject
+	recyclable = False	#if True, finished actionObjects are pooled and reused. Only for those which nobody keeps once they've finished, such as syncRequests
+	poolSize = 64	#the most finished actionObjects of a recyclable class kept for reuse
+	idempotent = True	#False for requests which the node carries out again each time one arrives, like a move, whose retransmission is put off for longer
+	
 	def __init__(self, serviceRoutine):
 		self.serviceRoutine = serviceRoutine	#the service routine which created this actionObject.
 		self.virtualNode = serviceRoutine.virtualNode	#the virtual node which owns the service routine which created this actionObject
 		self.interface = self.virtualNode.interface	#reference to the interface for the virtual node
-		self.packetEncoder = self.serviceRoutine.packetSet
-		self.packetSet = [[]]	#initialize packet set to a blank packet for now.
+		self.port = serviceRoutine.port	#this is the port to be used in communicating with the matching service routine in hardware
+		if self.port == None: self.port = self.virtualNode.bindPort.outPorts[serviceRoutine]	#serviceRoutine wasn't instantiated by bindPort
+		self.packetSet = blankPacketSet	#initialize packet set to a blank packet for now.
 		self.mode = 'unicast'	#mode determines whether the packet is transmitted as unicast or multicast
-		self.port = self.virtualNode.bindPort.outPorts[self.serviceRoutine]	#this is the port to be used in communicating with the matching service routine in hardware
-		self.clearToRelease = threading.Event()	#when set, this flag indicates that the action object is cleared to gain channel access
-		self.channelAccessGranted = threading.Event() #when set, this flag indicates that the action object has been granted channel access
-		self._type_ = 'actionObject'	#used by the channelPriority queue
+		self.mailbox = None	#receives the response to the latest transmission
+		self.flags = 0	#releasedFlag, accessFlag, initFlag and cancelledFlag, once set
+		self.events = None	#{flag: threading.Event}, for flags which were waited on before they were set
+		self.clearInterfaceState()
+	
+	def clearInterfaceState(self):
+		'''Initializes the slots which are set on this actionObject by the interface as it passes thru the queues.'''
+		self.commitTime = 0	#timestamps are only recorded while activity is being measured
+		self.releaseTime = 0
+		self.readyTime = 0
+		self.blockedTime = 0.0	#seconds spent released but held up behind an earlier actionObject to the same node, set by the interface
+		self.transmitCallback = None	#called after the next transmission, used by the interface to pipeline channel access
+		self.releaseCallback = None	#called on release, used by the interface to notice when a queued actionObject becomes ready
+		self.writeCallback = None	#called with this actionObject and the time each of its transmissions is written to the port, used to time a stop
+		self.traceStamps = None	#{stage: time}, only recorded while tracing
+		self.synchronizes = None	#for a syncRequest, the moves it synchronizes, so that it is purged with them
+		self.transactionPriority = None	#the priority class of the transaction this actionObject was sent in, if any
+	
+	@property
+	def priority(self):
+		'''The priority class. Requests which must keep their place among the moves stay in 'motion'.
+		
+		Subclasses override this with a class attribute. Members of a transaction take its priority class, which is
+		kept in a slot so that a slotted subclass can take it too.'''
+		return self.transactionPriority or 'motion'
+	
+	@priority.setter
+	def priority(self, priority):
+		self.transactionPriority = priority
+	
+	@classmethod
+	def create(cls, serviceRoutine):
+		'''Returns a new actionObject of this class for serviceRoutine, reusing a finished one if any have been pooled.'''
+		if cls.recyclable:
+			try:
+				actionObject = actionObjectPools[cls].pop()
+			except (KeyError, IndexError):	#none pooled yet
+				pass
+			else:
+				actionObject.forget()	#forgets whatever was set by the last user
+				actionObject.__init__(serviceRoutine)
+				return actionObject
+		return cls(serviceRoutine)
+	
+	def forget(self):
+		'''Clears the attributes of this actionObject which __init__ doesn't set, before it is reused.'''
+		for name in subclassSlotNames(type(self)):
+			try:
+				delattr(self, name)
+			except AttributeError:	#never set
+				pass
+		if hasattr(self, '__dict__'): self.__dict__.clear()
+	
+	def finish(self):
+		'''Called by the interface once this actionObject has finished with the channel, and nothing in the interface refers to it.
+		
+		A recyclable actionObject is pooled, to be reused by create. While tracing nothing is pooled, as the write of its
+		packets may still be stamped on the actionObject after it has finished.'''
+		if self.recyclable and not trace.enabled:
+			pool = actionObjectPools.setdefault(type(self), [])
+			if len(pool) < self.poolSize: pool.append(self)
+	
+	def setFlag(self, flag, unless = 0):
+		'''Sets flag, unless any of the flags in unless have already been set. Returns True if flag was set.'''
+		with flagLock:
+			if self.flags & unless: return False
+			self.flags |= flag
+			event = self.events.get(flag) if self.events else None
+		if event: event.set()	#something was waiting on the flag
+		return True
+	
+	def waitForFlag(self, flag, timeout = None):
+		'''Blocks until flag has been set, or until timeout has elapsed. An event is only created if flag isn't yet set.'''
+		if self.flags & flag: return True
+		with flagLock:
+			if self.flags & flag: return True
+			if self.events == None: self.events = {}
+			event = self.events.get(flag)
+			if event == None: event = self.events[flag] = threading.Event()
+		return event.wait(timeout)
+	
+	@property
+	def packetEncoder(self):
+		return self.serviceRoutine.packetSet
 	
 	def _init(self, *args, **kwargs):
-		returnObject = self.init(*args, **kwargs) #run user provide initialization function
+		if trace.enabled: trace.stamp(self, 'create')
+		writeCallback = kwargs.pop('writeCallback', None)	#may be provided with the arguments of any request
+		if writeCallback: self.writeCallback = writeCallback
+		try:
+			returnObject = self.init(*args, **kwargs) #run user provide initialization function
+		finally:
+			self.setFlag(initFlag)	#releases the node's channel lane, if init transmitted
 		if returnObject != None: return returnObject	#return whatever is returned by the user
 		else: return self	#otherwise return self
 	
 	def new(self, *args, **kwargs):
 		'''Will create a new instance of self, duplicating references created on instantiation.'''
-		return self.__class__(self.serviceRoutine)._init(*args, **kwargs)	#this is the same as what's called by the serviceRoutine
+		return self.create(self.serviceRoutine)._init(*args, **kwargs)	#this is the same as what's called by the serviceRoutine
 	
 	def setPacket(self, packet, mode = 'unicast'):
-		self.packetSet = self.packetEncoder(packet)
+		self.packetSet = self.serviceRoutine.packetSet(packet)
 		self.mode = mode
 
 	def transmit(self):
 		'''Sends a packet over the interface to the matching physical node.
 		Note that this method will only be called within the interface channelAccess thread, which guarantees that the channel is avaliable.'''
-		if self.channelAccessGranted.is_set():
-			self.interface.transmit(virtualNode = self.virtualNode, port = self.port, packetSet = self.packetSet, mode = self.mode)
+		if self.flags & accessFlag:
+			self.openMailbox()	#opened before transmitting, so that a quick response can't be missed
+			if trace.enabled: trace.stamp(self, 'transmit')
+			self.interface.transmit(virtualNode = self.virtualNode, port = self.port, packetSet = self.packetSet, mode = self.mode, priority = self.priority,
+									written = self.written if self.writeCallback or trace.enabled else None)
+			if self.transmitCallback:
+				transmitCallback, self.transmitCallback = self.transmitCallback, None
+				transmitCallback(self)
 		else:
 			notice(self.virtualNode, 'tried to transmit without channel access!')
 
-	def transmitPersistent(self, tries = 10, timeout = 0.2):
-		'''Transmit a packet until a response is received.'''
+	def written(self, writeTime):
+		'''Called by the transmit thread with the time at which the last packet of a transmission was written to the port.'''
+		if trace.enabled: trace.written(self, writeTime)
+		if self.writeCallback: self.writeCallback(self, writeTime)
+
+	def transmitPersistent(self, tries = 10, timeout = None):
+		'''Transmit a packet until a response is received.
+		
+		Unless a fixed timeout is provided, the time waited on each response is set by the round trip times measured for the
+		node and its interface, and doubles with each retry. A request which isn't idempotent waits at least the cautious
+		timeout of the estimator, as a response which is only late would otherwise have the node carry it out twice.'''
+		nodeEstimator = getattr(self.virtualNode, 'rttEstimator', None) if timeout == None else None
+		interfaceEstimator = getattr(self.interface, 'rttEstimator', None)
 		for i in range(tries):
+			if nodeEstimator: responseTimeout = nodeEstimator.timeout(interfaceEstimator, self.idempotent)
+			elif timeout == None: responseTimeout = 0.2	#node doesn't measure round trip times
+			else: responseTimeout = timeout
+			transmitTime = time.time()
 			self.transmit()
-			if self.waitForResponse(timeout): return True
+			if self.waitForResponse(responseTimeout):
+				if nodeEstimator and i == 0:	#a response to a retransmitted packet can't be timed, as it may answer any of the transmissions
+					roundTripTime = time.time() - transmitTime
+					nodeEstimator.observe(roundTripTime)
+					if interfaceEstimator: interfaceEstimator.observe(roundTripTime)
+				return True
+			if nodeEstimator: nodeEstimator.timedOut()
 			notice(self.virtualNode, 'Could not reach virtual node. Retrying (#' + str(i+2) + ')')	#i starts at 0, and when this gets called already tried once.
 		return False
 
+	def openMailbox(self):
+		'''Opens a new mailbox for the response to this actionObject, unless one is already waiting on a response.
+		
+		Retransmissions share the mailbox of the original transmission.'''
+		if self.mailbox == None or self.mailbox.isFull():
+			self.mailbox = mailbox(self.responseTag)
+			self.serviceRoutine.mailboxes.register(self.mailbox)
+	
+	def closeMailbox(self):
+		'''Stops waiting on a response. Called by the interface once this actionObject has finished with the channel.'''
+		if self.mailbox != None:
+			self.serviceRoutine.mailboxes.unregister(self.mailbox)
+			if trace.enabled and self.mailbox.arrivalTime: trace.stamp(self, 'response', self.mailbox.arrivalTime)
+	
 	def waitForResponse(self, timeout = None):
-		if self.serviceRoutine.responseFlag.wait(timeout):
+		if self.mailbox != None:
+			return self.mailbox.wait(timeout)
+		if self.serviceRoutine.responseFlag.wait(timeout):	#nothing was transmitted by this actionObject
 			self.serviceRoutine.responseFlag.clear()	#clears response flag in case it wasn't cleared by the response service routine
 			return True	#response was received
 		return False #response wasn't received
 	
 	def release(self):
-		self.clearToRelease.set()
+		if activity.enabled: self.releaseTime = time.time()
+		if trace.enabled: trace.stamp(self, 'release')
+		self.setFlag(releasedFlag)
+		if self.releaseCallback: self.releaseCallback()
 		return True
 	
 	def isReleased(self):
-		return self.clearToRelease.is_set()
+		return bool(self.flags & releasedFlag)
+	
+	def waitForRelease(self, timeout = None):
+		'''Blocks until this actionObject has been released, or until timeout has elapsed.'''
+		return self.waitForFlag(releasedFlag, timeout)
 	
 	def init(self):
 		'''This method gets called when the action object is instantiated.
@@ -68,32 +248,50 @@ class actionObject(object):
 		It should be overridden by the user.'''
 		pass
 	
+	def waitForInit(self, timeout = None):
+		'''Blocks until the user init function has returned, or until timeout has elapsed.'''
+		return self.waitForFlag(initFlag, timeout)
+	
 	def waitForChannelAccess(self, timeout = None):
 		'''Can be called by the user init function if it needs to return a response.'''
-		if self.channelAccessGranted.wait(timeout):
+		if not self.flags & accessFlag and holdsTransaction(self): flushTransactions()	#would otherwise wait on itself
+		if self.waitForFlag(accessFlag, timeout):
 			return True #access has been granted
 		return False #access was not received in time.
 	
 	def grantAccess(self):
-		'''This method gets called by the interface when this actionObject has been granted access to the channel.'''
-		self.channelAccessGranted.set()	#sets the channel access flag
+		'''This method gets called by the interface when this actionObject has been granted access to the channel.
+		
+		Returns False, without calling channelAccess, if this actionObject was cancelled before it could be granted access.'''
+		if not self.setFlag(accessFlag, unless = cancelledFlag): return False	#sets the channel access flag
+		if trace.enabled: trace.stamp(self, 'grant')
 		self.channelAccess() #calls the user function. This is most useful for when the node call doesn't return anything.
+		return True
 	
 	def channelAccess(self):
 		'''The user method that gets called when the actionObject has been granted access to the channel.'''
 		pass
 	
 	def commit(self):
-		'''Commits this actionObject to its interface's priority queue'''
-		self.interface.commit(self)
+		'''Commits this actionObject to its interface's priority queue, or to the transaction open on this thread.'''
+		transaction = openTransaction()
+		if transaction: transaction.gather(self)
+		else: self.interface.commit(self)
 		
 	def commitAndRelease(self):
 		'''Commits this actionObject to its interface's priority queue and releases for channel access.'''
 		self.release()
-		self.interface.commit(self)
+		self.commit()
+	
+	def cancel(self):
+		'''Withdraws this actionObject from its interface's priority queue, unless it has already been passed on for channel access.
+		
+		Returns True if it was withdrawn.'''
+		return self.interface.cancel(self)
 		
 	def getPacket(self):
-		'''Returns a packet waiting in the packet holder.'''
+		'''Returns the response to this actionObject, or if nothing was transmitted the packet waiting in the packet holder.'''
+		if self.mailbox != None: return self.mailbox.get()
 		return self.serviceRoutine.packetHolder.get()
 	
 	def __actionSequence__(self, *argLists):
@@ -101,6 +299,79 @@ class actionObject(object):
 		return actionSequence(actionObjects = [self.new(*args) for args in zip(*argLists)], parent = self)
 	
 
+class commandObject(actionObject):
+	'''A command which is transmitted once when granted access to the channel, without waiting on a response.
+	
+		For commands which the node never answers, such as multicast syncs, resets and broadcast setup. The user init
+		function only sets the packet. Once it returns, the command is committed and released, and the call returns
+		at once. A command created with external = True, or of a class which sets external, isn't sent, so that it can
+		be committed by the interface or gathered into a commandBatch.'''
+	__slots__ = ()
+	external = False	#if True, commands aren't sent once initialized
+	settleTime = 0	#seconds the node needs after the command before it can take another, during which its lane is held
+	
+	def _init(self, *args, **kwargs):
+		external = kwargs.pop('external', self.external)
+		returnObject = actionObject._init(self, *args, **kwargs)
+		if not external: self.send()
+		return returnObject
+	
+	def send(self):
+		'''Commits and releases this command, without waiting for it to be transmitted.'''
+		self.commitAndRelease()
+	
+	def channelAccess(self):
+		'''Transmits the command, and then holds the channel while the node settles.'''
+		self.transmit()
+		if self.settleTime: time.sleep(self.settleTime)
+	
+	def transmit(self):
+		'''Sends the packet of this command over the interface, without opening a mailbox for a response.'''
+		if trace.enabled: trace.stamp(self, 'transmit')
+		self.interface.transmit(virtualNode = self.virtualNode, port = self.port, packetSet = self.packetSet, mode = self.mode, priority = self.priority,
+								written = self.written if self.writeCallback or trace.enabled else None)
+		if self.transmitCallback:
+			transmitCallback, self.transmitCallback = self.transmitCallback, None
+			transmitCallback(self)
+
+
+class commandBatch(actionObject):
+	'''Sends a list of commands, to any nodes on one interface, in a single queue operation.
+	
+		The batch is committed and granted access to the channel as one multicast actionObject, once every request
+		committed ahead of it has finished. The packets of its commands are then handed to the serial port together,
+		in order, and are written in a single write. Commands should be created with external = True.'''
+	__slots__ = ('commands',)
+	
+	def __init__(self, commands):
+		self.commands = commands
+		self.serviceRoutine = None
+		self.virtualNode = None
+		self.interface = commands[0].interface
+		self.port = None
+		self.packetSet = blankPacketSet
+		self.mode = 'multicast'	#keeps its place among the requests to every node
+		self.mailbox = None
+		self.flags = initFlag
+		self.events = None
+		self.clearInterfaceState()
+	
+	def send(self):
+		'''Commits and releases this batch, without waiting for it to be transmitted.'''
+		self.commitAndRelease()
+	
+	def channelAccess(self):
+		self.transmit()
+		settleTime = max([command.settleTime for command in self.commands])
+		if settleTime: time.sleep(settleTime)
+	
+	def transmit(self):
+		self.interface.transmitBatch(self.commands, self.priority)
+		if self.transmitCallback:
+			transmitCallback, self.transmitCallback = self.transmitCallback, None
+			transmitCallback(self)
+
+
 class actionSequence(object):
 	'''Stores a series of action objects which should get executed sequentially.'''
 	def __init__(self, actionObjects = None, parent = None):
@@ -124,9 +395,19 @@ class actionSequence(object):
 	def release(self):
 		for actionObject in self.actionObjects:
 			actionObject.release()
+	
+	def cancel(self):
+		'''Withdraws every member actionObject which hasn't been passed on for channel access. Returns True if all were withdrawn.'''
+		return all([actionObject.cancel() for actionObject in self.actionObjects])
 
 class actionSet(object):
 	'''Stores a set of actionObjects which should be executed simultaneously.'''
+	commitTime = 0	#timestamps are only recorded while activity is being measured
+	releaseTime = 0
+	releaseCallback = None
+	priority = 'motion'
+	blockedTime = 0.0
+	
 	def __init__(self, actionObjects):
 		self.clearToRelease = threading.Event()	#when set, this flag indicates that the actionSet is cleared to gain channel access
 		#synchronize all action objects
@@ -136,19 +417,177 @@ class actionSet(object):
 		self.interface = actionObjects[0].interface
 		
 	def commit(self):
-		self.interface.commit(self)
+		transaction = openTransaction()
+		if transaction: transaction.gather(self)
+		else: self.interface.commit(self)
 	
 	def release(self):
+		if activity.enabled: self.releaseTime = time.time()
+		if trace.enabled: trace.stamp(self, 'release')
 		self.clearToRelease.set()
+		if self.releaseCallback: self.releaseCallback()
 		return True
 	
 	def isReleased(self):
 		return self.clearToRelease.is_set()
 	
+	def waitForRelease(self, timeout = None):
+		'''Blocks until this actionSet has been released, or until timeout has elapsed.'''
+		return self.clearToRelease.wait(timeout)
+	
+	def cancel(self):
+		'''Withdraws this actionSet, unless it has already been passed on for channel access. Returns True if withdrawn.'''
+		return self.interface.cancel(self)
+	
 	def __getattr__(self, attribute):
 		return partial(distributeFunctionCall, _attribute_ = attribute, _actionObjects_ = self.actionObjects)
 
 
+class transaction(object):
+	'''Gathers the requests committed on this thread while it is open, and commits them to their interface as one unit.
+	
+		Used as a context. actionObjects, actionSets and commands committed inside the with block are held by the
+		transaction rather than being queued one at a time. When the block exits, the transaction is committed, and
+		released unless release is False, in which case it is later released or cancelled as a whole. If the block
+		raises, nothing it gathered is committed. Its members keep their order, and take the priority class of the
+		transaction, which by default is the lowest among them, so that none goes ahead of a request committed before it.
+		
+		Members are still released on their own, so a transaction isn't passed on for channel access until it and every
+		one of its members have been released. Moves made inside the block wait for the motion planner to release them.
+		All the members must be for nodes on the same interface.
+		
+		A request which waits on channel access from its init function can't be held until the block exits, so
+		whatever has been gathered up to it, itself included, is committed and released first.'''
+	_type_ = 'transaction'
+	commitTime = 0	#timestamps are only recorded while activity is being measured
+	releaseTime = 0
+	releaseCallback = None
+	blockedTime = 0.0
+	
+	def __init__(self, release = True, priority = None):
+		self.autoRelease = release
+		self.priority = priority
+		self.actionObjects = []	#the gathered requests, in the order they were committed
+		self.gathered = set()
+		self.enclosing = None	#the transaction which was open when this one was entered, which gathers this one
+		self.interface = None
+		self.committed = False
+		self.clearToRelease = threading.Event()
+		self.unreleased = []	#members which hadn't been released when last checked
+	
+	def __enter__(self):
+		stack = getattr(openTransactions, 'stack', [])
+		self.enclosing = stack[-1] if stack else None
+		openTransactions.stack = stack + [self]
+		return self
+	
+	def __exit__(self, exceptionType, exceptionValue, traceback):
+		openTransactions.stack = openTransactions.stack[:-1]
+		if exceptionType != None:
+			self.actionObjects, self.gathered = [], set()	#cancelled
+			return False
+		self.commit()
+		if self.autoRelease: self.release()
+		return False
+	
+	def gather(self, actionObject):
+		self.actionObjects.append(actionObject)
+		self.gathered.add(actionObject)
+	
+	def holds(self, actionObject):
+		return actionObject in self.gathered
+	
+	def commit(self):
+		'''Commits the gathered requests as one unit, to their interface or to the enclosing transaction.'''
+		if self.committed or not self.actionObjects: return False
+		interfaces = set([getattr(actionObject.interface, 'Interface', actionObject.interface) for actionObject in self.actionObjects])	#past any interface shells
+		if len(interfaces) > 1: raise ValueError("a transaction can't be committed to more than one interface")
+		if self.priority == None:
+			self.priority = max([actionObject.priority for actionObject in self.actionObjects], key = priorityRank)
+		self.interface = self.actionObjects[0].interface
+		for actionObject in self.actionObjects: actionObject.releaseCallback = self.memberReleased
+		self.unreleased = list(self.actionObjects)
+		self.committed = True
+		if self.enclosing: self.enclosing.gather(self)
+		else: self.interface.commit(self)
+		return True
+	
+	def flush(self):
+		'''Commits and releases what has been gathered so far as a unit of its own, and carries on gathering.'''
+		if not self.actionObjects: return
+		unit = transaction(priority = self.priority)
+		unit.actionObjects, unit.gathered = self.actionObjects, self.gathered
+		self.actionObjects, self.gathered = [], set()
+		unit.enclosing = self.enclosing
+		unit.commit()
+		unit.release()
+	
+	def release(self):
+		if activity.enabled: self.releaseTime = time.time()
+		if trace.enabled: trace.stamp(self, 'release')
+		self.clearToRelease.set()
+		if self.releaseCallback: self.releaseCallback()
+		return True
+	
+	def memberReleased(self):
+		if self.releaseCallback: self.releaseCallback()
+	
+	def isReleased(self):
+		'''Returns True once the transaction and every one of its members have been released.'''
+		if not self.clearToRelease.is_set(): return False
+		self.unreleased = [actionObject for actionObject in self.unreleased if not actionObject.isReleased()]
+		return not self.unreleased
+	
+	def waitForRelease(self, timeout = None):
+		'''Blocks until this transaction itself has been released, or until timeout has elapsed.'''
+		return self.clearToRelease.wait(timeout)
+	
+	def cancel(self):
+		'''Withdraws the whole transaction, unless it has already been passed on for channel access. Returns True if withdrawn.'''
+		if not self.committed:
+			self.actionObjects, self.gathered = [], set()
+			return True
+		if self.enclosing:
+			if self.enclosing.committed or not self.enclosing.holds(self): return False
+			self.enclosing.actionObjects.remove(self)
+			self.enclosing.gathered.discard(self)
+			return True
+		return self.interface.cancel(self)
+
+
+def openTransaction():
+	'''Returns the innermost transaction open on this thread, or None.'''
+	stack = getattr(openTransactions, 'stack', None)
+	if stack: return stack[-1]
+	return None
+
+def holdsTransaction(actionObject):
+	'''Returns True if actionObject has been gathered by a transaction which is open on this thread.'''
+	for openUnit in getattr(openTransactions, 'stack', []):
+		if openUnit.holds(actionObject): return True
+	return False
+
+def flushTransactions():
+	'''Commits and releases what the transactions open on this thread have gathered, innermost first.'''
+	for openUnit in reversed(getattr(openTransactions, 'stack', [])):
+		openUnit.flush()
+
+def cancelGroup(actionObjects):
+	'''Cancels actionObjects which have been passed on for channel access, so that the interface drops them rather than
+	granting them access. Either all are cancelled or, if any has already been granted access, none are.
+	
+	Returns True if they were cancelled. They should not be committed again.'''
+	with flagLock:	#which is held as each actionObject is granted access
+		if any([actionObject.flags & accessFlag for actionObject in actionObjects]): return False
+		for actionObject in actionObjects: actionObject.flags |= cancelledFlag
+	return True
+
+def priorityRank(priority):
+	'''Returns the rank of a priority class, higher for lower classes. Unknown classes rank with the lowest.'''
+	if priority in priorityClasses: return priorityClasses.index(priority)
+	return len(priorityClasses) - 1
+
+
 def distributeFunctionCall(*args, **kwargs):
 	'''Distributes a function call to _attribute_ amongst the provided actionObjects.
 	
@@ -219,4 +658,64 @@ class syncToken(object):
 		else:
 			return None
 			
-			
\ No newline at end of file
+			
+class mailbox(object):
+	'''Holds the response to a single outstanding request.
+	
+		An actionObject opens a mailbox when it first transmits, and the response which is matched to that transmission
+		is delivered to it by the inbound serviceRoutine. If tag is provided, only a response carrying the same tag is
+		delivered to this mailbox.'''
+	arrivalTime = 0	#time at which the response was delivered, only recorded while tracing
+	
+	def __init__(self, tag = None):
+		self.tag = tag
+		self.packet = {}	#empty packet
+		self.responseFlag = threading.Event()
+	
+	def put(self, packet):
+		if trace.enabled: self.arrivalTime = time.time()
+		self.packet = packet
+		self.responseFlag.set()
+	
+	def get(self):
+		return self.packet
+	
+	def isFull(self):
+		return self.responseFlag.is_set()
+	
+	def wait(self, timeout = None):
+		'''Blocks until a response has been delivered, or until timeout has elapsed.'''
+		return self.responseFlag.wait(timeout)
+
+class mailboxRegistry(object):
+	'''Matches the responses arriving on a port to the mailboxes of the requests which are waiting on them.
+	
+		One registry is shared by the outbound and inbound serviceRoutines of a port. A response is delivered to the oldest
+		open mailbox with a matching tag, or if the response is untagged to the oldest open mailbox. Because each port
+		has its own registry, a response can never be delivered to a request made on another port.'''
+	def __init__(self):
+		self.mailboxes = []	#open mailboxes, oldest first
+		self.lock = threading.Lock()
+	
+	def register(self, mailbox):
+		with self.lock:
+			self.mailboxes.append(mailbox)
+	
+	def unregister(self, mailbox):
+		with self.lock:
+			if mailbox in self.mailboxes: self.mailboxes.remove(mailbox)
+	
+	def deliver(self, packet, tag = None):
+		'''Delivers packet to the matching mailbox. Returns the mailbox, or None if no request was waiting on the packet.'''
+		with self.lock:
+			for index, mailbox in enumerate(self.mailboxes):
+				if tag == None or mailbox.tag == tag: break
+			else:
+				return None
+			del self.mailboxes[index]
+		mailbox.put(packet)
+		return mailbox
+	
+	def outstanding(self):
+		'''Returns the number of mailboxes which are waiting on a response.'''
+		return len(self.mailboxes)
@@ -0,0 +1,336 @@
+# gestalt.emulators
+#
+# Host-side emulators of gestalt node firmware. Emulated nodes sit on the far end of a virtualSerialInterface, and
+# answer the gestalt protocol as the physical nodes would, so that virtual machines can be run without hardware.
+
+#----IMPORTS------------
+import threading
+import time
+import Queue
+import collections
+from gestalt import interfaces
+from gestalt import packets
+
+#----NETWORK------------
+class emulatedNetwork(threading.Thread):
+	'''Connects emulated nodes to the device port of a virtualSerialInterface.
+
+	Packets arriving at the port are framed and checked as the receiver of a node would, and handed to each node that
+	should receive them: multicast packets to every node, and unicast packets to the node with a matching address.
+	Nodes which haven't been assigned an address answer a multicast setIPRequest one at a time, in the order they were
+	added, as if their identify buttons were pressed in that order.'''
+	def __init__(self, port, nodes = None):
+		'''port:	the devicePort of a virtualSerialInterface, or the virtualSerialInterface itself.
+			nodes:	a list of node emulators, which can also be added later with addNode.'''
+		threading.Thread.__init__(self)
+		self.daemon = True
+		if hasattr(port, 'devicePort'): port = port.devicePort
+		self.port = port
+		self.CRC = interfaces.CRC()
+		self.nodes = []
+		self.identifyQueue = []	#unaddressed nodes, in the order their buttons will be pressed
+		self.lock = threading.Lock()
+		for node in (nodes or []): self.addNode(node)
+		self.start()
+
+	def addNode(self, node):
+		'''Connects node to the network, and starts it.'''
+		with self.lock:
+			node.network = self
+			self.nodes.append(node)
+			if node.address == None: self.identifyQueue.append(node)
+		node.start()
+		return node
+
+	def run(self):
+		buffer = bytearray()
+		while True:
+			buffer += self.port.read(1024)	#blocks until bytes arrive
+			del buffer[:interfaces.framePackets(buffer, self.CRC, self.route)]
+
+	def route(self, packet):
+		'''Hands packet to every node which should receive it.'''
+		with self.lock: nodes = list(self.nodes)
+		if packet[0] == 138:	#multicast
+			for node in nodes: node.receive(packet)
+		else:
+			address = [packet[1], packet[2]]
+			for node in nodes:
+				if node.address == address: node.receive(packet)
+
+	def pressButton(self, node):
+		'''Returns True if node is the next node whose identify button is to be pressed.'''
+		with self.lock:
+			if self.identifyQueue and self.identifyQueue[0] is node:
+				self.identifyQueue.pop(0)
+				return True
+			return False
+
+	def transmit(self, packet):
+		'''Writes packet onto the line back to the interface, after appending its CRC.'''
+		with self.lock:
+			self.port.write(str(self.CRC(packet)))
+
+#----NODES------------
+class baseNodeEmulator(threading.Thread):
+	'''Emulates the firmware common to all gestalt nodes, following gsArduino/gestalt.cpp.
+
+	This includes the status, URL, identify, set IP address, and reset ports, and a bootloader with its own page memory.
+	Each packet is serviced in turn by the node's own thread, responseTime seconds after servicing starts.'''
+	url = 'http://www.fabunit.com/vn/086-005a.py'
+
+	def __init__(self, address = None, url = None, responseTime = 0.0, flashSize = 32768):
+		'''address:		the network address of the node, or None if the node has yet to be identified.
+			url:			returned by the URL and set IP address ports.
+			responseTime:	seconds the node takes to service each packet.'''
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.address = list(address) if address else None
+		if url: self.url = url
+		self.responseTime = responseTime
+		self.network = None	#set by emulatedNetwork.addNode
+		self.receiveQueue = Queue.Queue()
+		self.ports = {}	#{port number: service routine}
+		self.multicast = False	#True while servicing a multicast packet
+		self.packetCounts = {}	#{port number: packets received}
+
+		#bootloader
+		self.bootPageSize = 128
+		self.flash = bytearray([255]*flashSize)	#erased program memory
+		self.inBootloader = False
+		self.pageAddress = 0
+		self.appValidity = 170	#magic number for a valid application
+
+		self._initPackets()
+		self.initPackets()
+		self._initPorts()
+		self.initPorts()
+
+	def _initPackets(self):
+		self.statusResponsePacket = packets.packet(template = [packets.pString('status', 1),
+																packets.pInteger('appValidity', 1)])
+		self.bootCommandResponsePacket = packets.packet(template = [packets.pInteger('responseCode', 1),
+																	packets.pInteger('pageNumber', 2)])
+
+	def initPackets(self):
+		return
+
+	def _initPorts(self):
+		self.bindPort(1, self.svcStatus)
+		self.bindPort(2, self.svcBootloaderCommand)
+		self.bindPort(3, self.svcBootloaderData)
+		self.bindPort(4, self.svcBootloaderReadPage)
+		self.bindPort(5, self.svcRequestURL)
+		self.bindPort(6, self.svcSetIPAddress)
+		self.bindPort(7, self.svcIdentifyNode)
+		self.bindPort(255, self.svcResetNode)
+
+	def initPorts(self):
+		return
+
+	def bindPort(self, port, serviceRoutine):
+		self.ports[port] = serviceRoutine
+
+	def receive(self, packet):
+		'''Called by the network with each packet addressed to this node.'''
+		self.receiveQueue.put(packet)
+
+	def run(self):
+		while True:
+			packet = self.receiveQueue.get()
+			if self.responseTime: time.sleep(self.responseTime)
+			port = packet[3]
+			self.packetCounts[port] = self.packetCounts.get(port, 0) + 1
+			self.multicast = (packet[0] == 138)
+			if port in self.ports: self.ports[port](packet[5:])
+
+	def transmit(self, port, payload = None, multicast = False):
+		'''Transmits payload to the interface from port.'''
+		if payload == None: payload = []
+		address = self.address if self.address else [0, 0]
+		packet = bytearray([138 if multicast else 72, address[0], address[1], port, 5 + len(payload)])
+		packet += bytearray(payload)
+		self.network.transmit(packet)
+
+	#--SERVICE ROUTINES--
+	def svcStatus(self, payload):
+		self.transmit(1, self.statusResponsePacket({'status':'B' if self.inBootloader else 'A', 'appValidity':self.appValidity}))
+
+	def svcRequestURL(self, payload):
+		self.transmit(5, bytearray(self.url))
+
+	def svcSetIPAddress(self, payload):
+		if self.multicast and not self.network.pressButton(self): return	#another node is being identified
+		self.address = [payload[0], payload[1]]
+		self.transmit(6, bytearray(self.url), multicast = True)
+
+	def svcIdentifyNode(self, payload):
+		return	#the LED isn't emulated
+
+	def svcResetNode(self, payload):
+		self.inBootloader = True	#the bootloader runs on reset
+		self.reset()
+
+	def reset(self):
+		'''Clears the state of the application. Called when the node is reset.'''
+		return
+
+	def svcBootloaderCommand(self, payload):
+		if not self.inBootloader: return
+		if payload[0] == 0:	#start bootloader
+			self.transmit(2, self.bootCommandResponsePacket({'responseCode':5, 'pageNumber':0}))
+			self.pageAddress = 0
+			self.appValidity = 0	#application is invalid until it has been rewritten
+		elif payload[0] == 1:	#start application
+			self.transmit(2, self.bootCommandResponsePacket({'responseCode':9, 'pageNumber':0}))
+			self.inBootloader = False
+			self.appValidity = 170
+
+	def svcBootloaderData(self, payload):
+		if not self.inBootloader: return
+		pageData = payload[3:3 + self.bootPageSize]
+		self.flash[self.pageAddress:self.pageAddress + len(pageData)] = pageData
+		self.transmit(3, self.bootCommandResponsePacket({'responseCode':1, 'pageNumber':self.pageAddress}))
+		self.pageAddress += self.bootPageSize
+
+	def svcBootloaderReadPage(self, payload):
+		if not self.inBootloader: return
+		readAddress = payload[0] + (payload[1] << 8)
+		self.transmit(4, self.flash[readAddress:readAddress + self.bootPageSize])
+
+
+class stepperNodeEmulator(baseNodeEmulator):
+	'''Emulates the firmware of the 086-005a single axis stepper node.
+
+	Spin requests are queued in a move buffer of bufferSize moves, which is answered with a statusCode of 0 when full.
+	Moves flagged for sync wait in the buffer until a sync packet arrives. The buffer drains in emulated time at a
+	constant stepRate, which runs timeScale times faster than real time. Acceleration isn't emulated.'''
+	def __init__(self, address = None, bufferSize = 32, stepRate = 2000.0, timeScale = 1.0, referenceVoltage = 0.8, **kwargs):
+		'''bufferSize:			number of moves held by the move buffer.
+			stepRate:			steps per second of emulated time.
+			timeScale:			emulated seconds per real second.
+			referenceVoltage:	returned by the reference voltage port, and sets the motor current.'''
+		self.bufferSize = bufferSize
+		self.stepRate = float(stepRate)
+		self.timeScale = timeScale
+		self.referenceVoltage = referenceVoltage
+		self.lock = threading.Lock()
+		self.startTime = time.time()
+		self.reset()
+		baseNodeEmulator.__init__(self, address, **kwargs)
+
+	def reset(self):
+		self.moveBuffer = collections.deque()	#[{'steps', 'majorSteps', 'direction', 'readyTime', 'startTime'}]
+		self.moveCount = 0	#moves accepted into the buffer
+		self.finishedCount = 0	#moves completed
+		self.rejectedCount = 0	#spin requests answered with a full buffer
+		self.lastFinishTime = 0.0
+		self.position = 0	#steps taken by completed moves
+		self.enabled = False
+		self.velocity = 0
+
+	def initPackets(self):
+		self.spinRequestPacket = packets.packet(template = [packets.pInteger('majorSteps',1),
+															packets.pInteger('directions',1),
+															packets.pInteger('steps', 1),
+															packets.pInteger('accel',1),
+															packets.pInteger('accelSteps',1),
+															packets.pInteger('decelSteps',1),
+															packets.pInteger('sync', 1)])
+		self.spinStatusPacket = packets.packet(template = [packets.pInteger('statusCode',1),
+															packets.pInteger('currentKey',1),
+															packets.pInteger('stepsRemaining',1),
+															packets.pInteger('readPosition',1),
+															packets.pInteger('writePosition',1)])
+		self.referenceVoltagePacket = packets.packet(template = [packets.pInteger('voltage',2)])
+		self.velocityPacket = packets.packet(template = [packets.pInteger('velocity',2)])
+
+	def initPorts(self):
+		self.bindPort(20, self.svcGetReferenceVoltage)
+		self.bindPort(21, self.svcEnable)
+		self.bindPort(22, self.svcDisable)
+		self.bindPort(23, self.svcSpin)
+		self.bindPort(24, self.svcSetVelocity)
+		self.bindPort(26, self.svcSpinStatus)
+		self.bindPort(30, self.svcSync)
+
+	#--MOVE BUFFER--
+	def clock(self):
+		'''Returns the emulated time, in seconds.'''
+		return (time.time() - self.startTime)*self.timeScale
+
+	def advance(self):
+		'''Retires every move which has finished by the current emulated time.'''
+		now = self.clock()
+		while self.moveBuffer:
+			move = self.moveBuffer[0]
+			if move['readyTime'] == None: break	#waiting for sync
+			move['startTime'] = max(move['readyTime'], self.lastFinishTime)
+			finishTime = move['startTime'] + move['majorSteps']/self.stepRate
+			if finishTime > now: break
+			self.position += move['steps'] if move['direction'] else -move['steps']
+			self.lastFinishTime = finishTime
+			self.finishedCount += 1
+			self.moveBuffer.popleft()
+
+	def stepsRemaining(self):
+		'''Returns the major steps remaining in the current move.'''
+		if not self.moveBuffer: return 0
+		move = self.moveBuffer[0]
+		if move['startTime'] == None: return move['majorSteps']
+		elapsedSteps = int((self.clock() - move['startTime'])*self.stepRate)
+		return min(max(move['majorSteps'] - elapsedSteps, 0), move['majorSteps'])
+
+	def isIdle(self):
+		'''Returns True once every accepted move has completed.'''
+		with self.lock:
+			self.advance()
+			return not self.moveBuffer
+
+	def spinStatus(self, statusCode):
+		return self.spinStatusPacket({'statusCode':statusCode, 'currentKey':self.moveCount % 256, 'stepsRemaining':self.stepsRemaining(),
+									'readPosition':self.finishedCount % self.bufferSize, 'writePosition':self.moveCount % self.bufferSize})
+
+	#--SERVICE ROUTINES--
+	def svcGetReferenceVoltage(self, payload):
+		self.transmit(20, self.referenceVoltagePacket({'voltage':int(self.referenceVoltage*1024/5.0)}))	#10 bit ADC, 5V reference
+
+	def svcEnable(self, payload):
+		self.enabled = True
+		self.transmit(21)
+
+	def svcDisable(self, payload):
+		self.enabled = False
+		self.transmit(22)
+
+	def svcSetVelocity(self, payload):
+		self.velocity = self.velocityPacket.decode(payload)['velocity']
+		self.transmit(24)
+
+	def svcSpin(self, payload):
+		spin = self.spinRequestPacket.decode(payload)
+		with self.lock:
+			self.advance()
+			if len(self.moveBuffer) >= self.bufferSize:
+				self.rejectedCount += 1
+				statusCode = 0	#buffer is full, move was not queued
+			else:
+				self.moveBuffer.append({'steps':spin['steps'], 'majorSteps':spin['majorSteps'], 'direction':spin['directions'] & 1,
+										'readyTime':None if spin['sync'] else self.clock(), 'startTime':None})
+				self.moveCount += 1
+				statusCode = 1
+			status = self.spinStatus(statusCode)
+		self.transmit(23, status)
+
+	def svcSpinStatus(self, payload):
+		with self.lock:
+			self.advance()
+			status = self.spinStatus(1)
+		self.transmit(26, status)
+
+	def svcSync(self, payload):
+		'''Starts every move which is waiting for sync.'''
+		with self.lock:
+			now = self.clock()
+			for move in self.moveBuffer:
+				if move['readyTime'] == None: move['readyTime'] = now
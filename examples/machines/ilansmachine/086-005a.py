@@ -7,7 +7,7 @@ from gestalt import core
 import time
 import math
 
-class virtualNode(nodes.baseStandardGestaltNode):
+class virtualNode(nodes.baseBufferedStepperNode):
 	def init(self, **kwargs):
 		pass
 	
@@ -61,13 +61,13 @@ class virtualNode(nodes.baseStandardGestaltNode):
 		
 		#move
 		self.bindPort(port = 23, outboundFunction = self.spinRequest, outboundPacket = self.spinRequestPacket,
-								inboundPacket = self.spinStatusPacket)
+								inboundFunction = self.spinResponse, inboundPacket = self.spinStatusPacket)
 		
 		#set velocity
 		self.bindPort(port = 24, outboundFunction = self.setVelocityRequest, outboundPacket = self.setVelocityPacket)
 		
 		#spin status
-		self.bindPort(port = 26, outboundFunction = self.spinStatusRequest, inboundPacket = self.spinStatusPacket)
+		self.bindPort(port = 26, outboundFunction = self.spinStatusRequest, inboundFunction = self.spinStatusResponse, inboundPacket = self.spinStatusPacket)
 		
 		#sync
 		self.bindPort(port = 30, outboundFunction = self.syncRequest)
@@ -120,6 +120,7 @@ class virtualNode(nodes.baseStandardGestaltNode):
 	
 	class disableRequest(functions.serviceRoutine):
 		class actionObject(core.actionObject):
+			priority = 'urgent'	#a stop is sent ahead of any queued moves
 			def init(self):
 				self.setPacket({})
 				self.commitAndRelease()
@@ -133,6 +134,7 @@ class virtualNode(nodes.baseStandardGestaltNode):
 
 	class getReferenceVoltageRequest(functions.serviceRoutine):
 		class actionObject(core.actionObject):
+			priority = 'interactive'
 			def init(self):
 				self.setPacket({})
 				self.commitAndRelease()
@@ -142,6 +144,7 @@ class virtualNode(nodes.baseStandardGestaltNode):
 	
 	class spinStatusRequest(functions.serviceRoutine):
 		class actionObject(core.actionObject):
+			priority = 'interactive'	#a status query is answered during a stream of moves
 			def init(self):
 				self.setPacket({})
 				self.commitAndRelease()
@@ -168,6 +171,10 @@ class virtualNode(nodes.baseStandardGestaltNode):
 
 	class spinRequest(functions.serviceRoutine):
 		class actionObject(core.actionObject):
+			__slots__ = ('axesSteps', 'accelSteps', 'decelSteps', 'accelRate', 'external', 'sync', 'majorSteps', 'directionByte',
+						'actionSequence', 'sequenceMajorSteps')	#a spin request is made for every move
+			idempotent = False	#a spin request which is sent again after the node has taken it is run twice
+			
 			def init(self, axesSteps, accelSteps = 0, decelSteps = 0, accelRate = 0, external = False, sync = False, majorSteps = None):
 				# axesSteps: a list containing the number of steps which each axis of the node should take in synchrony.
 				# accelSteps: number of virtual major axis steps during which acceleration should occur.
@@ -220,15 +227,20 @@ class virtualNode(nodes.baseStandardGestaltNode):
 						self.waitForChannelAccess()
 						moveQueued = False
 						while not moveQueued:
+							self.waitForCredit()
 							if self.transmitPersistent():
 								responsePacket = self.getPacket()
 								moveQueued = bool(responsePacket['statusCode'])	#False if move was not queued
-								time.sleep(0.02)
 							else: 
+								self.virtualNode.spinCredits.cancel()
 								notice(self.virtualNode, "got no response to spin request")
 								return False
 						return responsePacket
 			
+			def waitForCredit(self):
+				'''Waits for a free slot in the node's move buffer, and spends it on this spin request.'''
+				self.virtualNode.waitForSpinCredit()
+			
 			def syncPush(self):
 				'''Stores this actionObject's sync tokens to the provided syncToken.'''
 				if self.sync:
@@ -256,12 +268,13 @@ class virtualNode(nodes.baseStandardGestaltNode):
 					#since this node was instantiated under external control, it did not auto-transmit.
 					moveQueued = False
 					while not moveQueued:
+						self.waitForCredit()
 						if self.transmitPersistent():
 							responsePacket = self.getPacket()
 							print responsePacket
 							moveQueued = bool(responsePacket['statusCode']) #False if move was not queued, meaning buffer is full
-							if not moveQueued: time.sleep(0.02)	#wait before retransmitting
 						else:
+							self.virtualNode.spinCredits.cancel()
 							notice(self.virtualNode, "got no response to spin request")
 
 
@@ -333,8 +346,9 @@ class virtualNode(nodes.baseStandardGestaltNode):
 				return int(round(accelRate * self.virtualNode.uStepsPerStep * self.virtualNode.timeBasePeriod * self.virtualNode.timeBasePeriod,0)) #uSteps/timePeriod^2
 
 	class syncRequest(functions.serviceRoutine):
-		class actionObject(core.actionObject):
+		class actionObject(core.commandObject):
+			__slots__ = ()
+			recyclable = True	#syncRequests are made and dropped by the interface
+			external = True	#committed by the interface, after the moves it synchronizes
 			def init(self):
 				self.mode = 'multicast'
-			def channelAccess(self):
-				self.transmit()
@@ -6,6 +6,7 @@
 from gestalt.machines import coordinates
 from gestalt import utilities
 from gestalt import core
+import os
 import time
 import Queue
 import threading
@@ -23,30 +24,41 @@ class serviceRoutine(object):
 		4) When a response arrives, it is routed by the virtual node to the response serviceRoutine.
 		5) Response service routine calls its receive method.
 		6) Receive method might update machine state, etc.
-		7) Receive method sets the responseFlag, signaling to the actionObject that a response has arrived.
+		7) The response is delivered to the mailbox of the actionObject which is waiting on it, signaling that a response has arrived.
 		8) actionObject reacts to message, either by returning something to the calling method, transmitting another packet, etc...
 		
-		Note that because only action object has access to the network at a time, it will block in the channelAccessQueue until a response is received.
+		Note that because only one action object per node has access to the network at a time, it will block that node's channel lane until a response is received.
+		Nodes with a pipelineDepth greater than one allow that many action objects to wait on responses at once. Responses are matched to
+		requests in the order they were transmitted, or by the tag returned by getResponseTag.
 		However because serviceRoutine is running in the interface receiver routing queue, it can asynchronously update the machine state.
 	'''
-	def __init__(self, virtualNode = None, packetSet = None, responseFlag = None, packetHolder = None):
+	port = None	#the port this serviceRoutine is bound to, recorded by nodes.baseGestaltNode.bindPort
+	
+	def __init__(self, virtualNode = None, packetSet = None, responseFlag = None, packetHolder = None, mailboxes = None):
 		'''Service routines are instantiated by nodes.baseGestaltNode.bindPort.'''
 		self.virtualNode = virtualNode	#reference to owning virtual node
 		self.packetSet = packetSet	#The packet encoder
 		self.packet = packetSet.Packet #a reference to the packet format for decoding purposes
 		self.responseFlag = responseFlag	#responseFlag is shared between serviceRoutine and actionObject
 		self.packetHolder = packetHolder	#will contain an inbound packet for transfer between the serviceRoutine and the actionObject
+		if mailboxes == None: mailboxes = core.mailboxRegistry()
+		self.mailboxes = mailboxes	#matches inbound packets to the actionObjects waiting on them, shared with the matching serviceRoutine
 	
 	def __call__(self, *args, **kwargs):
-		return self.actionObject(self)._init(*args, **kwargs)	#allows actionObject to return, actionCore is defined by the user
+		return self.actionObject.create(self)._init(*args, **kwargs)	#allows actionObject to return, actionCore is defined by the user
 	
 	def receiver(self, packet):
 		decodedPacket = self.packet.decode(packet)
 		self.packetHolder.put(decodedPacket)	#stores packet for use by calling outbound functions
 		self.receive(decodedPacket)
+		self.mailboxes.deliver(decodedPacket, self.getResponseTag(decodedPacket))	#after receive, so that state is updated before the request wakes
 		
 	def receive(self, packet):	#this should get overridden
 		self.responseFlag.set()  #by default, all it does is set the response flag.
+	
+	def getResponseTag(self, packet):	#can be overridden
+		'''Returns the tag used to match packet to a request, or None to match it to the oldest request waiting on this port.'''
+		return None
 		
 
 class jog(object):
@@ -62,6 +74,8 @@ class jog(object):
 		return self.move(jogPosition, velocity, acceleration)
 				
 class move(object):
+	plannerDebugFile = 'motionPlannerDebugFile.txt'	#the planner writes each segment it plans to this file, or to nowhere if None
+	
 	def __init__(self, virtualMachine = None, virtualNode = None, axes = None, kinematics = None, machinePosition = None, defaultAcceleration = coordinates.uFloat(2000, "steps/s^2"), pullInSpeed = 4000, planner = None):
 		'''Configures the move object.'''
 		
@@ -93,35 +107,87 @@ class move(object):
 	def __call__(self, *args, **kwargs):
 		return moveObject(self, *args, **kwargs)	#returns a move object which can be used by external synchronization methods
 	
+	def cancel(self, stop = 'decelerate', timeout = 10.0):
+		'''Stops the machine, withdrawing every move which hasn't yet been granted access to the channel.
+		
+			stop:	'decelerate' brings the machine to rest along its path, on the fewest of the withdrawn moves which can
+					stop it from the speed at which the last move sent to the nodes ends. These are replanned to decelerate
+					and sent again, behind only what the nodes have already been sent.
+					'disable' sends none of them again, and disables the motors with a request of the urgent class, which
+					is sent ahead of anything queued.
+			timeout:	seconds to wait for the stop to reach the bus.
+		
+		Returns a dictionary of the moves sent again to bring the machine to rest, the moves withdrawn for good, the items
+		taken out of the interface queues, and stopLatency, the seconds from the call until the last packet of the stop
+		was written to the port, or None if it wasn't within timeout. The future machine position is moved back to where
+		the machine will stop, although after a disable this is only where it was last sent.'''
+		startTime = time.time()
+		disable = (stop == 'disable')
+		planner = self.planner
+		with planner.plannerLock:
+			planner.holding = False
+			planner.cancelCount += 1
+			keptMoves, withdrawnMoves, purgedCount = planner.stop(keep = not disable)
+			withdrawnMoves += planner.drainInput()
+			if withdrawnMoves: self.machinePosition.future.set(withdrawnMoves[0].startMachinePosition)
+			for keptMove in keptMoves: keptMove.commitSpin()
+			stopTimer = stopWatch(startTime, [spinObject for keptMove in keptMoves[-1:] for spinObject in keptMove.spinObjects()])
+			for keptMove in keptMoves: planner.updateAndRelease(keptMove)
+		if disable:
+			stopTimer = stopWatch(startTime, expected = len(self.virtualNode.nodes))	#a compound node disables each of its nodes
+			self.virtualNode.disableRequest(writeCallback = stopTimer.observe)
+		return {'released':len(keptMoves), 'withdrawn':len(withdrawnMoves), 'purged':purgedCount, 'stopLatency':stopTimer.latency(timeout)}
+	
+	def hold(self):
+		'''Brings the machine to rest along its path, as cancel does, but keeps the moves after the stop to be resumed.
+		
+		Moves made while holding are withdrawn as they reach the planner, and aren't planned until resume is called.'''
+		with self.planner.plannerLock:
+			self.planner.hold()
+	
+	def resume(self):
+		'''Continues from a hold, replanning the held moves to start from rest. Returns once they have all been committed again.'''
+		self.planner.resume()
+	
 	class motionPlanner(threading.Thread):
+		stopStepRate = 200	#steps/sec at which a controlled stop ends, as the last move in a flushed planner does
+		
 		def __init__(self, move, queueSize = 50, queueTimeout = 0.1):
 			threading.Thread.__init__(self)
 			
 			self.move = move	#link to parent move function
-			self.idleTime = 0.0005	#seconds
-			self.queueTimeoutCycles = int(queueTimeout/self.idleTime)
+			self.queueTimeout = queueTimeout	#seconds without a new move, after which the planner queue is flushed
 			self.queueSize = queueSize
-			self.timeoutCount = 0	#when this equals queueTimeoutCycles, the queue is flushed
 			self.pullInAccelRate = math.pow(self.move.pullInSpeed,2)	#steps/sec in a period of time per step or 1/(steps/sec)
 			
 			self.plannerInput = Queue.Queue(1)	#only permit one input at a time.
 			self.plannerQueue = collections.deque()
+			self.plannerLock = threading.Lock()	#held while the planner queue is changed, so that a stop can be planned from another thread
+			self.holding = False	#while True, moves are withdrawn and kept in heldMoves rather than planned
+			self.heldMoves = collections.deque()	#moves withdrawn by a hold, oldest first, which resume commits again
+			self.resuming = False	#True while resume commits the held moves again
+			self.cancelCount = 0	#stops made by move.cancel, so that a move committed before the last of them can be recognized
+			self.resumeCount = 0	#resumes finished, so that a move committed while holding can be recognized
+			self.releasedMoves = releasedMoves()	#moves released which may not yet have been granted access to the channel
 			self.resetMachineState()
 			
-			self.debugFile = open('motionPlannerDebugFile.txt', 'w')
+			self.debugFile = open(self.move.plannerDebugFile or os.devnull, 'w')
 			
 		def run(self):
 			while True:
-				queueState, newMoveObject = self.getMoveObject()	#try to fetch a new move object
-				if queueState:
-					self.processMoves(newMoveObject)
-					self.timoutCount = 0
-				else:
-					self.timeoutCount += 1
-					if self.timeoutCount == self.queueTimeoutCycles:
+				#an empty planner has nothing to flush, and so can wait indefinitely for the next move
+				queueState, newMoveObject = self.getMoveObject(self.queueTimeout if self.plannerQueue else None)
+				with self.plannerLock:
+					if queueState:
+						if newMoveObject.cancelCount != self.cancelCount: newMoveObject.actionObjects.cancel()	#was committed before the last cancel, but only got in after it
+						else:
+							if newMoveObject.resumeCount != self.resumeCount and not self.holding:	#was committed while holding, and so may be ahead of the resumed moves
+								newMoveObject.actionObjects.cancel()
+								newMoveObject.commitSpin()
+							self.processMoves(newMoveObject)
+					elif not self.holding:	#timed out. Held moves are kept out of the planner queue until resume plans them
 						self.flushPlanner()
-						self.timeoutCount = 0
-				time.sleep(self.idleTime)
+				if utilities.activity.enabled: utilities.activity.wakeup('motionPlanner')
 
 		def addMove(self, newMoveObject):
 			'''Adds a new move to the motion planner queue.'''
@@ -129,6 +195,13 @@ class move(object):
 			return
 
 		def processMoves(self, newMoveObject):
+			'''Plans a new move, or while holding withdraws it until resume.'''
+			if self.holding:
+				newMoveObject.actionObjects.cancel()	#withdrawn until resume, as the moves held before it
+				self.heldMoves.append(newMoveObject)
+			else: self.planMove(newMoveObject)
+		
+		def planMove(self, newMoveObject):
 			'''Performs multi-block look-ahead algorithm.'''
 			if newMoveObject.majorSteps > 0:	#only accept moves with a positive length
 				self.plannerQueue.append(newMoveObject)	#add new object to the move queue
@@ -170,16 +243,17 @@ class move(object):
 			exitMoveObject.entryJunctionMaxStepRate = maximumJunctionVelocity
 			
 
-		def forwardPass(self):
-			thisSegment = self.plannerQueue[-1]
+		def forwardPass(self, segmentIndex = None):
+			if segmentIndex == None: segmentIndex = len(self.plannerQueue) - 1	#by default the newest segment
+			thisSegment = self.plannerQueue[segmentIndex]
 				
 			#choose the entry velocity for the segment.
 			#-> forwardPassExitStepRate: the exit velocity of the prior segment (as calculated by the forward pass)
 			#-> entryJunctionMaxStepRate: the max velocity at the junction, based solely on accelerations.
 			#-> segmentMaxStepRate:	the steady-state max speed of the segment, based on feedrate.
 			
-			if len(self.plannerQueue)>1:
-				priorSegment = self.plannerQueue[-2]
+			if segmentIndex > 0:
+				priorSegment = self.plannerQueue[segmentIndex - 1]
 				thisSegment.forwardPassEntryStepRate = min(priorSegment.forwardPassExitStepRate, thisSegment.entryJunctionMaxStepRate,
 															thisSegment.segmentMaxStepRate)
 			else:
@@ -292,10 +366,11 @@ class move(object):
 			self.debugCount += 1
 			
 			segment.update()
-			segment.release()
+			self.release(segment)
 		
 		def release(self, segment):
 			segment.release()
+			self.releasedMoves.add(segment)
 		
 		def flushPlanner(self):
 			if len(self.plannerQueue)>0:
@@ -306,17 +381,98 @@ class move(object):
 				#clear the queue
 				self.plannerQueue.clear()
 				self.debugFile.flush()
+		
+		def stop(self, keep = True):
+			'''Withdraws every move which hasn't been granted access to the channel, and plans a controlled stop on them.
+			
+			The moves are taken from the held moves, the planner queue, and the released moves which haven't been granted access. If
+			keep is True, the fewest moves at the front which cover the distance needed to decelerate from their entry
+			speed are kept, and replanned to end at stopStepRate. Returns the kept moves, which are to be committed again
+			and released, the moves behind them, and the number of items taken out of the interface queues. Called with
+			the planner lock held.'''
+			withdrawnMoves, purgedCount = self.releasedMoves.withdraw()
+			for moveObject in self.plannerQueue: moveObject.actionObjects.cancel()	#unreleased, and so still in the channelPriority queue
+			for moveObject in self.heldMoves: moveObject.actionObjects.cancel()	#already withdrawn, unless being committed again by resume
+			withdrawnMoves += list(self.plannerQueue) + list(self.heldMoves)
+			self.plannerQueue.clear()
+			self.heldMoves.clear()
+			keptMoves = []
+			if keep and withdrawnMoves:
+				firstSegment = withdrawnMoves[0]
+				stopLength = self.distanceFromVelocities(finalVelocity = min(firstSegment.forwardPassEntryStepRate, firstSegment.reversePassEntryStepRate),
+														initialVelocity = self.stopStepRate, acceleration = firstSegment.segmentAccelRate)
+				keptLength = 0
+				while withdrawnMoves and (not keptMoves or keptLength < stopLength):
+					keptMoves += [withdrawnMoves.pop(0)]
+					keptLength += keptMoves[-1].majorSteps
+				self.plannerQueue.extend(keptMoves)
+				keptMoves[-1].exitJunctionMaxStepRate = self.stopStepRate
+				self.reversePass()
+				self.plannerQueue.clear()
+				self.currentStepRate = keptMoves[-1].reversePassExitStepRate
+			else:
+				self.resetMachineState()
+			return keptMoves, withdrawnMoves, purgedCount
+		
+		def hold(self):
+			'''Releases the moves needed to come to rest, and keeps the moves behind them withdrawn until resume.
+			
+			The held moves are committed again only once resumed, so that they don't fill the channelPriority queue. Has
+			no effect while already holding, or resuming. Called with the planner lock held.'''
+			if self.holding: return
+			keptMoves, heldMoves, purgedCount = self.stop()
+			for keptMove in keptMoves: keptMove.commitSpin()	#in order, behind what has been granted access
+			for keptMove in keptMoves: self.updateAndRelease(keptMove)
+			self.heldMoves.extend(heldMoves)
+			self.holding = True
+		
+		def resume(self):
+			'''Commits the held moves again, oldest first, and plans them to start from rest, going back to planning moves once none are left.
+			
+			Each is committed without the planner lock, as it may wait for room in the channelPriority queue, and is then
+			planned as it would have been had it just arrived, so that no more than queueSize wait unreleased. Moves which
+			arrive meanwhile are held behind them. Called without the planner lock held.'''
+			with self.plannerLock:
+				if not self.holding or self.resuming: return
+				self.resuming = True
+				cancelCount = self.cancelCount
+			moveObject = None
+			while True:
+				with self.plannerLock:
+					if self.cancelCount != cancelCount:	#a cancel has withdrawn the held moves, this one among them
+						if moveObject: moveObject.actionObjects.cancel()
+						self.resuming = False
+						return
+					if moveObject: self.planMove(self.heldMoves.popleft())
+					if not self.heldMoves:
+						self.holding = False
+						self.resuming = False
+						self.resumeCount += 1
+						if self.plannerInput.empty(): self.flushPlanner()	#otherwise the planner thread flushes once moves stop arriving
+						return
+					moveObject = self.heldMoves[0]
+				moveObject.commitSpin()
+		
+		def drainInput(self):
+			'''Withdraws the moves waiting to enter the planner, and returns them.'''
+			drainedMoves = []
+			try:
+				while True:
+					drainedMoves += [self.plannerInput.get_nowait()]
+					drainedMoves[-1].actionObjects.cancel()
+			except Queue.Empty:
+				return drainedMoves
 	
 		def resetMachineState(self, velocity = 0.0, acceleration = 0.0):
 			self.currentStepRate = velocity
 			self.currentVelocity = 0
 			self.debugCount = 0
 		
-		def getMoveObject(self):
-			'''Will attempt to retrieve a new move object from the planner queue.'''
+		def getMoveObject(self, timeout = None):
+			'''Waits for up to timeout seconds to retrieve a new move object from the planner queue.'''
 			try: 
-				return True, self.plannerInput.get(block=False)
-			except:
+				return True, self.plannerInput.get(timeout = timeout)
+			except Queue.Empty:
 				return False, None
 			
 	class nullMotionPlanner(threading.Thread):	#performs no path planning, just releases objects as they arrive
@@ -324,29 +480,37 @@ class move(object):
 			threading.Thread.__init__(self)
 			
 			self.move = move	#link to parent move function
-			self.idleTime = 0.0005	#seconds
-			self.queueTimeoutCycles = int(queueTimeout/self.idleTime)
+			self.queueTimeout = queueTimeout	#seconds without a new move, after which the planner queue is flushed
 			self.queueSize = queueSize
-			self.timeoutCount = 0	#when this equals queueTimeoutCycles, the queue is flushed
 			
 			self.plannerInput = Queue.Queue(1)	#only permit one input at a time.
-			self.plannerQueue = collections.deque()
+			self.plannerQueue = collections.deque()	#moves aren't planned, and so this stays empty
+			self.plannerLock = threading.Lock()
+			self.holding = False
+			self.heldMoves = collections.deque()
+			self.resuming = False
+			self.cancelCount = 0
+			self.resumeCount = 0
+			self.releasedMoves = releasedMoves()
 			self.resetMachineState()
 			
-			self.debugFile = open('motionPlannerDebugFile.txt', 'w')
+			self.debugFile = open(self.move.plannerDebugFile or os.devnull, 'w')
 			
 		def run(self):
 			while True:
-				queueState, newMoveObject = self.getMoveObject()	#try to fetch a new move object
-				if queueState:
-					self.processMoves(newMoveObject)
-					self.timoutCount = 0
-				else:
-					self.timeoutCount += 1
-					if self.timeoutCount == self.queueTimeoutCycles:
+				#an empty planner has nothing to flush, and so can wait indefinitely for the next move
+				queueState, newMoveObject = self.getMoveObject(self.queueTimeout if self.plannerQueue else None)
+				with self.plannerLock:
+					if queueState:
+						if newMoveObject.cancelCount != self.cancelCount: newMoveObject.actionObjects.cancel()	#was committed before the last cancel, but only got in after it
+						else:
+							if newMoveObject.resumeCount != self.resumeCount and not self.holding:	#was committed while holding, and so may be ahead of the resumed moves
+								newMoveObject.actionObjects.cancel()
+								newMoveObject.commitSpin()
+							self.processMoves(newMoveObject)
+					elif not self.holding:	#timed out. Held moves are kept out of the planner queue until resume plans them
 						self.flushPlanner()
-						self.timeoutCount = 0
-				time.sleep(self.idleTime)
+				if utilities.activity.enabled: utilities.activity.wakeup('motionPlanner')
 
 		def addMove(self, newMoveObject):
 			'''Adds a new move to the motion planner queue.'''
@@ -354,10 +518,60 @@ class move(object):
 			return
 
 		def processMoves(self, newMoveObject):
-				self.release(newMoveObject)
+				if self.holding:
+					newMoveObject.actionObjects.cancel()
+					self.heldMoves.append(newMoveObject)
+				else: self.release(newMoveObject)
 		
 		def release(self, segment):
 			segment.release()
+			self.releasedMoves.add(segment)
+		
+		def stop(self, keep = True):
+			'''Withdraws every move which hasn't been granted access to the channel. Moves aren't planned, and so none are kept.'''
+			withdrawnMoves, purgedCount = self.releasedMoves.withdraw()
+			for moveObject in self.heldMoves: moveObject.actionObjects.cancel()	#already withdrawn, unless being committed again by resume
+			withdrawnMoves += list(self.heldMoves)
+			self.heldMoves.clear()
+			return [], withdrawnMoves, purgedCount
+		
+		def hold(self):
+			if self.holding: return
+			keptMoves, heldMoves, purgedCount = self.stop()
+			self.heldMoves.extend(heldMoves)
+			self.holding = True
+		
+		def resume(self):
+			'''Commits the held moves again, and releases them, one at a time and without the planner lock, as motionPlanner.resume does.'''
+			with self.plannerLock:
+				if not self.holding or self.resuming: return
+				self.resuming = True
+				cancelCount = self.cancelCount
+			moveObject = None
+			while True:
+				with self.plannerLock:
+					if self.cancelCount != cancelCount:
+						if moveObject: moveObject.actionObjects.cancel()
+						self.resuming = False
+						return
+					if moveObject: self.release(self.heldMoves.popleft())
+					if not self.heldMoves:
+						self.holding = False
+						self.resuming = False
+						self.resumeCount += 1
+						return
+					moveObject = self.heldMoves[0]
+				moveObject.commitSpin()
+		
+		def drainInput(self):
+			'''Withdraws the moves waiting to enter the planner, and returns them.'''
+			drainedMoves = []
+			try:
+				while True:
+					drainedMoves += [self.plannerInput.get_nowait()]
+					drainedMoves[-1].actionObjects.cancel()
+			except Queue.Empty:
+				return drainedMoves
 		
 		def flushPlanner(self):
 			if len(self.plannerQueue)>0:
@@ -374,11 +588,11 @@ class move(object):
 			self.currentVelocity = 0
 			self.debugCount = 0
 		
-		def getMoveObject(self):
-			'''Will attempt to retrieve a new move object from the planner queue.'''
+		def getMoveObject(self, timeout = None):
+			'''Waits for up to timeout seconds to retrieve a new move object from the planner queue.'''
 			try: 
-				return True, self.plannerInput.get(block=False)
-			except:
+				return True, self.plannerInput.get(timeout = timeout)
+			except Queue.Empty:
 				return False, None		
 
 class moveObject(object):
@@ -451,11 +665,7 @@ class moveObject(object):
 			self.segmentAccelRate = self.accelerationCommand	#motor inertia dominant, don't change.
 		
 		#create actionObjects and commit to the channel priority queue
-		self.actionObjects = self.move.virtualNode.spinRequest(axesSteps = tuple(self.actualMotorDeltas), accelSteps = 0, decelSteps = 0, accelRate = 0, external = True, majorSteps = self.majorSteps)	#note conversion to tuple.
-		self.actionObjects.commit()	#this will lock in their place in the transmit queue, however will not release until this move object is run thru the motion planner
-		
-		#commit self to the path planner.
-		self.commit()
+		self.commitSpin()
 		
 		#recalculate future machine position
 		newMotorPositions = [coordinates.uFloat(x+y, x.units) for (x,y) in zip(self.actualMotorDeltas, currentMotorPositions)]
@@ -465,8 +675,21 @@ class moveObject(object):
 			transformedNewAxisPositions += [self.move.axes[motorIndex].forward(motorPosition)]
 		
 		newMachinePosition = self.move.kinematics.forward(transformedNewAxisPositions)
-		self.move.machinePosition.future.set(newMachinePosition)
+		self.startMachinePosition = list(currentMachinePosition)	#where the machine is left if this move is withdrawn. Copied, as set changes it in place
+		self.move.machinePosition.future.set(newMachinePosition)	#before the move reaches the planner, so that a stop can move it back
 		
+		#commit self to the path planner.
+		self.commit()
+		
+	
+	def commitSpin(self):
+		'''Creates the spin requests of this move, and commits them to the channel priority queue.
+		
+		Also called to replace spin requests which have been withdrawn, behind whatever has been committed since.'''
+		self.resumeCount = self.move.planner.resumeCount	#read first, so that a move committed while holding is committed again if it reaches the planner after a resume
+		self.actionObjects = self.move.virtualNode.spinRequest(axesSteps = tuple(self.actualMotorDeltas), accelSteps = 0, decelSteps = 0, accelRate = 0, external = True, majorSteps = self.majorSteps)	#note conversion to tuple.
+		self.actionObjects.commit()	#this will lock in their place in the transmit queue, however will not release until this move object is run thru the motion planner
+		self.cancelCount = self.move.planner.cancelCount	#a move committed before a cancel is withdrawn if it reaches the planner after it
 	
 	def commit(self):
 		'''Adds this move to the motion planner.'''
@@ -479,6 +702,74 @@ class moveObject(object):
 	def release(self):
 		'''Releases all constituent spin objects to the real machine, making them no longer modifiable.'''
 		self.actionObjects.release()
+	
+	def spinObjects(self):
+		'''Returns the actionObjects which make up this move, taken out of any actionSet or actionSequence.'''
+		spinObjects = []
+		members = [self.actionObjects]
+		while members:
+			member = members.pop(0)
+			if member._type_ == 'actionObject': spinObjects += [member]
+			else: members += member.actionObjects
+		return spinObjects
+	
+	def isGranted(self):
+		'''Returns True once every constituent spin object has been granted access to the channel.'''
+		return all([spinObject.flags & core.accessFlag for spinObject in self.spinObjects()])
+
+
+class releasedMoves(object):
+	'''Keeps the moves released by a motion planner until they have been granted access to the channel.'''
+	def __init__(self):
+		self.moves = collections.deque()
+		self.lock = threading.Lock()
+	
+	def add(self, moveObject):
+		with self.lock:
+			while self.moves and self.moves[0].isGranted(): self.moves.popleft()
+			self.moves.append(moveObject)
+	
+	def withdraw(self):
+		'''Cancels the released moves, newest first, until one is found of which any part has been granted access.
+		
+		Returns the cancelled moves, oldest first, and the number of items taken out of the interface queues. Every
+		released move is then forgotten, as those left have been granted access.'''
+		withdrawnMoves = []
+		with self.lock:
+			while self.moves and core.cancelGroup(self.moves[-1].spinObjects()): withdrawnMoves.insert(0, self.moves.pop())
+			self.moves.clear()
+		if not withdrawnMoves: return withdrawnMoves, 0
+		interface = withdrawnMoves[0].actionObjects.interface
+		return withdrawnMoves, interface.purge([moveObject.actionObjects for moveObject in withdrawnMoves])
+
+
+class stopWatch(object):
+	'''Times a stop, from startTime until each of its actionObjects has written a packet to the port.
+	
+	The actionObjects may be provided, or may be created later with the observe method as their writeCallback, in which
+	case the number expected is provided instead.'''
+	def __init__(self, startTime, actionObjects = [], expected = None):
+		self.startTime = startTime
+		self.expected = len(actionObjects) if expected == None else expected
+		self.written = set()
+		self.writeTime = startTime	#a stop with nothing to write has already reached the bus
+		self.lock = threading.Lock()
+		self.finished = threading.Event()
+		for actionObject in actionObjects: actionObject.writeCallback = self.observe
+		if not self.expected: self.finished.set()
+	
+	def observe(self, actionObject, writeTime):
+		with self.lock:
+			if self.finished.is_set(): return
+			self.written.add(actionObject)
+			if len(self.written) < self.expected: return
+			self.writeTime = writeTime
+		self.finished.set()
+	
+	def latency(self, timeout = None):
+		'''Returns the seconds from startTime until the last packet of the stop was written, or None if not within timeout.'''
+		if not self.finished.wait(timeout): return None
+		return self.writeTime - self.startTime
 		
 		
 		
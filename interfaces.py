@@ -8,11 +8,35 @@ import Queue
 import threading
 import socket
 import itertools
+import binascii
+import random
+import select	#for the virtual serial line
+import struct
+import fcntl
+import termios
+import collections
+
+try:
+	import ctypes	#for watching device directories with inotify
+	import ctypes.util
+	inotify = ctypes.CDLL(ctypes.util.find_library('c'), use_errno = True)
+	inotify.inotify_init1, inotify.inotify_add_watch	#only found on linux
+except (ImportError, OSError, AttributeError):
+	inotify = None
 from gestalt.utilities import notice
+from gestalt.utilities import activity
+from gestalt.utilities import trace
+from gestalt.utilities import rttEstimator
+from gestalt.utilities import serialExecutorPool
+from gestalt.utilities import monitoredQueue
+from gestalt.utilities import priorityClassQueue
+from gestalt.utilities import queueClosed
 from gestalt import packets
 from gestalt import functions
 from gestalt import core
 
+packetStartBytes = (72, 138)	#unicast, multicast
+packetHeaderLength = 5	#[start, address0, address1, port, length]
 
 #----INTERFACE CLASSES------------
 class interfaceShell(object):
@@ -69,21 +93,69 @@ class socketUDPServer(socketInterface):
 
 class devInterface(baseInterface):
 	''' Base class for interfaces mounted in the /dev/ folder.'''
+	devDirectory = '/dev/'	#can be pointed at another folder, to discover ports without devices attached
+	
 	def deviceScan(self, searchTerm):
 		'''returns available ports that match the search term'''
-		ports = os.listdir('/dev/')
+		ports = os.listdir(self.devDirectory)
 		matchingPorts = []
 		for port in ports:
 			if searchTerm in port:
-				matchingPorts.append('/dev/' + port)
+				matchingPorts.append(os.path.join(self.devDirectory, port))
 		return matchingPorts	
 	
+	def getWatchedDirectories(self):
+		'''returns the folders which are watched for new ports'''
+		return [self.devDirectory, self.getIdentityDirectory()]
+	
+	def getIdentityDirectory(self):
+		'''returns the folder of links which name each port after the device plugged into it'''
+		return os.path.join(self.devDirectory, 'serial', 'by-id')
+	
+	def getPortIdentity(self, portName):
+		'''returns the link in /dev/serial/by-id which points to portName, or None if there isn't one'''
+		try:
+			identities = sorted(os.listdir(self.getIdentityDirectory()))
+		except OSError:	#no by-id folder on this system
+			return None
+		devicePath = os.path.realpath(portName)
+		for identity in identities:
+			identityPath = os.path.join(self.getIdentityDirectory(), identity)
+			if os.path.realpath(identityPath) == devicePath: return identityPath
+		return None
+	
+	def getPersistence(self):
+		'''returns the persistence manager of the owning interface, or None if it doesn't have a persistence file'''
+		persistence = getattr(self.owner, 'persistence', None)
+		if persistence and persistence(): return persistence
+		else: return None
+	
+	def getPersistenceName(self):
+		'''returns the name under which the port is remembered, after the owning interface'''
+		return str(self.owner.name) + '.port'
+	
+	def resolvePort(self):
+		'''returns the port remembered for this interface in the persistence file, if it is plugged in'''
+		persistence = self.getPersistence()
+		if not persistence: return None
+		identity = persistence.get(self.getPersistenceName())
+		if identity and os.path.exists(identity): return identity
+		else: return None
+	
+	def rememberPort(self, portName):
+		'''stores the by-id identity of portName in the persistence file, so that the port can be found on the next run'''
+		persistence = self.getPersistence()
+		if not persistence: return
+		identity = self.getPortIdentity(portName)
+		if identity and persistence.get(self.getPersistenceName()) != identity:
+			persistence.set(self.getPersistenceName(), identity)
+	
 	def getSearchTerms(self, interfaceType):
 		'''returns the likely prefix for a serial port based on the operating system and device type'''
 		#define search strings in format {'OperatingSystem':'SearchString'}
-		ftdi = {'Darwin':'tty.usbserial-'}
-		lufa = {'Darwin':'tty.usbmodem'}
-		genericSerial = {'Darwin': 'tty.'}
+		ftdi = {'Darwin':'tty.usbserial-', 'Linux':'ttyUSB'}
+		lufa = {'Darwin':'tty.usbmodem', 'Linux':'ttyACM'}
+		genericSerial = {'Darwin': 'tty.', 'Linux':'ttyUSB'}
 		
 		searchStrings = {'ftdi':ftdi, 'lufa':lufa, 'genericSerial':genericSerial}	
 		
@@ -100,60 +172,178 @@ class devInterface(baseInterface):
 			return False	
 
 	def waitForNewPort(self, searchTerms = '', timeout = 10):
-		'''Scans for a new port to appear in /dev/ and returns the name of the port.
+		'''Watches for a new port to appear in /dev/ and returns the name of the port.
 		
 		Search terms is a list that can contain several terms. For now only implemented for one term.'''
-		timerCount = 0
-		devPorts = self.deviceScan(searchTerms)
-		numDevPorts = len(devPorts)
-		while True:
-			time.sleep(0.25)
-			timerCount += 0.25
-			if timerCount > timeout:
-				notice(self.owner, 'TIMOUT in acquiring a port.')
-				return False
-			currentDevPorts = self.deviceScan(searchTerms)
-			numCurrentDevPorts = len(currentDevPorts)
-			
-			#port has been unplugged... update number of ports
-			if numCurrentDevPorts < numDevPorts:
-				devPorts = list(currentDevPorts)
-				numDevPorts = numCurrentDevPorts
-			elif numCurrentDevPorts > numDevPorts:
-				return list(set(currentDevPorts) - set(devPorts))	#returns all ports that just appeared
+		watcher = portWatcher(self.getWatchedDirectories())
+		try:
+			newPorts = watcher.waitForNewPort(searchTerms, timeout)
+		finally:
+			watcher.close()
+		if newPorts: return newPorts	#returns all ports that just appeared
+		notice(self.owner, 'TIMOUT in acquiring a port.')
+		return False
 		
+class portWatcher(object):
+	'''Watches folders for ports which are plugged in or unplugged.
+	
+	On linux the folders are watched with inotify, so that a new port is seen the moment its device file is created.
+	Elsewhere, or when inotify can't be used, the folders are listed every pollInterval seconds. Links to ports, like
+	those in /dev/serial/by-id, are resolved to the device files they point to.'''
+	inotifyMask = 0x100 | 0x200 | 0x40 | 0x80	#IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+	
+	def __init__(self, directories, pollInterval = 0.05, useInotify = True):
+		self.directories = [directory for directory in directories if os.path.isdir(directory)]
+		self.pollInterval = pollInterval
+		self.inotifyFile = None	#an inotify file descriptor, or None when polling
+		if inotify and useInotify: self.openInotify()
+		self.ports = self.scan()
+	
+	def openInotify(self):
+		inotifyFile = inotify.inotify_init1(os.O_NONBLOCK | getattr(os, 'O_CLOEXEC', 0))
+		if inotifyFile < 0: return
+		watchCount = 0
+		for directory in self.directories:
+			if inotify.inotify_add_watch(inotifyFile, directory, self.inotifyMask) >= 0: watchCount += 1
+		if watchCount: self.inotifyFile = inotifyFile
+		else: os.close(inotifyFile)
+	
+	def scan(self):
+		'''Returns the set of ports in the watched folders.'''
+		ports = set()
+		for directory in self.directories:
+			try:
+				names = os.listdir(directory)
+			except OSError:	#folder was removed
+				continue
+			for name in names:
+				port = os.path.join(directory, name)
+				if os.path.islink(port): port = os.path.realpath(port)
+				ports.add(port)
+		return ports
+	
+	def waitForChange(self, timeout):
+		'''Waits up to timeout seconds for the ports to change, and returns the sets of ports (added, removed).'''
+		if self.inotifyFile != None:
+			if select.select([self.inotifyFile], [], [], max(timeout, 0))[0]:
+				try:
+					while os.read(self.inotifyFile, 4096): pass	#the events only wake us, the folders are rescanned
+				except OSError:	#no more events
+					pass
+		else:
+			time.sleep(max(min(self.pollInterval, timeout), 0))
+		ports = self.scan()
+		added, removed = ports - self.ports, self.ports - ports
+		self.ports = ports
+		return added, removed
+	
+	def waitForNewPort(self, searchTerm = '', timeout = 10):
+		'''Returns a list of the ports matching searchTerm which appear within timeout seconds, or an empty list.'''
+		endTime = time.time() + timeout
+		while time.time() < endTime:
+			added, removed = self.waitForChange(endTime - time.time())
+			newPorts = [port for port in added if searchTerm in os.path.basename(port)]
+			if newPorts:
+				added, removed = self.waitForChange(0)	#picks up ports plugged in at the same moment
+				return sorted(set(newPorts + [port for port in added if searchTerm in os.path.basename(port)]))
+		return []
+	
+	def close(self):
+		if self.inotifyFile != None:
+			os.close(self.inotifyFile)
+			self.inotifyFile = None
+
 class serialInterface(devInterface):
 	'''Provides an interface to nodes connected thru a serial port on the host machine.'''
-	def __init__(self, baudRate, portName = None, interfaceType = None, owner = None, timeOut = 0.2, flowControl = None):
+	#seconds within which a newly opened port must answer the readiness probe, by interfaceType. LUFA boards reset when
+	#their port is opened, and need this long to start up again. The nodes behind an FTDI cable don't, and so only need
+	#time for the adapter to settle. Any other port is given defaultResetDelay.
+	resetDelays = {'lufa':2.0, 'ftdi':0.5}
+	defaultResetDelay = 2.0
+	probeTimeout = 0.1	#seconds to wait for a reply to each readiness probe before sending it again
+	queueSettings = {'transmit':{'maxsize':256, 'policy':'block', 'timeout':None}}	#a full queue holds up the lane which transmits until there is room
+	priorityWeights = None	#{priority class: packets per round} for sharing the port between classes, or None for strict priority
+	
+	def __init__(self, baudRate, portName = None, interfaceType = None, owner = None, timeOut = 0.2, flowControl = None, maxBurst = 32,
+				resetDelay = None, connectInBackground = False):
+		'''flowControl:	None, 'rtscts' for hardware (RTS/CTS) flow control, or 'xonxoff' for software flow control.
+			maxBurst:	the maximum number of queued packets which will be combined into a single write to the port.
+			resetDelay:	seconds to wait after opening the port, for boards which reset when it is opened. None instead
+						probes the port for readiness, for up to the delay of its interfaceType, and 0 doesn't wait.
+			connectInBackground:	connects in a separate thread, so that several interfaces can connect at once. Requests
+						wait in the channel until the port is ready.'''
 		self.baudRate = baudRate
 		self.portName = portName
 		self.timeOut = timeOut
+		self.flowControl = flowControl
+		self.maxBurst = maxBurst
+		self.resetDelay = resetDelay
+		self.connectInBackground = connectInBackground
 		self.isConnected = False
+		self.connectedFlag = threading.Event()	#set once the port is open, so that receivers can block until there is something to read.
+		self.connectionAttempted = threading.Event()	#set once connecting has finished, whether or not the port opened
 		self.owner = owner
 		#self.owner gets set by the interface shell, and contains a reference to the owning object
 		#this is useful to refer to the name of the object when acquiring the interface
 		self.port = None	#will be replaced with a serial object when port is acquired
 		self.interfaceType = interfaceType
-		self.transmitQueue = Queue.Queue()	#a queue is used to allow multiple threads to call transmit simultaneously.
+		self.transmitQueue = priorityClassQueue(core.priorityClasses, self.priorityWeights, **self.queueSettings['transmit'])	#a queue is used to allow multiple threads to call transmit simultaneously.
 
-	def initAfterSet(self):		
-		#if port name is provided, auto-connect
-		if self.portName:
-			self.connect(self.portName)
-		elif self.interfaceType: #if an interface type is provided, auto-acquire
-			self.acquirePort(self.interfaceType)
-	
-	def getAvailablePorts(self, ports):
-		'''tests all provided ports and returns a subset of ports that are available'''
+	def initAfterSet(self):
+		if self.connectInBackground:
+			connectThread = threading.Thread(target = self.initConnection)
+			connectThread.daemon = True
+			connectThread.start()
+		else:
+			self.initConnection()
+	
+	def initConnection(self):
+		try:
+			#if port name is provided, auto-connect
+			if self.portName:
+				self.connect(self.portName)
+			else:
+				rememberedPort = self.resolvePort()	#a port remembered from a previous run, if it is still there
+				if rememberedPort:	#reconnect to it
+					self.portName = rememberedPort
+					self.connect()
+				elif self.interfaceType: #if an interface type is provided, auto-acquire
+					self.acquirePort(self.interfaceType)
+		finally:
+			self.connectionAttempted.set()
+	
+	def waitForConnection(self, timeout = None):
+		'''Blocks until the interface has finished connecting, and returns whether the port is connected.'''
+		self.connectionAttempted.wait(timeout)
+		return self.isConnected
+	
+	def getAvailablePorts(self, ports, timeout = 0.5):
+		'''tests the provided ports and returns a subset of ports that are available
+		
+		Ports are tested one at a time, which is quickest when they open promptly, as they usually do. Once a port has
+		taken longer than timeout seconds to test, the ports after it are tested all at once instead, by probe threads,
+		and any which hasn't opened within timeout seconds is left out.'''
+		ports = list(ports)
 		availablePorts = []
-		for port in ports:
-			try:
-				openPort = serial.Serial(port)
-				openPort.close()
-				availablePorts += [port]
-			except serial.SerialException, e:
-				continue
+		for index, port in enumerate(ports):
+			startTime = time.time()
+			if self.testPort(port): availablePorts.append(port)
+			if time.time() - startTime > timeout:	#a slow adapter, which may not be the only one
+				probes = [self.portProbe(self, remainingPort) for remainingPort in ports[index + 1:]]
+				endTime = time.time() + timeout
+				for probe in probes:
+					probe.join(max(endTime - time.time(), 0))
+				return availablePorts + [probe.port for probe in probes if probe.available]
 		return availablePorts
+	
+	def testPort(self, port):
+		'''Returns True if port can be opened.'''
+		try:
+			openPort = serial.Serial(port)
+			openPort.close()
+			return True
+		except (serial.SerialException, OSError), e:
+			return False
 				
 	def acquirePort(self, interfaceType = None):
 		'''Discovers and connects to a port by waiting for a new device to be plugged in.'''
@@ -185,13 +375,11 @@ class serialInterface(devInterface):
 			
 		#check if port has been provided explicitly to connect function
 		if portName:
-			self.connectToPort(portName)
-			return True
+			return self.connectToPort(portName)
 		
 		#port hasn't been provided to connect function, check if assigned on instantiation
 		elif self.portName:
-			self.connectToPort(self.portName)
-			return True
+			return self.connectToPort(self.portName)
 			
 		#no port name provided
 		else:
@@ -201,22 +389,66 @@ class serialInterface(devInterface):
 	def connectToPort(self, portName):
 		'''Actually connects the interface to the port'''
 		try:
-			self.port = serial.Serial(portName, self.baudRate, timeout = self.timeOut)
+			self.port = serial.Serial(portName, self.baudRate, timeout = self.timeOut, rtscts = (self.flowControl == 'rtscts'),
+									xonxoff = (self.flowControl == 'xonxoff'))
 			self.port.flushInput()
 			self.port.flushOutput()
 			notice(self, "port " + str(portName) + " connected succesfully.")
-			time.sleep(2)	#some serial ports require a brief amount of time between opening and transmission
+			self.waitUntilReady()
 			self.isConnected = True
+			self.connectedFlag.set()
 			self.startTransmitter()
+			self.rememberPort(portName)
 			return True
 		except:
 			notice(self, "error opening serial port "+ str(portName))
 			return False
 
+	def waitUntilReady(self):
+		'''Waits until a newly opened port can carry traffic, and returns whether a node answered the readiness probe.
+		
+		The readiness probe of the owning interface is written to the port, and written again every probeTimeout seconds
+		until the owner finds a reply in what is read back, or until the delay of the interface type has passed. Anything
+		else read in the meantime, like the output of a board starting up, is discarded. An owner without a probe, or an
+		explicit resetDelay, waits out the whole delay.'''
+		getReadinessProbe = getattr(self.owner, 'getReadinessProbe', None)
+		if self.resetDelay != None or not getReadinessProbe:
+			if self.resetDelay == None: time.sleep(self.resetDelays.get(self.interfaceType, self.defaultResetDelay))
+			else: time.sleep(self.resetDelay)
+			return False
+		endTime = time.time() + self.resetDelays.get(self.interfaceType, self.defaultResetDelay)
+		probe = serialize(getReadinessProbe())
+		received = bytearray()
+		try:
+			self.port.timeout = self.probeTimeout
+			while time.time() < endTime:
+				self.port.write(probe)
+				probeTime = time.time()
+				while time.time() - probeTime < self.probeTimeout:
+					received += bytearray(self.port.read(self.port.inWaiting() or 1))
+					if self.owner.findReadinessReply(received) != None:
+						time.sleep(self.probeTimeout)	#lets the rest of the reply arrive, so that it can be discarded
+						return True
+			notice(self, "no reply to the readiness probe.")
+			return False
+		finally:
+			self.port.timeout = self.timeOut
+			self.port.flushInput()
+	
 	def disconnect(self):
 		'''Disconnects from serial port.'''
+		self.connectedFlag.clear()
 		self.port.close()
 		self.isConnected = False
+	
+	def close(self, timeout = 1.0):
+		'''Stops the transmit thread, waiting for up to timeout seconds for it to finish its last write, and disconnects.
+		
+		Packets still waiting to be transmitted are dropped. The interface can't be used again once closed.'''
+		self.transmitQueue.close()
+		transmitter = getattr(self, 'transmitter', None)
+		if transmitter: transmitter.join(timeout)
+		if self.port: self.disconnect()
 		
 	def setDTR(self):
 		'''Used to reset the Arduino hardware.'''
@@ -234,44 +466,136 @@ class serialInterface(devInterface):
 				
 	def startTransmitter(self):
 		'''Starts the transmit thread.'''
-		self.transmitter = self.transmitThread(self.transmitQueue, self.port)
+		self.transmitter = self.transmitThread(self.transmitQueue, self.port, self.maxBurst, 10.0/self.baudRate)	#a start bit, eight data bits and a stop bit
 		self.transmitter.daemon = True
 		self.transmitter.start()
 	
-	def transmit(self, data):
-		'''Sends request for data to be transmitted over the serial port. Format is as a list.'''
+	def transmitStatistics(self):
+		'''Returns the number of writes, packets, and bytes sent since the transmitter started or was last reset.
+		
+		Also returns the average number of packets combined into each write, and the average bytes/s sent.'''
+		if not self.isConnected: return None
+		return self.transmitter.statistics()
+	
+	def resetTransmitStatistics(self):
+		if self.isConnected: self.transmitter.resetStatistics()
+	
+	def transmit(self, data, priority = None, written = None):
+		'''Sends request for data to be transmitted over the serial port. Format is as a list.
+		
+		Packets of a higher priority class are written ahead of any packets of lower classes still waiting in the queue.
+		If provided, written is called with the time at which data was written to the port.'''
 		if self.isConnected:
-			self.transmitQueue.put(data)	#converts to list in case data comes in as a string.
+			if activity.enabled or written: self.transmitQueue.put((data, time.time(), written), priority)	#timestamp is used to measure the transmit hop
+			else: self.transmitQueue.put(data, priority)
 		else: notice(self, 'serialInterface is not connected.')
+	
+	class portProbe(threading.Thread):
+		'''Tests whether a port can be opened, without holding up the tests of other ports.'''
+		def __init__(self, interface, port):
+			threading.Thread.__init__(self)
+			self.daemon = True	#a port which never opens is abandoned
+			self.interface = interface
+			self.port = port
+			self.available = False
+			self.start()
+		
+		def run(self):
+			self.available = self.interface.testPort(self.port)
+	
 	class transmitThread(threading.Thread):
-		'''Handles transmitting data over the serial port.'''
-		def __init__(self, transmitQueue, port):
+		'''Handles transmitting data over the serial port.
+		
+		Every packet already waiting in the transmit queue, up to maxBurst packets, is sent in a single write. Packets are
+		taken from the queue in order of their priority class. A write isn't made until the line has carried the last one,
+		which it couldn't have started on sooner, and so the packets which are queued while it is busy, like the spin
+		packets and sync packet of a move to several nodes, go out together. A packet queued while the line is idle is
+		written at once.'''
+		def __init__(self, transmitQueue, port, maxBurst = 32, byteTime = 0.0):
 			threading.Thread.__init__(self)	#initialize threading superclass
 			self.transmitQueue = transmitQueue
 			self.port = port
+			self.maxBurst = maxBurst
+			self.byteTime = byteTime	#seconds the line takes to carry a byte, or 0 to write as soon as a packet is queued
+			self.lineFreeTime = 0.0	#when the line will have carried everything written to it
+			self.statisticsLock = threading.Lock()
+			self.resetStatistics()
 		
 		def run(self):
 			'''Code run by the transmit thread.'''
 			while True:
-				transmitState, transmitPacket = self.getTransmitPacket()
-				if transmitState:
-					if self.port:
-						self.port.write(serialize(transmitPacket))
-					else: notice(self, 'Cannot Transmit - No Serial Port Initialized')
-				time.sleep(0.0005)
-
-		def getTransmitPacket(self):
-			'''Tries to fetch a packet from the transmit queue.'''
+				try:
+					transmitPackets = self.getTransmitBurst()	#blocks until at least one packet is queued
+				except queueClosed:	#the interface has been closed
+					return
+				queueTimes = []
+				writtenCallbacks = []
+				for index, transmitPacket in enumerate(transmitPackets):
+					if type(transmitPacket) == tuple:	#packet was queued while measuring, or with a callback
+						transmitPackets[index], queueTime, written = transmitPacket
+						queueTimes += [queueTime]
+						if written: writtenCallbacks += [written]
+				if len(transmitPackets) == 1: transmitData = serialize(transmitPackets[0])	#written as-is, without copying
+				else: transmitData = bytearray().join([serialize(transmitPacket) for transmitPacket in transmitPackets])
+				if self.port:
+					self.lineFreeTime = max(self.lineFreeTime, time.time()) + len(transmitData)*self.byteTime
+					self.port.write(transmitData)
+					with self.statisticsLock:
+						self.writeCount += 1
+						self.packetCount += len(transmitPackets)
+						self.byteCount += len(transmitData)
+					writeTime = time.time()
+					for written in writtenCallbacks: written(writeTime)
+				else: notice(self, 'Cannot Transmit - No Serial Port Initialized')
+				if activity.enabled:
+					activity.wakeup('transmit')
+					for queueTime in queueTimes: activity.hop('transmit->write', queueTime)
+		
+		def getTransmitBurst(self):
+			'''Waits for a packet to be queued, and then returns a list of it and all packets queued behind it, up to maxBurst.
+			
+			If the line is still carrying the last write, the packets queued until it is free are included.'''
+			transmitPackets = [self.transmitQueue.get()]
+			lineDelay = self.lineFreeTime - time.time()
+			if lineDelay > 0 and self.maxBurst > 1: time.sleep(lineDelay)	#nothing could join a single packet
 			try:
-				return True, self.transmitQueue.get()
-			except:
-				return False, None
+				while len(transmitPackets) < self.maxBurst:
+					transmitPackets += [self.transmitQueue.get_nowait()]
+			except Queue.Empty:
+				pass
+			return transmitPackets
+		
+		def resetStatistics(self):
+			with self.statisticsLock:
+				self.statisticsStartTime = time.time()
+				self.writeCount = 0
+				self.packetCount = 0
+				self.byteCount = 0
+		
+		def statistics(self):
+			with self.statisticsLock:
+				elapsedTime = max(time.time() - self.statisticsStartTime, 1e-9)
+				return {'writes':self.writeCount, 'packets':self.packetCount, 'bytes':self.byteCount,
+						'packetsPerWrite':self.packetCount/float(max(self.writeCount, 1)), 'bytesPerSecond':self.byteCount/elapsedTime}
 
 	def receive(self):
-		'''Grabs one byte from the serial port.'''
-		if self.port: 
+		'''Grabs one byte from the serial port.
+		
+		If the port isn't connected yet, waits for up to the port timeout for a connection before returning None.'''
+		if self.isConnected:	#the port is read by waitUntilReady until then
 			return self.port.read()
 		else:
+			self.connectedFlag.wait(self.timeOut)
+			return None
+	
+	def receiveAvailable(self):
+		'''Grabs all bytes waiting on the serial port.
+		
+		If no bytes are waiting, blocks for up to the port timeout until one arrives.'''
+		if self.isConnected:
+			return self.port.read(self.port.inWaiting() or 1)
+		else:
+			self.connectedFlag.wait(self.timeOut)
 			return None
 	
 	def flushInput(self):
@@ -280,18 +604,202 @@ class serialInterface(devInterface):
 		return
 		
 		
+class virtualSerialInterface(serialInterface):
+	'''A serial interface connected to a simulated serial line rather than to a port on the host machine.
+	
+	Bytes written by the interface travel over a virtualSerialLink, and arrive at devicePort after the time they would
+	take at baudRate plus latency and a random jitter. They may also be corrupted or lost along the way. Whatever is
+	written to devicePort, for example by emulated nodes, travels back to the interface over the same kind of line.'''
+	def __init__(self, baudRate = 115200, latency = 0.0, jitter = 0.0, corruptionRate = 0.0, lossRate = 0.0, seed = None,
+				owner = None, timeOut = 0.2, maxBurst = 32):
+		'''latency:		seconds between a byte leaving one end of the line and arriving at the other.
+			jitter:			up to this many seconds are randomly added to the latency of each write.
+			corruptionRate:	the fraction of bytes which arrive with a flipped bit.
+			lossRate:		the fraction of writes which never arrive.
+			seed:			seeds the random faults, so that a run can be repeated.'''
+		serialInterface.__init__(self, baudRate, portName = 'virtual', owner = owner, timeOut = timeOut, maxBurst = maxBurst)
+		self.link = virtualSerialLink(baudRate, latency, jitter, corruptionRate, lossRate, seed)
+		self.devicePort = self.link.devicePort	#the far end of the line
+	
+	def connectToPort(self, portName):
+		'''Connects the interface to the host end of the virtual line.'''
+		self.port = self.link.hostPort
+		self.port.timeout = self.timeOut
+		self.port.flushInput()
+		notice(self, "virtual port connected succesfully.")
+		self.isConnected = True
+		self.connectedFlag.set()
+		self.startTransmitter()
+		return True
+	
+	def getAvailablePorts(self, ports, timeout = 0.5):
+		return []
+	
+	def close(self, timeout = 1.0):
+		'''Closes the interface, and then the line, once it has delivered what was written to it.'''
+		serialInterface.close(self, timeout)
+		self.link.close(timeout)
+
+class virtualSerialLink(object):
+	'''A simulated serial line, with a port at each end: hostPort and devicePort.'''
+	def __init__(self, baudRate = 115200, latency = 0.0, jitter = 0.0, corruptionRate = 0.0, lossRate = 0.0, seed = None):
+		randomSource = random.Random(seed)
+		hostToDevice = virtualSerialLine(baudRate, latency, jitter, corruptionRate, lossRate, randomSource)
+		deviceToHost = virtualSerialLine(baudRate, latency, jitter, corruptionRate, lossRate, randomSource)
+		self.hostPort = virtualSerialPort(hostToDevice, deviceToHost)
+		self.devicePort = virtualSerialPort(deviceToHost, hostToDevice)
+	
+	def statistics(self):
+		'''Returns the statistics of the line in each direction.'''
+		return {'hostToDevice':self.hostPort.transmitLine.statistics(), 'deviceToHost':self.devicePort.transmitLine.statistics()}
+	
+	def close(self, timeout = None):
+		'''Stops the delivery threads of the line in each direction, once they have delivered what was written before.'''
+		self.hostPort.transmitLine.close(timeout)
+		self.devicePort.transmitLine.close(timeout)
+
+class virtualSerialLine(object):
+	'''Carries bytes in one direction, delivering each write once its last byte would have arrived.
+	
+	Writes occupy the line one after another, so that bandwidth is limited by the baud rate. Jitter delays a write but
+	never lets it overtake the write before it. Arriving bytes are written into a pipe by a delivery thread, so that
+	readers can block on the pipe as they would on a serial port.'''
+	def __init__(self, baudRate, latency = 0.0, jitter = 0.0, corruptionRate = 0.0, lossRate = 0.0, randomSource = None):
+		self.byteTime = 10.0/baudRate	#start bit, eight data bits, and a stop bit
+		self.latency = latency
+		self.jitter = jitter
+		self.corruptionRate = corruptionRate
+		self.lossRate = lossRate
+		self.random = randomSource if randomSource else random.Random()
+		self.lock = threading.Lock()
+		self.lineFreeTime = 0.0	#time at which the latest write will have left the line
+		self.lastArrivalTime = 0.0
+		self.resetStatistics()
+		self.inFlight = Queue.Queue()	#(arrivalTime, data), in order of arrival
+		self.readFile, self.writeFile = os.pipe()	#arrived bytes wait in the pipe until they are read
+		self.deliveryThread = threading.Thread(target = self.deliver)
+		self.deliveryThread.daemon = True
+		self.deliveryThread.start()
+	
+	def write(self, data):
+		data = bytearray(data)
+		with self.lock:
+			now = time.time()
+			self.lineFreeTime = max(self.lineFreeTime, now) + len(data)*self.byteTime
+			arrivalTime = self.lineFreeTime + self.latency
+			if self.jitter: arrivalTime += self.random.uniform(0, self.jitter)
+			arrivalTime = max(arrivalTime, self.lastArrivalTime)
+			self.writeCount += 1
+			self.byteCount += len(data)
+			if self.lossRate and self.random.random() < self.lossRate:
+				self.lostCount += 1
+				return
+			if self.corruptionRate:
+				for index in range(len(data)):
+					if self.random.random() < self.corruptionRate:
+						data[index] ^= 1 << self.random.randint(0, 7)
+						self.corruptedCount += 1
+			self.lastArrivalTime = arrivalTime
+			self.inFlight.put((arrivalTime, data))
+	
+	def deliver(self):
+		'''Run by the delivery thread, which writes each write into the pipe once it has arrived.'''
+		while True:
+			flight = self.inFlight.get()
+			if flight == None: return	#the line has been closed
+			arrivalTime, data = flight
+			delay = arrivalTime - time.time()
+			if delay > 0: time.sleep(delay)
+			os.write(self.writeFile, str(data))
+	
+	def close(self, timeout = None):
+		'''Stops the delivery thread once it has delivered every earlier write, waiting for up to timeout seconds.
+		Anything written afterwards never arrives.'''
+		self.inFlight.put(None)
+		self.deliveryThread.join(timeout)
+	
+	def read(self, size = 1, timeout = None):
+		'''Returns up to size bytes, blocking until at least one has arrived or until timeout has elapsed.'''
+		if select.select([self.readFile], [], [], timeout)[0]: return os.read(self.readFile, size)
+		return ''
+	
+	def available(self):
+		'''Returns the number of bytes which have arrived but haven't been read.'''
+		return struct.unpack('i', fcntl.ioctl(self.readFile, termios.FIONREAD, '\0\0\0\0'))[0]
+	
+	def flush(self):
+		'''Discards any bytes which have arrived but haven't been read.'''
+		while self.available(): os.read(self.readFile, self.available())
+	
+	def resetStatistics(self):
+		self.writeCount = 0
+		self.byteCount = 0
+		self.lostCount = 0
+		self.corruptedCount = 0
+	
+	def statistics(self):
+		return {'writes':self.writeCount, 'bytes':self.byteCount, 'lostWrites':self.lostCount, 'corruptedBytes':self.corruptedCount}
+
+class virtualSerialPort(object):
+	'''One end of a virtualSerialLink, providing the parts of a pyserial port used by serialInterface.'''
+	def __init__(self, transmitLine, receiveLine, timeout = None):
+		self.transmitLine = transmitLine
+		self.receiveLine = receiveLine
+		self.timeout = timeout
+	
+	def write(self, data):
+		self.transmitLine.write(data)
+		return len(data)
+	
+	def read(self, size = 1):
+		return self.receiveLine.read(size, self.timeout)
+	
+	def inWaiting(self):
+		return self.receiveLine.available()
+	
+	def flushInput(self):
+		self.receiveLine.flush()
+	
+	def flushOutput(self):
+		pass
+	
+	def setDTR(self, level = True):
+		pass
+	
+	def close(self):
+		pass
+
+
 class gestaltInterface(baseInterface):
 	'''Interface to Gestalt nodes based on the Gestalt protocol.'''
-	def __init__(self, name = None, interface = None, owner = None):
+	dispatchWorkers = 4	#threads which run the service routines of inbound packets. 0 runs them in the router thread.
+	#capacities of the queues between the stages of the interface, of which 0 is unbounded. A full channelPriority queue
+	#holds up callers of commit according to its policy; the other stages always block. channelPriority must hold more
+	#than the lookahead of a motion planner, whose moves wait there to be released.
+	#The queues of the channel are kept for each priority class, with these capacities.
+	queueSettings = {'channelPriority':{'maxsize':256, 'policy':'block', 'timeout':None},
+					'channelAccess':{'maxsize':64},
+					'lane':{'maxsize':64},	#for each node
+					'express':{'maxsize':64},
+					'router':{'maxsize':1024, 'policy':'reject'}}	#the receive thread can't wait for room without the port overflowing, so a packet which doesn't fit is dropped, and its request sent again
+	#actionObjects of the express classes skip the channelPriority queue and the node lanes, and are granted access on the
+	#express lane as soon as they are released, so that a stop or a status query isn't held up behind a stream of moves.
+	#They may be transmitted between the members of an actionSet and its syncRequest, and so mustn't be moves themselves.
+	expressClasses = ('urgent', 'interactive')
+	expressDepth = 2	#express actionObjects which can wait on their responses at once
+	priorityWeights = None	#{priority class: actionObjects per round} for sharing the channel between classes, or None for strict priority
+	
+	
+	def __init__(self, name = None, interface = None, owner = None, persistence = lambda:None):
+		'''persistence:	a persistence manager, in which a serial interface remembers the port it connected to by name.'''
 		self.name = name	#name becomes important for networked gestalt
 		self.owner = owner
-		self.interface = interfaceShell(interface, self)		#uses the interfaceShell object for connecting to sub-interface
+		self.persistence = persistence	#set before the interface, which looks for a remembered port as it is set
 		
 		self.receiveQueue = Queue.Queue()
 		self.CRC = CRC()
 		self.nodeManager = self.nodeManager()	#used to map network addresses (physical devices) to nodes
-		
-		self.startInterfaceThreads()	#this will start the receiver, packetRouter, channelPriority, and channelAccess threads.
+		self.rttEstimator = rttEstimator()	#round trip times of requests to every node on this interface
 		
 		#define standard gestalt packet
 		self.gestaltPacket = packets.packet(template = [	packets.pInteger('startByte', 1),
@@ -299,30 +807,95 @@ class gestaltInterface(baseInterface):
 										packets.pInteger('port', 1),
 										packets.pLength(),
 										packets.pList('payload')])
+		
+		self.interface = interfaceShell(interface, self)		#uses the interfaceShell object for connecting to sub-interface. Set after the packet, which the readiness probe uses
+		self.startInterfaceThreads()	#this will start the receiver, packetRouter, channelPriority, and channelAccess threads.
+	
+	def getReadinessProbe(self):
+		'''Returns a status request for checking that a newly opened port can carry traffic.
+		
+		So that only one node answers on a bus of several, it is sent to a single node: the one which answered when the
+		port was last connected, as remembered in the persistence file, or else the lowest address assigned so far. Only
+		if neither is known is it multicast, in which case every node answers, and the port may not be found ready until
+		the replies stop colliding.'''
+		address = self.getProbeAddress()
+		if address: return self.CRC(self.gestaltPacket({'startByte':72, 'address':list(address), 'port':1, 'payload':[]}))
+		return self.CRC(self.gestaltPacket({'startByte':138, 'address':[0, 0], 'port':1, 'payload':[]}))
+	
+	def getProbeAddress(self):
+		'''Returns the address of a node known to be on this interface, or None.'''
+		if self.persistence():
+			address = self.persistence.get(str(self.name) + '.probeAddress')
+			if address: return address
+		if self.nodeManager.index_node:
+			index = min(self.nodeManager.index_node)
+			return [index >> 8, index & 255]
+		return None
+	
+	def findReadinessReply(self, buffer):
+		'''Returns the address of the node which sent the first valid packet in buffer, or None if there isn't one.
+		
+		Any packet which carries a payload shows that the port can carry traffic, whichever node or port it came from,
+		while the probe itself, which a half-duplex line may echo back, doesn't. The address is remembered in the
+		persistence file, as the node to probe when the port is next connected.'''
+		for position in range(len(buffer) - packetHeaderLength):
+			packetLength = buffer[position + 4]
+			if buffer[position] in packetStartBytes and packetLength > packetHeaderLength and position + packetLength < len(buffer):
+				if self.CRC.validate(buffer[position:position + packetLength + 1]):
+					address = [buffer[position + 1], buffer[position + 2]]
+					if self.persistence() and self.persistence.get(str(self.name) + '.probeAddress') != address:
+						self.persistence.set(str(self.name) + '.probeAddress', address)
+					return address
+		return None
+	
+	def waitForConnection(self, timeout = None):
+		'''Blocks until the sub-interface has finished connecting, for sub-interfaces which connect in the background.'''
+		waitForConnection = getattr(self.interface.Interface, 'waitForConnection', None)
+		if waitForConnection: return waitForConnection(timeout)
+		else: return True
+	
+	def queueReport(self):
+		'''Returns the depth, high-water mark and blocked time of each queue in the interface, including each node's lane.'''
+		channelAccess = self.channelAccess
+		report = {'channelPriority':self.channelPriority.channelPriorityQueue.report(),
+				'channelAccess':channelAccess.channelAccessQueue.report(),
+				'express':channelAccess.expressLane.laneQueue.report(),
+				'router':self.packetRouter.routerQueue.report(),
+				'lanes':dict([(getattr(virtualNode, 'name', None) or str(virtualNode), lane.report()) for virtualNode, lane in channelAccess.lanes.items()])}
+		transmitQueue = getattr(self.interface.Interface, 'transmitQueue', None)
+		if hasattr(transmitQueue, 'report'): report['transmit'] = transmitQueue.report()
+		return report
 	
 	def validateIP(self, IP):
 		'''Makes sure that an IP address isn't already in use on the interface.'''
-		if str(IP) in self.nodeManager.address_node: return False
+		if self.nodeManager.getIndex(IP) in self.nodeManager.index_node: return False
 		else: return True
 		
 	class nodeManager(object):
-		'''Manages all nodes under the control of this interface.'''
+		'''Manages all nodes under the control of this interface.
+		
+		Nodes are indexed by their two address bytes packed into one integer, as they arrive in the packet header. The
+		inbound service routine for each port of a node is looked up once, and then routed to directly by its index and
+		port.'''
 		def __init__(self):
 			self.node_address = {}	#node : address
-			self.address_node = {}	#address: node
+			self.index_node = {}	#address index: node
+			self.routes = {}	#address index << 8 | port: inbound service routine
 
 		def updateNodesAddresses(self, node, address):
-			oldNode = None
-			oldAddress = None
+			oldNode = self.index_node.get(self.getIndex(address))
+			oldAddress = self.node_address.get(node)
 			
-			if str(address) in self.address_node: oldNode = self.address_node[str(address)]
-			if node in self.node_address: oldAddress = self.node_address[node]
+			if oldAddress != None: self.index_node.pop(self.getIndex(oldAddress), None)
+			if oldNode != None: self.node_address.pop(oldNode, None)
 			
-			if str(oldAddress) in self.address_node: self.address_node.pop(str(oldAddress))
-			if oldNode in self.node_address: self.node_address.pop(oldNode)
-			
-			self.address_node.update({str(address):node})
-			self.node_address.update({node:address})
+			self.index_node[self.getIndex(address)] = node
+			self.node_address[node] = address
+			self.routes = {}	#routes are looked up again for the new assignment
+		
+		def getIndex(self, IP):
+			'''Returns the address index of IP, a pair of address bytes.'''
+			return (IP[0] << 8) | IP[1]
 		
 		def getIP(self, node):
 			'''Returns IP address for a given node.'''
@@ -330,16 +903,40 @@ class gestaltInterface(baseInterface):
 			else: return False
 		
 		def getNode(self, IP):
-			IP = str(IP)
-			if IP in self.address_node: return self.address_node[IP]
-			else: return False
+			return self.index_node.get(self.getIndex(IP), False)
+		
+		def getRoute(self, index, port):
+			'''Returns the inbound service routine bound to port on the node at index, or None.'''
+			routes = self.routes
+			route = routes.get((index << 8) | port)
+			if route == None:
+				inPorts = getattr(getattr(self.index_node.get(index), 'bindPort', None), 'inPorts', {})
+				route = inPorts.get(port)
+				if route != None: routes[(index << 8) | port] = route	#unbound ports aren't cached, in case they are bound later
+			return route
 	
 	def assignNode(self, node, address):
 		'''Assigns a given node to the interface on a particular address.'''
 		self.nodeManager.updateNodesAddresses(node, address)
 	
-	def transmit(self, virtualNode, port, packetSet, mode):
-		'''Transmits a packet set over the interface immediately.'''
+	def transmit(self, virtualNode, port, packetSet, mode, priority = None, written = None):
+		'''Transmits a packet set over the interface immediately, ahead of any queued packets of lower priority classes.
+		
+		If provided, written is called with the time at which the last packet of the set was written to the port.'''
+		packetsWChecksum = self.buildPackets(virtualNode, port, packetSet, mode)
+		for packetWChecksum in packetsWChecksum[:-1]:
+			self.interface.transmit(packetWChecksum, priority)	#transmit packet thru interface
+		if packetsWChecksum: self.interface.transmit(packetsWChecksum[-1], priority, written)
+	
+	def transmitBatch(self, commands, priority = None):
+		'''Transmits the packets of a list of commands in a single queue operation, so that they are written together.'''
+		packetsWChecksum = []
+		for command in commands:
+			packetsWChecksum += self.buildPackets(command.virtualNode, command.port, command.packetSet, command.mode)
+		self.interface.transmit(bytearray().join([serialize(packet) for packet in packetsWChecksum]), priority)
+	
+	def buildPackets(self, virtualNode, port, packetSet, mode):
+		'''Returns the packets of packetSet, addressed to virtualNode on port, with their CRCs.'''
 		#--BUILD START BYTE TABLE--
 		startByteTable = {'unicast': 72, 'multicast': 138}	#unicast transmits to addressed node, multicast to all nodes on network
 		if mode in startByteTable:
@@ -347,16 +944,40 @@ class gestaltInterface(baseInterface):
 		else:
 			startByte = startByteTable['unicast']
 
-		#--TRANSMIT PACKETS--
+		#--BUILD PACKETS--
 		address = self.nodeManager.getIP(virtualNode)
-		for packet in packetSet:
-			packetRoutable = self.gestaltPacket({'startByte':startByte, 'address': address, 'port':port, 'payload':packet})	#build packet
-			packetWChecksum = self.CRC(packetRoutable)	#generate CRC
-			self.interface.transmit(packetWChecksum)	#transmit packet thru interface
+		packetsRoutable = [self.gestaltPacket({'startByte':startByte, 'address': address, 'port':port, 'payload':packet}) for packet in packetSet]	#build packets
+		return self.CRC.batch(packetsRoutable)	#generate CRCs
 	
 	def commit(self, actionObject):
-		'''Puts actionObjects or actionSets into the channelPriority queue.'''
-		self.channelPriority.putActionObject(actionObject)
+		'''Puts actionObjects, actionSets or transactions into the channelPriority queue, or actionObjects of the express classes into the express lane.'''
+		if activity.enabled: actionObject.commitTime = time.time()
+		if trace.enabled: trace.stamp(actionObject, 'commit')
+		if actionObject._type_ == 'actionObject' and actionObject.priority in self.expressClasses: self.channelAccess.expressLane.putActionObject(actionObject)
+		else: self.channelPriority.putActionObject(actionObject)
+	
+	def cancel(self, actionObject):
+		'''Withdraws a committed actionObject, actionSet or transaction which hasn't yet been passed on for channel access.
+		
+		Returns True if it was withdrawn.'''
+		return self.channelPriority.cancel(actionObject)
+	
+	def purge(self, actionObjects):
+		'''Takes actionObjects, which have been cancelled with core.cancelGroup, out of wherever they wait in the interface.
+		
+		actionObjects may include actionSets and actionSequences, whose members are taken out with them, whether or not
+		they have been released. The syncRequests which follow the members are taken out too. Returns the number of
+		items taken out of the queues, which frees their places for the requests behind them.'''
+		targets = set()
+		for actionObject in actionObjects: targets.update(self.getMembers(actionObject))
+		return self.channelPriority.purge(targets) + self.channelAccess.purge(targets)
+	
+	def getMembers(self, actionObject):
+		'''Returns actionObject, along with its members if it is an actionSet, actionSequence or transaction.'''
+		if actionObject._type_ == 'actionObject': return [actionObject]
+		members = [actionObject]
+		for member in actionObject.actionObjects: members += self.getMembers(member)
+		return members
 		
 	def startInterfaceThreads(self):
 		'''Initiates the receiver thread.'''
@@ -376,129 +997,510 @@ class gestaltInterface(baseInterface):
 		self.channelAccess = self.channelAccessThread(self)
 		self.channelAccess.daemon = True
 		self.channelAccess.start()
+	
+	def close(self, timeout = 1.0):
+		'''Stops the threads of the interface and of its sub-interface, waiting for up to timeout seconds for each.
+		
+		Requests still waiting in the queues are dropped, while those which have been granted access finish first. The
+		threads are daemons, which python doesn't wait for on exit, but one still running as the interpreter shuts down
+		may wake and fail. Closing the interface before exiting stops them cleanly. It can't be used again once closed.'''
+		self.channelPriority.stop(timeout)
+		self.channelAccess.stop(timeout)	#after channelPriority, which passes actionObjects on to it
+		self.receiver.stop(timeout)	#after the lanes, which may be waiting on responses
+		self.packetRouter.stop(timeout)
+		close = getattr(self.interface.Interface, 'close', None)
+		if close: close(timeout)
 
 
 	class receiveThread(threading.Thread):
-		'''Gets packets from the network interface, interpreting them, and pushing them to the router queue.'''
+		'''Gets packets from the network interface, interpreting them, and pushing them to the router queue.
+		
+		Incoming bytes are read in bulk into a reusable buffer, which is then scanned for complete packets. A packet is
+		located by its start byte (72 for unicast, 138 for multicast) and the length byte that follows the address and port.
+		If a candidate packet fails its CRC check, the receiver resynchronizes on the next start byte within the buffer.'''
 		def __init__(self, interface):
 			threading.Thread.__init__(self)
 			self.interface = interface
+			self.receiveBuffer = bytearray()	#holds received bytes which have not yet been framed into packets
+			self.startBytes = packetStartBytes
+			self.headerLength = packetHeaderLength
+			self.receiveTime = None	#time at which the latest bytes arrived, used when measuring activity
+			self.stopEvent = threading.Event()	#set when the interface is closed
 #			print "GESTALT INTERFACE RECEIVE THREAD INITIALIZED"
 			
 		def run(self):
-			packet = []
-			inPacket = False
-			packetPosition = 0
-			packetLength = 5	
-			
-			while True:
-				byte = self.interface.interface.receive()	#get byte
-				if byte:
-					byte = ord(byte) #converts char to byte
-					if not inPacket:
-						if byte == 72 or byte == 138:	#waits for start byte
-							inPacket = True
-							packet += [byte]	#adds start byte to packet
-							packetPosition += 1	#increment packet position
-							continue	#otherwise rejects packet
-					else:	#in a packet
-						packet += [byte] #append byte to packet
-						
-						if packetPosition == 4:	#byte 2 contains the packet position
-							packetLength = byte
-							packetPosition += 1 #increment packet position
-							continue
-						
-						if packetPosition < packetLength:
-							packetPosition += 1 #increment packet position
-							continue
-						
-						if packetPosition == packetLength:
-							if self.interface.CRC.validate(packet): self.interface.packetRouter.routerQueue.put(packet[:len(packet)-1])	#check CRC, then send to router (minus CRC)
-							
-				#initialize packet
-				packet = []
-				inPacket = False
-				packetPosition = 0
-				packetLength = 5
-				
-				time.sleep(0.0005)
+			while not self.stopEvent.is_set():
+				data = self.receiveData()	#blocks until data arrives or the port times out
+				if data:
+					if activity.enabled:
+						activity.wakeup('receive')
+						self.receiveTime = time.time()
+					self.receiveBuffer += data
+					consumed = self.framePackets(self.receiveBuffer)
+					if consumed: del self.receiveBuffer[:consumed]	#discard framed packets and rejected bytes
+				elif self.receiveBuffer:
+					#the line has gone quiet with an incomplete packet in the buffer. The leading start byte must be false, so skip it.
+					consumed = self.framePackets(self.receiveBuffer, 1)
+					del self.receiveBuffer[:consumed]
+		
+		def stop(self, timeout = None):
+			'''Stops the thread once the port's read has timed out, waiting for up to timeout seconds.'''
+			self.stopEvent.set()
+			self.join(timeout)
+		
+		def receiveData(self):
+			'''Returns all bytes waiting on the network interface, or a single byte if bulk reads are not supported.'''
+			subInterface = self.interface.interface
+			if hasattr(subInterface, 'receiveAvailable'): return subInterface.receiveAvailable()
+			else: return subInterface.receive()
+		
+		def framePackets(self, buffer, position = 0):
+			'''Routes every complete packet found in buffer, and returns the number of bytes which have been consumed.'''
+			return framePackets(buffer, self.interface.CRC, self.routePacket, position)
+		
+		def routePacket(self, packet):
+			'''Hands a framed packet to the router.'''
+			try:
+				if activity.enabled: self.interface.packetRouter.routerQueue.put((packet, self.receiveTime))
+				else: self.interface.packetRouter.routerQueue.put(packet)
+			except Queue.Full:	#counted by the queue
+				pass
 		
 	class packetRouterThread(threading.Thread):
-		'''Routes packets to their matching service routines, and executes the service routine within this thread.'''
+		'''Routes packets to their matching service routines.
+		
+		The service routines are run by a pool of dispatchWorkers threads, in the order their packets arrived for each
+		node, so that a node which is slow to handle its packets doesn't hold up the packets of other nodes.'''
 		def __init__(self, interface):
 			threading.Thread.__init__(self)
 			self.interface = interface
-			self.routerQueue = Queue.Queue()
+			self.routerQueue = monitoredQueue(**interface.queueSettings['router'])
+			if interface.dispatchWorkers: self.dispatcher = serialExecutorPool(interface.dispatchWorkers)
+			else: self.dispatcher = None
 		
 		def run(self):
 			while True:
-				routerState, routerPacket = self.getRouterPacket()
+				routerState, routerPacket = self.getRouterPacket()	#blocks until a packet arrives
+				if routerState == None: return	#the interface has been closed
 				if routerState:
-					parsedPacket = self.interface.gestaltPacket.decode(routerPacket)
-					address = parsedPacket['address']
-					port = parsedPacket['port']
-					data = parsedPacket['payload']
-					destinationNode = self.interface.nodeManager.getNode(address)
-					if not destinationNode:
-						print "PACEKT RECEIVED FOR UNKNOWN ADDRESS "+ str(address)
-						continue
-					destinationNode.route(port, data)
-					
-				time.sleep(0.0005)
+					if type(routerPacket) == tuple: routerPacket, receiveTime = routerPacket	#packet was received while measuring
+					else: receiveTime = None
+					index = (routerPacket[1] << 8) | routerPacket[2]	#header is read in place: [start, address0, address1, port, length]
+					port = routerPacket[3]
+					data = memoryview(routerPacket)[self.interface.receiver.headerLength:]	#payload is decoded without being copied
+					route = self.interface.nodeManager.getRoute(index, port)
+					if route != None:
+						self.dispatch(index, route.receiver, data)
+					else:	#the node reports a packet to a port which isn't bound
+						destinationNode = self.interface.nodeManager.index_node.get(index)
+						if not destinationNode:
+							print "PACEKT RECEIVED FOR UNKNOWN ADDRESS "+ str([routerPacket[1], routerPacket[2]])
+							continue
+						self.dispatch(index, destinationNode.route, port, data)
+					if activity.enabled:
+						activity.wakeup('router')
+						if receiveTime: activity.hop('receive->route', receiveTime)
 
 		def getRouterPacket(self):
 			try:
 				return True, self.routerQueue.get()
+			except queueClosed:
+				return None, None
 			except:
 				return False, None
+		
+		def stop(self, timeout = None):
+			'''Stops the thread and the dispatch workers once they have finished with their current packets, waiting for
+			up to timeout seconds for each. Packets still waiting are dropped.'''
+			self.routerQueue.close()
+			self.join(timeout)
+			if self.dispatcher: self.dispatcher.close(timeout)
+		
+		def dispatch(self, index, function, *args):
+			'''Runs function(*args) for the node at index, after any of its packets which are still being handled.'''
+			if self.dispatcher: self.dispatcher.submit(index, function, *args)
+			else: function(*args)
+		
+		def report(self):
+			'''Returns the depth of the router queue, and the wait and run times of the service routines by node name.'''
+			queueReport = self.routerQueue.report()
+			report = {'queueDepth':queueReport['depth'], 'maxQueueDepth':queueReport['highWater'], 'handlers':{}}
+			if self.dispatcher:
+				for index, handlerReport in self.dispatcher.report().iteritems():
+					node = self.interface.nodeManager.index_node.get(index)
+					report['handlers'][getattr(node, 'name', None) or str([index >> 8, index & 255])] = handlerReport
+			return report
 
 	class channelAccessThread(threading.Thread):
 		'''Controls when action objects have access to the interface.
 		
 			channelAccessQueue contains a serialized list of actionObjects which have been cleared for transmission and
-			are waiting for access to the channel.'''
+			are waiting for access to the channel.
+			
+			Each node has its own lane on the channel, served by a channelLane, so that requests to different nodes
+			can be in flight at the same time while requests to the same node are still granted one at a time, in order.
+			An actionObject holds its node's lane from when it is granted access until both its channelAccess method has
+			returned and its init method has finished. A node whose pipelineDepth is greater than one lets that many
+			actionObjects hold its lane at once, so that several requests can wait on their responses together. These are
+			still granted access in order, and each must transmit (or finish) before the next is granted. Multicast actionObjects, such as the syncRequest which follows the
+			members of an actionSet, reach every node, and so wait for every lane to finish before being granted access
+			in this thread. Nothing behind a multicast actionObject is granted access until it has also finished.
+			
+			The queues are kept by priority class, and an actionObject of a higher class is taken ahead of those of lower
+			classes. actionObjects of the interface's express classes are served by an expressLane of their own, which
+			grants them access alongside the node lanes, without waiting on anything ahead of them in this thread.'''
 		
 		def __init__(self, interface):
 			threading.Thread.__init__(self)
 			self.interface = interface
-			self.channelAccessQueue = Queue.Queue()
-			#might add another queue here for when actionObjects need to be transmitted immediately.
+			self.channelAccessQueue = priorityClassQueue(core.priorityClasses, interface.priorityWeights, **interface.queueSettings['channelAccess'])
+			self.lanes = {}	#{virtualNode: channelLane}
+			self.outstanding = 0	#number of actionObjects handed to lanes which haven't yet finished
+			self.outstandingCondition = threading.Condition()
+			self.expressLane = self.expressLane(self, interface.expressDepth, interface.queueSettings['express'], interface.priorityWeights)
 		
 		def run(self):
 			while True:
-				accessQueueState, actionObject = self.getActionObject()	#get the next action object from the queue.
+				accessQueueState, actionObject = self.getActionObject()	#blocks until the next action object is queued.
+				if accessQueueState == None: return	#the interface has been closed
 				if accessQueueState:
-					actionObject.grantAccess()	#actionObject now has control of the channel.
-				time.sleep(0.0005)
+					if activity.enabled: activity.wakeup('channelAccess')
+					self.interface.waitForConnection()	#requests wait here while the port connects in the background
+					self.startAction()
+					if actionObject.mode == 'multicast':
+						self.waitForLanes(1)	#all lanes must finish before a multicast is granted access
+						self.grantAccess(actionObject)	#blocks until the multicast has finished with the channel
+						actionObject.finish()
+					else:
+						self.getLane(actionObject.virtualNode).putActionObject(actionObject)
+		
+		def getLane(self, virtualNode):
+			'''Returns the lane for virtualNode, starting one if necessary.'''
+			if virtualNode not in self.lanes:
+				self.lanes[virtualNode] = self.channelLane(self, getattr(virtualNode, 'pipelineDepth', 1), self.interface.queueSettings['lane'], self.interface.priorityWeights)
+			return self.lanes[virtualNode]
+		
+		def grantAccess(self, actionObject):
+			'''Grants actionObject access to the channel, and blocks until it has finished with the channel.'''
+			try:
+				if activity.enabled and actionObject.readyTime: activity.hop('release->grant', actionObject.readyTime)
+				synchronizes = getattr(actionObject, 'synchronizes', None)
+				if synchronizes and all([member.flags & core.cancelledFlag for member in synchronizes]): core.cancelGroup([actionObject])	#nothing left to sync
+				if actionObject.grantAccess():	#actionObject now has control of the channel, unless it was cancelled
+					actionObject.waitForInit()	#actionObjects which transmit from init hold the channel until init returns
+			finally:
+				actionObject.closeMailbox()	#any response which arrives later is for someone else
+				if trace.enabled: trace.complete(actionObject)
+				self.finishAction()
+		
+		def startAction(self):
+			with self.outstandingCondition:
+				self.outstanding += 1
+		
+		def finishAction(self):
+			with self.outstandingCondition:
+				self.outstanding -= 1
+				self.outstandingCondition.notify_all()
+		
+		def waitForLanes(self, outstanding):
+			'''Blocks until no more than the provided number of actionObjects are outstanding.'''
+			with self.outstandingCondition:
+				while self.outstanding > outstanding:
+					self.outstandingCondition.wait()
 
 		def getActionObject(self):
 			try:
 				return True, self.channelAccessQueue.get()
+			except queueClosed:
+				return None, None
 			except:
 				return False, None
+		
+		def stop(self, timeout = None):
+			'''Stops the thread, and then the threads of every lane, waiting for up to timeout seconds for each. A lane
+			stops once the actionObjects which have been granted access on it have finished.'''
+			self.channelAccessQueue.close()
+			self.join(timeout)
+			for lane in self.lanes.values() + [self.expressLane]: lane.stop(timeout)
 	
 		def putActionObject(self, actionObject):
-			self.channelAccessQueue.put(actionObject)
+			self.channelAccessQueue.put(actionObject, actionObject.priority)
 			return True
+		
+		def purge(self, targets):
+			'''Takes the actionObjects in targets, and the syncRequests which follow them, out of the queue and the node lanes.
+			
+			Those in the lanes no longer count as outstanding. Returns the number taken out. Cancelled actionObjects which
+			are missed, as they are being taken from a queue, are dropped when they would have been granted access.'''
+			isTarget = lambda actionObject: actionObject in targets or not targets.isdisjoint(getattr(actionObject, 'synchronizes', None) or ())
+			purgedCount = len(self.channelAccessQueue.purge(isTarget))
+			for lane in self.lanes.values():
+				for actionObject in lane.purge(isTarget):
+					self.finishAction()
+					purgedCount += 1
+			return purgedCount
+		
+		class channelLane(object):
+			'''Grants channel access to the actionObjects of one node in order, with up to pipelineDepth holding the lane at once.
+			
+			Each of pipelineDepth threads takes a turn granting access to the next actionObject in the lane. The turn passes
+			on once that actionObject has transmitted, or has finished with the channel, whichever comes first.
+			
+			The channelAccess thread never blocks on a full lane, as every other node would then wait behind this one.
+			actionObjects which arrive while the lane is full wait in its overflow, in order, and are moved into the lane
+			as it makes room. The channelPriority thread stops passing on actionObjects for a node whose lane is full, so
+			the overflow only takes what was already on its way.'''
+			def __init__(self, channelAccess, pipelineDepth = 1, queueSettings = None, priorityWeights = None):
+				self.channelAccess = channelAccess
+				self.laneQueue = priorityClassQueue(core.priorityClasses, priorityWeights, **(queueSettings or {}))
+				self.overflow = collections.deque()	#actionObjects which arrived while the lane was full, in order
+				self.overflowLock = threading.Lock()	#held while actionObjects are put into the lane
+				self.held = False	#set by the channelPriority thread when it holds back an actionObject because the lane is full
+				self.turn = threading.Lock()	#held by the thread whose actionObject has been granted access but hasn't yet transmitted
+				self.turnHolder = None	#the actionObject holding the turn
+				self.turnLock = threading.Lock()
+				self.threads = []
+				for threadNumber in range(max(pipelineDepth, 1)):
+					laneThread = threading.Thread(target = self.run)
+					laneThread.daemon = True
+					laneThread.start()
+					self.threads += [laneThread]
+			
+			def run(self):
+				while True:
+					self.turn.acquire()
+					try:
+						actionObject = self.getActionObject()	#blocks until the node's next action object arrives
+					except queueClosed:	#the interface has been closed
+						self.turn.release()	#so that the other threads of the lane can stop too
+						return
+					with self.turnLock: self.turnHolder = actionObject
+					actionObject.transmitCallback = self.passTurn
+					try:
+						self.channelAccess.grantAccess(actionObject)
+					finally:
+						self.passTurn(actionObject)
+						actionObject.finish()	#after the turn has passed, as a recycled actionObject may be granted access again
+			
+			def stop(self, timeout = None):
+				'''Stops the threads of the lane, waiting for up to timeout seconds for each. actionObjects left in the
+				lane are dropped.'''
+				self.laneQueue.close()
+				for laneThread in self.threads: laneThread.join(timeout)
+			
+			def passTurn(self, actionObject):
+				'''Lets the next actionObject in the lane be granted access, if actionObject holds the turn.'''
+				with self.turnLock:
+					if self.turnHolder is not actionObject: return
+					self.turnHolder = None
+				actionObject.transmitCallback = None
+				self.turn.release()
+			
+			def getActionObject(self):
+				actionObject = self.laneQueue.get()
+				if self.overflow or self.held: self.refill()
+				return actionObject
+			
+			def putActionObject(self, actionObject):
+				'''Puts actionObject into the lane, or into the overflow if the lane is full, without blocking.'''
+				with self.overflowLock:
+					if not self.overflow and not self.laneQueue.isFull(actionObject.priority):
+						self.laneQueue.put(actionObject, actionObject.priority, block = False)	#only put under the lock, so there is still room
+					else: self.overflow.append(actionObject)
+			
+			def refill(self):
+				'''Moves actionObjects from the overflow into the lane while there is room, and lets channelPriority pass on more.'''
+				with self.overflowLock:
+					while self.overflow and not self.laneQueue.isFull(self.overflow[0].priority):
+						actionObject = self.overflow.popleft()
+						self.laneQueue.put(actionObject, actionObject.priority, block = False)
+				if self.held:
+					self.held = False
+					self.channelAccess.interface.channelPriority.notify()
+			
+			def isFull(self, priority):
+				'''Returns True if an actionObject of priority wouldn't fit in the lane.'''
+				return bool(self.overflow) or self.laneQueue.isFull(priority)
+			
+			def purge(self, test):
+				'''Takes every actionObject for which test(actionObject) is True out of the lane and its overflow, and returns them.'''
+				with self.overflowLock:
+					purged = self.laneQueue.purge(test)
+					for actionObject in list(self.overflow):
+						if test(actionObject):
+							self.overflow.remove(actionObject)
+							purged += [actionObject]
+				return purged
+			
+			def report(self):
+				'''Returns the report of the lane queue, along with the depth of the overflow.'''
+				report = self.laneQueue.report()
+				report['overflow'] = len(self.overflow)
+				return report
+		
+		class expressLane(channelLane):
+			'''Grants channel access to the actionObjects of the express classes, from any node, once each is released.
+			
+			actionObjects are taken in order of their priority class, and then in the order they were committed. They are
+			counted as outstanding once released, so that a multicast actionObject waits for them as it does for the lanes.'''
+			def getActionObject(self):
+				actionObject = self.laneQueue.get()
+				actionObject.waitForRelease()	#express actionObjects are usually committed and released together
+				self.channelAccess.startAction()
+				return actionObject
+			
+			def putActionObject(self, actionObject):
+				'''Puts actionObject into the lane, holding up the committing thread while the lane is full.'''
+				self.laneQueue.put(actionObject, actionObject.priority)
 	
 	class channelPriorityThread(threading.Thread):
-		'''Releases actionObjects to the channelAccessQueue, and when necessary first serializes actionSets into a series of action objects.'''
+		'''Releases actionObjects to the channelAccessQueue, and when necessary first serializes actionSets into a series of action objects.
+		
+		actionObjects and actionSets are queued by priority class, and wait in the queue until they are released. Each
+		keeps its place among the actionObjects of its class which go to the same nodes, but can go ahead of unreleased
+		actionObjects to other nodes, so that a move waiting to be released by a motion planner doesn't hold up requests
+		to unrelated nodes. An actionSet keeps its place on every node it moves, and a multicast actionObject on every node.
+		Of the actionObjects which are free to go, the one of the highest priority class is passed on first.
+		
+		The time each actionObject spends released but held up behind another is recorded as its blockedTime.'''
 		
 		def __init__(self, interface):
 			threading.Thread.__init__(self)
 			self.interface = interface
-			self.channelPriorityQueue = Queue.Queue()
-			
+			self.channelPriorityQueue = priorityClassQueue(core.priorityClasses, interface.priorityWeights, **interface.queueSettings['channelPriority'])
+			self.changed = threading.Condition()	#notified when an actionObject is queued or released
+			self.blockedSince = {}	#{actionObject: time it was first found released but held up}
+			self.releasedCount = 0
+			self.blockedCount = 0	#actionObjects which were held up behind another
+			self.blockedTime = 0.0
+			self.maxBlockedTime = 0.0
+			self.stopped = False	#set when the interface is closed
+		
 		def run(self):
 			while True:
-				priorityQueueState, actionObject = self.getActionObject()	#get the next actionObject or actionSet from the queue.
-				if priorityQueueState:
-					while not actionObject.isReleased():	#wait for actionObject or actionSet to be released
-						time.sleep(0.0005)
-					for thisActionObject in self.serialize(actionObject): 
-						self.interface.channelAccess.putActionObject(thisActionObject) #transfer action object to the channel access thread.
-				time.sleep(0.0005)
+				actionObject = self.getReleasedActionObject()	#blocks until an actionObject or actionSet has been queued and released
+				if actionObject == None: return	#the interface has been closed
+				if activity.enabled:
+					activity.wakeup('channelPriority')
+					readyTime = max(actionObject.commitTime, actionObject.releaseTime)	#committed and released
+				for thisActionObject in self.serialize(actionObject):
+					if activity.enabled: thisActionObject.readyTime = readyTime
+					if trace.enabled: trace.stamp(thisActionObject, 'dequeue')
+					if actionObject._type_ == 'transaction': thisActionObject.priority = actionObject.priority	#so that the members keep their order in every queue
+					self.interface.channelAccess.putActionObject(thisActionObject) #transfer action object to the channel access thread.
+		
+		def getReleasedActionObject(self):
+			'''Takes the next actionObject or actionSet which is free to go from the queue, blocking until there is one.'''
+			channelPriorityQueue = self.channelPriorityQueue
+			with self.changed:
+				while True:
+					if self.stopped: return None
+					now = time.time()
+					releasedObjects = {}	#{priority class: the first actionObject of the class which is free to go}
+					for priority in channelPriorityQueue.classes:
+						releasedObject = self.findReleased(channelPriorityQueue.peek(priority), now)
+						if releasedObject != None: releasedObjects[priority] = releasedObject
+					if releasedObjects:
+						priority = channelPriorityQueue.choose([priority for priority in channelPriorityQueue.classes if priority in releasedObjects])
+						actionObject = releasedObjects[priority]
+						channelPriorityQueue.remove(actionObject, priority)
+						self.recordRelease(actionObject, now)
+						return actionObject
+					self.changed.wait()
+		
+		def findReleased(self, queuedObjects, now):
+			'''Returns the first of queuedObjects which is released and isn't behind an earlier one to the same nodes, or None.
+			
+			queuedObjects which are released but held up are noted with the time they were first found to be.'''
+			heldNodes = set()	#nodes of the earlier queuedObjects
+			allHeld = False	#an earlier multicast actionObject holds every node
+			for queuedObject in queuedObjects:
+				nodes = self.getNodes(queuedObject)
+				if nodes == None: isHeld = allHeld or bool(heldNodes)
+				else: isHeld = allHeld or not heldNodes.isdisjoint(nodes)
+				if queuedObject.isReleased():
+					if not isHeld and not self.laneIsFull(queuedObject, nodes): return queuedObject
+					if queuedObject not in self.blockedSince: self.blockedSince[queuedObject] = now
+				if nodes == None: allHeld = True
+				else: heldNodes.update(nodes)
+			return None
+		
+		def laneIsFull(self, actionObject, nodes):
+			'''Returns True if the lane of any of nodes is full, in which case actionObject waits here rather than in channelAccess.
+			
+			The lane is told, so that it notifies this thread once it makes room.'''
+			if nodes == None: return False	#multicast actionObjects are granted access by the channelAccess thread itself
+			lanes = self.interface.channelAccess.lanes
+			for node in nodes:
+				lane = lanes.get(node)
+				if lane != None and lane.isFull(actionObject.priority):
+					lane.held = True
+					if lane.isFull(actionObject.priority): return True	#checked again, in case the lane made room before it was told
+			return False
+		
+		def getNodes(self, actionObject):
+			'''Returns the virtual nodes among which actionObject must keep its place, or None for every node.'''
+			if actionObject._type_ == 'actionObject':
+				if actionObject.mode == 'multicast': return None
+				return [actionObject.virtualNode]
+			if actionObject._type_ == 'actionSet':
+				nodes = []
+				for member in actionObject.actionObjects:
+					if member._type_ == 'actionSequence': nodes += [thisActionObject.virtualNode for thisActionObject in member.actionObjects]
+					else: nodes += [member.virtualNode]
+				return nodes
+			if actionObject._type_ == 'transaction':
+				nodes = []
+				for member in actionObject.actionObjects:
+					memberNodes = self.getNodes(member)
+					if memberNodes == None: return None
+					nodes += memberNodes
+				return nodes
+			return None
+		
+		def recordRelease(self, actionObject, now):
+			blockedSince = self.blockedSince.pop(actionObject, None)
+			self.releasedCount += 1
+			if blockedSince != None:
+				actionObject.blockedTime = now - blockedSince
+				self.blockedCount += 1
+				self.blockedTime += actionObject.blockedTime
+				self.maxBlockedTime = max(self.maxBlockedTime, actionObject.blockedTime)
+				if activity.enabled: activity.hop('blocked', blockedSince)
+		
+		def report(self):
+			'''Returns the number of actionObjects passed on, and of those held up behind another, with their blocked times in seconds.'''
+			with self.changed:
+				return {'released':self.releasedCount, 'blocked':self.blockedCount, 'blockedTime':self.blockedTime,
+						'meanBlockedTime':self.blockedTime/max(self.blockedCount, 1), 'maxBlockedTime':self.maxBlockedTime}
+		
+		def notify(self):
+			with self.changed:
+				self.changed.notify()
+		
+		def stop(self, timeout = None):
+			'''Stops the thread, waiting for up to timeout seconds for it to finish. Whatever is left in the queue is dropped.'''
+			with self.changed:
+				self.stopped = True
+				self.changed.notify()
+			self.join(timeout)
+		
+		def cancel(self, actionObject):
+			'''Takes actionObject out of the queue, unless it has already been passed on. Returns True if it was taken out.'''
+			with self.changed:
+				try:
+					self.channelPriorityQueue.remove(actionObject, actionObject.priority)
+				except ValueError:	#already passed on to the channelAccess thread
+					return False
+				self.blockedSince.pop(actionObject, None)
+				return True
+		
+		def purge(self, targets):
+			'''Takes every queued item in targets out of the queue, whether or not it has been released. Returns the number taken out.'''
+			with self.changed:
+				purged = self.channelPriorityQueue.purge(lambda actionObject: actionObject in targets)
+				for actionObject in purged: self.blockedSince.pop(actionObject, None)
+				return len(purged)
 		
 		def serialize(self, actionObject):
 			'''serializes actionSets into actionObjects.'''
@@ -507,32 +1509,48 @@ class gestaltInterface(baseInterface):
 				if actionObject.actionObjects[0]._type_ == 'actionObject':
 					#actionSet contains actionObjects rather than actionSequences
 					actionObjectStream = [thisActionObject for thisActionObject in actionObject.actionObjects]
-					actionObjectStream += [actionObject.actionObjects[0].virtualNode.syncRequest()]	#generates a syncRequest.
-					return actionObjectStream
+					syncRequest = actionObject.actionObjects[0].virtualNode.syncRequest()	#generates a syncRequest.
+					syncRequest.synchronizes = actionObjectStream[:]	#so that it is purged with them
+					return actionObjectStream + [syncRequest]
 				if actionObject.actionObjects[0]._type_ == 'actionSequence':
 					actionObjectStream = []
 					actionSequences = [actionSequence.actionObjects for actionSequence in actionObject.actionObjects]
 					syncLists = zip(*actionSequences)	#takes parallel slices of actionObjects in the provided actionSequences.
 					for syncList in syncLists:
 						actionObjectStream += syncList
-						actionObjectStream += [syncList[0].virtualNode.syncRequest()]
+						syncRequest = syncList[0].virtualNode.syncRequest()
+						syncRequest.synchronizes = syncList
+						actionObjectStream += [syncRequest]
 					return actionObjectStream
+			if actionObject._type_ == 'transaction':
+				actionObjectStream = []
+				for member in actionObject.actionObjects: actionObjectStream += self.serialize(member)
+				return actionObjectStream
 			return []
 					
 			
-		def getActionObject(self):
-			try:
-				return True, self.channelPriorityQueue.get()
-			except:
-				return False, None					
-
 		def putActionObject(self, actionObject):
-			self.channelPriorityQueue.put(actionObject)
+			actionObject.releaseCallback = self.notify
+			self.channelPriorityQueue.put(actionObject, actionObject.priority)
+			self.notify()
 			return True
 			
 #----UTILITY CLASSES---------------
 class CRC():
-	'''Generates CRC bytes and checks CRC validated packets.'''
+	'''Generates CRC bytes and checks CRC validated packets.
+	
+	Packets can be lists of numbers, or bytes-like objects: bytearrays (including packets.packet), strings, or memoryviews.
+	
+	Many packets can be handled at once with generateBatch and batch. Equal-length packets in a large batch, at least
+	batchThreshold of them, are processed a byte position at a time across the whole batch rather than a packet at a
+	time. The packet sets which the interface builds are far smaller than this, and a bootloader sends each page of a
+	firmware image in its own request, waiting on the node to write it, so this only pays for a caller which has many
+	packets in hand at once. Because the CRC is linear, the CRC of a packet is the XOR of the contributions of each of its bytes, and the
+	contribution of a byte depends only on its value and its distance from the end of the packet. The contributions of
+	one byte position in every packet are looked up with a single str.translate, and XORed into the running CRCs of the
+	whole batch as one long integer.'''
+	batchThreshold = 32	#smallest group of equal-length packets which is processed a byte position at a time
+	
 	def __init__(self):
 		self.polynomial = 7		#CRC-8: ATM=7, Dallas-Maxim = 49
 		self.crcTableGen()
@@ -551,42 +1569,114 @@ class CRC():
 		self.crcTable = []
 		for i in range(256):
 			self.crcTable += [self.calculateByteCRC(i)]
+		self.positionTables = [None, ''.join([chr(crc) for crc in self.crcTable])]	#see positionTable
 	
-	def __call__(self, packet):
-		'''Generates CRC for an input packet.'''
-		#INITIALIZE CRC ALGORITHM
-		crc = 0
-		crcByte = 0
+	def positionTable(self, distance):
+		'''Returns a translation table from a byte value to its contribution to the CRC, when it is distance bytes from the end.
 		
-		#CALCULATE CRC AND CONVERT preOutput BYTES TO CHR
-		output = []
+		The table for a distance of one is the CRC table itself. Each further byte which follows passes the contribution thru
+		the CRC table once more, so each table is the previous one translated thru the CRC table.'''
+		while len(self.positionTables) <= distance:
+			self.positionTables += [self.positionTables[-1].translate(self.positionTables[1])]
+		return self.positionTables[distance]
+	
+	def generate(self, packet):
+		'''Returns the CRC of an input packet.'''
+		if type(packet) == str or type(packet) == memoryview: packet = bytearray(packet)	#these iterate as characters
+		crc = 0
+		crcTable = self.crcTable	#local lookups are faster than attribute lookups
 		for byte in packet:
-			crcByte = byte^crc
-			crc = self.crcTable[crcByte]
-			output += [byte]
-		output += [crc]	#write crc to output
-		return output	#NOTE: OUTPUT HAS BEEN CONVERTED TO A STRING
+			crc = crcTable[byte^crc]
+		return crc
+	
+	def generateBatch(self, packets):
+		'''Returns a list of the CRCs of a list of input packets.'''
+		crcs = [None]*len(packets)
+		lengthGroups = {}	#{packet length: [indices of packets with this length]}
+		for index, packet in enumerate(packets):
+			lengthGroups.setdefault(len(packet), []).append(index)
+		for packetLength, indices in lengthGroups.iteritems():
+			if len(indices) < self.batchThreshold or packetLength == 0:
+				for index in indices: crcs[index] = self.generate(packets[index])
+				continue
+			groupBytes = str(bytearray().join([bytearray(packets[index]) for index in indices]))
+			groupCRC = 0	#running CRCs of the whole group, one per byte
+			for position in range(packetLength):
+				column = groupBytes[position::packetLength].translate(self.positionTable(packetLength - position))	#every packet's contribution
+				groupCRC ^= int(binascii.hexlify(column), 16)
+			for index, crc in zip(indices, bytearray(binascii.unhexlify('%0*x' % (2*len(indices), groupCRC)))):
+				crcs[index] = crc
+		return crcs
+	
+	def __call__(self, packet):
+		'''Generates CRC for an input packet.
+		
+		A bytearray packet has its CRC appended in place, and is returned. Any other packet is copied into a new list.'''
+		crc = self.generate(packet)
+		if isinstance(packet, bytearray):
+			packet.append(crc)	#write crc to packet
+			return packet
+		if type(packet) == list: return packet + [crc]	#write crc to output
+		return list(bytearray(packet)) + [crc]
+	
+	def batch(self, packets):
+		'''Generates CRCs for a list of input packets, and returns the list of packets with their CRCs.'''
+		outputPackets = []
+		for packet, crc in zip(packets, self.generateBatch(packets)):
+			if isinstance(packet, bytearray):
+				packet.append(crc)
+				outputPackets += [packet]
+			elif type(packet) == list:
+				outputPackets += [packet + [crc]]
+			else:
+				outputPackets += [list(bytearray(packet)) + [crc]]
+		return outputPackets
 	
-	def validate(self, packet): #NOTE: ASSUMES INPUT IS A LIST OF NUMBERS
+	def validate(self, packet):
 		'''Checks CRC byte against packet.'''
+		if type(packet) == str or type(packet) == memoryview: packet = bytearray(packet)
 		crc = 0
-		crcByte = 0
-		packetLength = len(packet)
-		
-		for char in packet[0:packetLength]:
-			crcByte = char^crc
-			crc = self.crcTable[crcByte]
-		
+		crcTable = self.crcTable
+		for byte in packet:	#same as generate, without the added call on every received packet
+			crc = crcTable[byte^crc]
 		if crc != 0:	return False	#CRC doesn't match
 		else:	return True	#CRC matches
 	
 #----METHODS-----------------------
 def serialize(packet):
-	'''Converts packet into a string for transmission over a serial port.'''
-	if type(packet) == list:
+	'''Converts packet into a string or bytearray for transmission over a serial port.'''
+	if isinstance(packet, bytearray):	#includes packets.packet
+		return packet
+	elif type(packet) == list:
 		return ''.join([chr(byte) for byte in packet])		
 	elif type(packet) == str:
 		return packet
 	else:
-		print "Error: Packet must be either a list or a string."
-		return False
\ No newline at end of file
+		print "Error: Packet must be a list, bytearray, or string."
+		return False
+
+def framePackets(buffer, CRC, deliver, position = 0):
+	'''Hands every complete packet found in buffer to deliver, minus its CRC, and returns the number of bytes consumed.
+	
+	Scanning begins at position. Bytes preceding a start byte, as well as the start byte of any packet which fails its
+	CRC check, are consumed. An incomplete packet at the end of the buffer is left for the next call. Used by the
+	receiver of gestaltInterface, and by the emulated network of gestalt.emulators.'''
+	bufferLength = len(buffer)
+	while position < bufferLength:
+		if buffer[position] not in packetStartBytes:
+			position += 1
+			continue
+		if bufferLength - position < packetHeaderLength: break	#wait for the length byte
+		packetLength = buffer[position + 4]	#length byte counts every byte but the CRC
+		if packetLength < packetHeaderLength:	#can't be a real packet
+			position += 1
+			continue
+		if bufferLength - position <= packetLength: break	#wait for the rest of the packet
+		packet = buffer[position:position + packetLength + 1]	#the only copy made of a received packet
+		if CRC.validate(packet):
+			del packet[-1]	#minus CRC
+			deliver(packet)
+			position += packetLength + 1
+		else:
+			position += 1	#resynchronize on the next start byte
+	return position
@@ -295,6 +295,11 @@ class baseVirtualNode(object):
 	def init(self, **kwargs):
 		'''Dummy initializer for terminal child class.'''
 		pass
+	
+	@property
+	def nodes(self):
+		'''The nodes which a call on this node reaches, as for a compoundNode.'''
+		return [self]
 		
 		
 class baseSoloIndependentNode(baseVirtualNode):
@@ -303,8 +308,11 @@ class baseSoloIndependentNode(baseVirtualNode):
 		
 class baseGestaltNode(baseVirtualNode):
 	'''base class for all gestalt nodes'''
+	pipelineDepth = 1	#number of requests which can wait on a response from this node at once. See interfaces.gestaltInterface.channelAccessThread.
+	
 	def _init(self, **kwargs):
 		self.bindPort = self.bindPort(self)	#create binder function for node
+		self.rttEstimator = utilities.rttEstimator()	#round trip times of requests to this node, which set its retransmission timeout
 
 		self._initParameters()
 		self.initParameters()
@@ -314,7 +322,7 @@ class baseGestaltNode(baseVirtualNode):
 		self.initPackets()
 		self._initPorts()
 		self.initPorts()
-		#//FIX// need to make response flags specific to ports, otherwise packets can be recognized cross-port
+		#responses are matched to requests by the mailboxes of each port, so this flag isn't used to wait on responses
 		self.responseFlag = threading.Event()	#this object is used for nodes to wait for a response
 		
 	def _initParameters(self):
@@ -360,6 +368,7 @@ class baseGestaltNode(baseVirtualNode):
 		def __call__(self, port, outboundFunction = None, outboundPacket = None, inboundFunction = None, inboundPacket = None):
 			newResponseFlag = threading.Event()
 			packetHolder = packets.packetHolder()
+			mailboxes = core.mailboxRegistry()	#matches responses to the requests made on this port
 			
 			#---CREATE FUNCTION INSTANCES AND UPDATE ROUTE DICTIONARIES---				
 			if outboundFunction != None:
@@ -368,9 +377,12 @@ class baseGestaltNode(baseVirtualNode):
 				if type(outboundFunction) == type: setattr(self.virtualNode, outboundFunction.__name__, outboundFunction(virtualNode = self.virtualNode, 	#create function instance
 																														packetSet = packetSet,	#define packet format
 																														responseFlag = newResponseFlag,	#creates a common response flag for outbound and inbound functions
-																														packetHolder = packetHolder)) #creates a common packet holder for outbound and inbound functions
+																														packetHolder = packetHolder, #creates a common packet holder for outbound and inbound functions
+																														mailboxes = mailboxes))	#creates common mailboxes for outbound and inbound functions
 				outboundFunction = getattr(self.virtualNode, outboundFunction.__name__)	#update outboundFuncton pointer in event that new instance was created
 				self.outPorts.update({outboundFunction:port})	#bind port to outbound instance
+				outboundFunction.port = port	#looked up by each actionObject the outbound instance creates
+				mailboxes = outboundFunction.mailboxes	#in event that the outbound function was already instantiated
 				
 			if inboundFunction != None:
 				if inboundPacket != None: packetSet = packets.packetSet(inboundPacket)	#gives the inbound function a packetSet initialized with the provided packet as a template
@@ -378,14 +390,16 @@ class baseGestaltNode(baseVirtualNode):
 				if type(inboundFunction) == type: setattr(self.virtualNode, inboundFunction.__name__, inboundFunction(virtualNode = self.virtualNode,	#create function instance
 																														packetSet = packetSet,	#define packet format
 																														responseFlag = newResponseFlag,	#creates a common response flag for outbound and inbound functions
-																														packetHolder = packetHolder)) #creates a common packet holder for outbound and inbound functions
+																														packetHolder = packetHolder, #creates a common packet holder for outbound and inbound functions
+																														mailboxes = mailboxes))	#creates common mailboxes for outbound and inbound functions
 				inboundFunction = getattr(self.virtualNode, inboundFunction.__name__)
 				self.inPorts.update({port:inboundFunction})	#bind port to inbound instance
 			else:	#create a default inbound function which will handle incoming packets.
 				if inboundPacket != None: packetSet = packets.packetSet(inboundPacket)	#use provided inbound packet
 				else: packetSet = packets.packetSet(packets.packet(template=[])) #create default blank packet
 				inboundFunction = functions.serviceRoutine(virtualNode = self.virtualNode, packetSet = packetSet,
-															responseFlag = newResponseFlag, packetHolder = packetHolder)
+															responseFlag = newResponseFlag, packetHolder = packetHolder, mailboxes = mailboxes)
+				if outboundFunction != None: inboundFunction.getResponseTag = outboundFunction.getResponseTag	#responses are tagged as the outbound function defines
 				self.inPorts.update({port:inboundFunction})
 
 
@@ -593,25 +607,72 @@ class baseStandardGestaltNode(baseGestaltNode):
 					notice(self.virtualNode, 'TIMEOUT WAITING FOR BUTTON PRESS')
 
 	class identifyRequest(functions.serviceRoutine):
-		class actionObject(core.actionObject):
-			def init(self):
-				self.commitAndRelease()	#commit self immediately
-				self.waitForChannelAccess()
-				self.transmit()
-				time.sleep(4)	#roughly the time that the LED is on.	
+		class actionObject(core.commandObject):
+			settleTime = 4	#roughly the time that the LED is on.
 				
 	class resetRequest(functions.serviceRoutine):
-		class actionObject(core.actionObject):
-			def init(self):
-				self.commitAndRelease()	#commit self immediately
-				self.waitForChannelAccess()
-				self.transmit()
-				time.sleep(0.1)	#give time for watchdog timer to reset
+		class actionObject(core.commandObject):
+			settleTime = 0.1	#give time for watchdog timer to reset
+
+
+class baseBufferedStepperNode(baseStandardGestaltNode):
+	'''base class for stepper nodes which queue their moves in a ring buffer, like the 086-005a.
+	
+	A spin request is only sent once spinCredits shows a free slot in the buffer. The credits are refreshed from the
+	spin status packet of each spin response and spin status response, whose read and write positions give the number
+	of moves in the buffer. The terminal class binds spinResponse and spinStatusResponse as the inbound functions of its
+	spin and spin status ports, and calls waitForSpinCredit before sending each spin request.
+	
+	The read and write positions are equal both when the buffer is empty and when every slot is full. The firmware
+	doesn't report which, so it is told from the rest of the packet. A spin response is sent once a move has been
+	queued, or refused by a full buffer, so the buffer can't be empty. A spin status response can only show a full
+	buffer while a move is under way, which holds for a firmware that keeps each move in the buffer until it has run,
+	as emulators.stepperNodeEmulator does. A firmware that always keeps a slot free, so that equal positions only ever
+	mean empty, should set fillsEverySlot to False.'''
+	spinBufferSize = 32	#slots in the node's move buffer, which must match the firmware
+	fillsEverySlot = True	#False if the firmware keeps a slot of the buffer free
+	creditPollInterval = 0.05	#seconds between spin status queries while the move buffer is full
+	
+	def _initParameters(self):
+		baseStandardGestaltNode._initParameters(self)
+		capacity = self.spinBufferSize if self.fillsEverySlot else self.spinBufferSize - 1
+		self.spinCredits = utilities.bufferCredits(capacity)	#free slots in the move buffer, refreshed by spin and status responses
+	
+	def getOccupiedSlots(self, statusPacket, spinResponse = False):
+		'''Returns the number of moves in the move buffer, from a spin status packet.'''
+		occupied = (statusPacket['writePosition'] - statusPacket['readPosition']) % self.spinBufferSize
+		if occupied == 0 and self.fillsEverySlot and (spinResponse or statusPacket['stepsRemaining']): occupied = self.spinBufferSize
+		return occupied
+	
+	def refreshSpinCredits(self):
+		'''Asks the node for the state of its move buffer, which refreshes spinCredits.
+		
+		Returns False without asking if the status query would wait in the channel behind the spin request asking for it.'''
+		if self.spinStatusRequest.actionObject.priority not in getattr(self.interface, 'expressClasses', ()): return False
+		self.spinStatusRequest()
+		return True
+	
+	def waitForSpinCredit(self):
+		'''Waits for a free slot in the move buffer, and spends it on a spin request which is about to be sent.'''
+		self.spinCredits.acquire(self.creditPollInterval, self.refreshSpinCredits)
+	
+	class spinResponse(functions.serviceRoutine):
+		'''Refreshes the credits of the move buffer from the response to a spin request.'''
+		def receive(self, packet):
+			self.virtualNode.spinCredits.refresh(self.virtualNode.getOccupiedSlots(packet, spinResponse = True), answered = True)
+			self.responseFlag.set()
+	
+	class spinStatusResponse(functions.serviceRoutine):
+		'''Refreshes the credits of the move buffer from the response to a spin status request.'''
+		def receive(self, packet):
+			self.virtualNode.spinCredits.refresh(self.virtualNode.getOccupiedSlots(packet))
+			self.responseFlag.set()
+
 
 class compoundNode(object):
 	'''A compound node helps distribute and synchronize function calls across multiple nodes.'''
 	def __init__(self, *nodes):
-		self.nodes = nodes
+		self.nodes = nodes	#the nodes which each call is distributed to
 		self.nodeCount = len(self.nodes)
 		self.name = "[" + ''.join([str(node.name) + "," for node in nodes])[:-1] + "]"
 		interfaces = [node.interface.Interface for node in nodes]	#nodes have an interface shell
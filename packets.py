@@ -1,4 +1,5 @@
 #----IMPORTS------------
+import struct
 from gestalt import utilities
 #--PACKETS--------------
 #
@@ -59,7 +60,7 @@ class pList(packetToken):
 			print "WARNING in pList: Expected list, got a string."
 			inputPhrase = [ord(char) for char in inputPhrase]
 			
-		if type(inputPhrase) != list and type(inputPhrase) != packet:
+		if type(inputPhrase) != list and not isinstance(inputPhrase, bytearray):	#packets are bytearrays
 			print "ERROR in pList: Must provide either a list or a string."
 			return False
 		
@@ -72,9 +73,9 @@ class pList(packetToken):
 		if self.numBytes:
 			if len(inputPacket)<self.numBytes:
 				print ""
-			return {self.keyName:inputPacket[:self.numBytes]}, inputPacket[self.numBytes:]
+			return {self.keyName:list(inputPacket[:self.numBytes])}, inputPacket[self.numBytes:]	#a list, whatever the packet is held in
 		else:
-			return {self.keyName:inputPacket}, []
+			return {self.keyName:list(inputPacket)}, []
 	
 #passes thru lists, and converts strings into lists
 class pString(packetToken):
@@ -111,31 +112,165 @@ class pString(packetToken):
 		return {self.keyName:''.join([chr(char) for char in inputSlice])}, outputSlice
 
 
-class packet(list): 	#packets are represented as a list subclass with templating abilities
+class packet(bytearray): 	#packets are represented as a bytearray subclass with templating abilities
+	'''A packet of bytes, along with the template used to encode and decode it.
+	
+	Packets hold their bytes in a bytearray rather than as a list of integers, so that a packet can be encoded,
+	extended with a CRC, and written to the serial port without ever being copied into another representation.
+	Indexing and iterating over a packet return integers, as they did when packets were lists.'''
 	def __init__(self, template, value = None):
-		if type(template) == list: self.template = template
+		if type(template) == list:
+			self.template = template
+			self.codec = packetCodec(template)	#compiled once per template, and shared by all packets spawned from it
 		if type(template) == packet: #inherit packet from provided packet
 			self.template = template.template
+			self.codec = template.codec
 		if value == None: value = []
-		list.__init__(self, value)
+		bytearray.__init__(self, value)
 	
 	def __call__(self, inputDict):
+		encodedPacket = packet(self, self.codec.size)	#zero-filled, and packed in place by the codec
+		if self.codec.encode(inputDict, encodedPacket): return encodedPacket
+		return self.encodeTokens(inputDict)	#template or input isn't supported by the compiled codec
+	
+	def spawn(self, outputList):
+		return packet(self, outputList)
+	
+	def decode(self, decodeList = None):
+		'''Decodes a list, bytearray, or memoryview of bytes into a dictionary, using the packet template.'''
+		if decodeList == None: decodeList = self
+		decodedDict = self.codec.decode(decodeList)
+		if decodedDict == None:
+			if type(decodeList) == memoryview: decodeList = bytearray(decodeList)	#tokens expect integers when indexed
+			return self.decodeTokens(decodeList)
+		return decodedDict
+	
+	def encodeTokens(self, inputDict):
+		'''Encodes inputDict by calling each token in the template in turn.'''
 		templatedList = []
 		for token in self.template:	#build output list
 			templatedList += token(inputDict)
 		outputList =[len(templatedList) if type(outputItem)==pLength else outputItem for outputItem in templatedList]
-		return packet(self.template, outputList)
-	
-	def spawn(self, outputList):
-		return packet(self.template, outputList)
+		return packet(self, outputList)
 	
-	def decode(self, decodeList = None):
-		if decodeList == None: decodeList = list(self)
+	def decodeTokens(self, decodeList):
+		'''Decodes decodeList by passing it thru each token in the template in turn.'''
 		decodedDict = {}
 		for token in self.template:
 			dictFrag, decodeList = token.decode(decodeList)
 			decodedDict.update(dictFrag)
 		return decodedDict
+
+
+class packetCodec(object):
+	'''Encodes and decodes packets using a struct format compiled from the packet template.
+	
+	Every fixed-size token in the template maps onto a fixed offset in the packet. Integers are packed into and unpacked
+	from the packet's bytearray with a single struct call, and fixed-size pLists and pStrings are copied into or sliced
+	out of their offsets directly. A variable-length pList or pString is supported as the final token, and is
+	appended to or sliced from the end.
+	
+	Templates which can't be compiled (integers of unusual widths, variable-length tokens followed by other tokens,
+	or custom tokens) leave the codec disabled, and encode and decode fail. They also fail when the input doesn't
+	match the template, so that the caller can fall back on the token-by-token path, which reports the mismatch to
+	the user.'''
+	integerCodes = {1:'B', 2:'H', 4:'I', 8:'Q'}
+	
+	def __init__(self, template):
+		self.integerKeys = []	#keyNames of the integer fields, in the order they are packed
+		self.integerSizes = []	#numBytes of each integer field
+		self.sequences = []	#a list of (token type, keyName, offset, numBytes) tuples for fixed-size pLists and pStrings
+		self.tail = None	#(token type, keyName) for a variable-length final token
+		self.lengthOffset = None	#byte offset of the pLength field, if any
+		self.format = None	#packs the integers, skipping over everything else
+		self.integerFormat = None	#unpacks the integers, ending with the last of them
+		self.size = 0	#size of the fixed-size portion of the packet
+		self.enabled = self.compile(template)
+	
+	def compile(self, template):
+		formatString = '<'
+		for token in template:
+			tokenType = type(token)
+			if self.tail: return False	#only the final token can be variable-length
+			if tokenType == pInteger:
+				if token.numBytes not in self.integerCodes: return False
+				formatString += self.integerCodes[token.numBytes]
+				self.integerKeys += [token.keyName]
+				self.integerSizes += [token.numBytes]
+			elif tokenType == pLength:
+				self.lengthOffset = struct.calcsize(formatString)
+				formatString += 'x'
+			elif tokenType == pList or tokenType == pString:
+				if token.numBytes:
+					self.sequences += [(tokenType, token.keyName, struct.calcsize(formatString), token.numBytes)]
+					formatString += str(token.numBytes) + 'x'
+				else:
+					self.tail = (tokenType, token.keyName)
+			else:
+				return False
+		self.format = struct.Struct(formatString)
+		self.integerFormat = struct.Struct(formatString.rstrip('0123456789x'))	#a decoded list is only converted as far as its integers go
+		self.size = self.format.size
+		return True
+	
+	def encode(self, inputDict, outputPacket):
+		'''Encodes inputDict into outputPacket, which must be a zero-filled bytearray of the codec's size.
+		
+		Returns True if successful, or False if the packet can't be encoded by the codec.'''
+		if not self.enabled: return False
+		try:
+			try:
+				self.format.pack_into(outputPacket, 0, *[inputDict[keyName] for keyName in self.integerKeys])
+			except struct.error:	#negative or non-integer values, or an overflow
+				values = []
+				for keyName, numBytes in zip(self.integerKeys, self.integerSizes):
+					value = int(inputDict[keyName])
+					if value >> (8*numBytes) > 0: return False	#overflow, which the token path reports
+					values += [value & ((1 << 8*numBytes) - 1)]	#negative values are encoded in two's complement
+				self.format.pack_into(outputPacket, 0, *values)
+			for tokenType, keyName, offset, numBytes in self.sequences:
+				value = inputDict[keyName]
+				if not self.validSequence(tokenType, value) or len(value) != numBytes: return False
+				outputPacket[offset:offset + numBytes] = value
+			if self.tail:
+				value = inputDict[self.tail[1]]
+				if not self.validSequence(self.tail[0], value): return False
+				outputPacket.extend(value)
+		except (KeyError, TypeError, ValueError, struct.error):
+			return False
+		if self.lengthOffset != None: outputPacket[self.lengthOffset] = len(outputPacket)
+		return True
+	
+	def validSequence(self, tokenType, value):
+		'''Returns True if value can be encoded by a pList or pString token without being converted.'''
+		if tokenType == pList: return type(value) == list or isinstance(value, bytearray) or type(value) == memoryview
+		return type(value) == str
+	
+	def decode(self, decodeList):
+		'''Returns a dictionary of decoded values, or None if decodeList can't be decoded by the codec.
+		
+		decodeList can be a list, bytearray, or memoryview. pList values are returned as lists of integers, as the token
+		path returns them, and pStrings as strings.'''
+		if not self.enabled or len(decodeList) < self.size: return None	#short packets are left to the token path
+		sequenceList = decodeList	#a list is sliced directly for its sequences, rather than thru the bytearray
+		try:
+			if type(decodeList) == list: decodeList = bytearray(decodeList[:self.integerFormat.size])
+			decodedDict = dict(zip(self.integerKeys, self.integerFormat.unpack_from(decodeList)))
+		except (TypeError, ValueError, struct.error):
+			return None
+		for tokenType, keyName, offset, numBytes in self.sequences:
+			decodedDict[keyName] = self.decodeSequence(tokenType, sequenceList[offset:offset + numBytes])
+		if self.tail:
+			decodedDict[self.tail[1]] = self.decodeSequence(self.tail[0], sequenceList[self.size:])
+		return decodedDict
+	
+	def decodeSequence(self, tokenType, value):
+		if tokenType == pList:
+			if type(value) == list: return value
+			if type(value) == memoryview: return value.tolist()	#copied out of the view in one step
+			return list(value)
+		if type(value) != bytearray: value = bytearray(value)	#slices of a memoryview are views, and must be copied out
+		return str(value)
 		
 class pLength(packetToken):
 	def encode(self, inputDict):
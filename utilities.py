@@ -1,6 +1,12 @@
 import math
 import ast
+import json
 import datetime
+import time
+import threading
+import collections
+import Queue
+import traceback
 
 def notice(source = None, message = ""):
 	''' Sends a notice to the user.
@@ -29,6 +35,606 @@ def notice(source = None, message = ""):
 		else:
 			print str(source) + ": " + str(message)
 
+class activityMonitor(object):
+	'''Measures how often interface and planner threads wake up, and how long packets spend travelling between threads.
+	
+	Measurement is off by default. Threads check the enabled flag before recording anything, so an idle
+	machine pays only that check. Hops are recorded as a count, total, and maximum latency per hop name.'''
+	def __init__(self):
+		self.enabled = False
+		self.lock = threading.Lock()
+		self.reset()
+	
+	def enable(self):
+		'''Clears any previous measurements and starts measuring.'''
+		self.reset()
+		self.enabled = True
+	
+	def disable(self):
+		self.enabled = False
+	
+	def reset(self):
+		self.startTime = time.time()
+		self.wakeups = {}	#{threadName: wakeup count}
+		self.hops = {}	#{hopName: [count, total latency, max latency]}
+	
+	def wakeup(self, threadName):
+		'''Records that threadName has woken up to do some work.'''
+		with self.lock:
+			self.wakeups[threadName] = self.wakeups.get(threadName, 0) + 1
+	
+	def hop(self, hopName, startTime):
+		'''Records the time elapsed since startTime against hopName.'''
+		latency = time.time() - startTime
+		with self.lock:
+			if hopName in self.hops:
+				hopRecord = self.hops[hopName]
+				hopRecord[0] += 1
+				hopRecord[1] += latency
+				if latency > hopRecord[2]: hopRecord[2] = latency
+			else:
+				self.hops[hopName] = [1, latency, latency]
+	
+	def report(self):
+		'''Returns a dictionary of wakeups per second by thread, and hop latencies in seconds by hop.'''
+		elapsedTime = max(time.time() - self.startTime, 1e-9)
+		with self.lock:
+			wakeupRates = dict([(threadName, count/elapsedTime) for threadName, count in self.wakeups.iteritems()])
+			hopLatencies = dict([(hopName, {'count':count, 'mean':total/count, 'max':maximum}) for hopName, (count, total, maximum) in self.hops.iteritems()])
+		return {'elapsedTime':elapsedTime, 'wakeupsPerSecond':wakeupRates, 'hopLatency':hopLatencies}
+
+activity = activityMonitor()	#shared by all interfaces and motion planners. Call activity.enable() to start measuring.
+
+class latencyHistogram(object):
+	'''Counts latencies into buckets whose bounds grow geometrically, bucketsPerOctave to each doubling, from bucketBase seconds.'''
+	def __init__(self, bucketBase = 1e-5, bucketsPerOctave = 4, octaves = 24):
+		self.bucketBase = bucketBase	#upper bound of the first bucket
+		self.bucketsPerOctave = bucketsPerOctave
+		self.buckets = [0]*(bucketsPerOctave*octaves + 1)	#the last bucket also counts every latency beyond it
+		self.count = 0
+		self.total = 0.0
+		self.maximum = 0.0
+	
+	def add(self, latency):
+		if latency <= self.bucketBase: bucket = 0
+		else: bucket = min(int(math.ceil(self.bucketsPerOctave*math.log(latency/self.bucketBase, 2))), len(self.buckets) - 1)
+		self.buckets[bucket] += 1
+		self.count += 1
+		self.total += latency
+		if latency > self.maximum: self.maximum = latency
+	
+	def upperBound(self, bucket):
+		return self.bucketBase*2**(bucket/float(self.bucketsPerOctave))
+	
+	def percentile(self, fraction):
+		'''Returns the upper bound of the bucket in which the latency at fraction of the count falls.'''
+		counted = 0
+		for bucket, count in enumerate(self.buckets):
+			counted += count
+			if counted >= fraction*self.count: return min(self.upperBound(bucket), self.maximum)
+		return self.maximum
+	
+	def report(self):
+		'''Returns the count, mean, median, 99th percentile and max latency, and the counts of the non-empty buckets by upper bound.'''
+		return {'count':self.count, 'mean':self.total/max(self.count, 1), 'median':self.percentile(0.5), 'p99':self.percentile(0.99), 'max':self.maximum,
+				'buckets':[(self.upperBound(bucket), count) for bucket, count in enumerate(self.buckets) if count]}
+
+class latencyTracer(object):
+	'''Traces actionObjects thru their lifecycle, from their creation until they have finished with the channel.
+	
+	Tracing is off by default, and as with the activity monitor each stage checks the enabled flag before recording
+	anything. While tracing, an actionObject is stamped with the time it reaches each of these stages: create, commit,
+	release (by a motion planner, or whoever committed it), dequeue (passed on by the channelPriority thread), grant
+	(granted access to the channel), transmit (its packets handed to the transmit queue), write (its last packet
+	written to the port), response (its response delivered to its mailbox), and complete (finished with the channel).
+	Stages which an actionObject doesn't go thru are left out. A retransmitted actionObject keeps its latest transmit.
+	
+	Once complete, and written if it was transmitted, the time taken to reach each stage from the stage before it is
+	added to histograms kept by node and by service routine, and the latest maxTraces are kept to be exported as a
+	Chrome trace.'''
+	stages = ('create', 'commit', 'release', 'dequeue', 'grant', 'transmit', 'write', 'response', 'complete')
+	
+	def __init__(self, maxTraces = 100000, bucketBase = 1e-5):
+		self.enabled = False
+		self.maxTraces = maxTraces
+		self.bucketBase = bucketBase	#upper bound of the first histogram bucket, in seconds
+		self.lock = threading.Lock()
+		self.reset()
+	
+	def enable(self):
+		'''Clears any previous traces and starts tracing.'''
+		self.reset()
+		self.enabled = True
+	
+	def disable(self):
+		self.enabled = False
+	
+	def reset(self):
+		with self.lock:
+			self.startTime = time.time()
+			self.traces = collections.deque(maxlen = self.maxTraces)	#(node name, service routine name, [(stage, time)] in order)
+			self.nodeStages = {}	#{node name: {stage: latencyHistogram}}
+			self.routineStages = {}	#{service routine name: {stage: latencyHistogram}}
+	
+	def stamp(self, actionObject, stage, stampTime = None):
+		'''Records that actionObject, or every member of an actionSet, actionSequence or transaction, has reached stage.'''
+		if stampTime == None: stampTime = time.time()
+		if actionObject._type_ == 'actionObject':
+			stamps = actionObject.traceStamps
+			if stamps == None: stamps = actionObject.traceStamps = {}
+			stamps[stage] = stampTime
+		else:
+			for member in actionObject.actionObjects: self.stamp(member, stage, stampTime)
+	
+	def written(self, actionObject, writeTime):
+		'''Stamps the write of the latest transmission of actionObject, which is recorded if it has already completed.
+		
+		Called by the transmit thread, which may write the packets of a command after it has finished with the channel.'''
+		with self.lock:
+			self.stamp(actionObject, 'write', writeTime)
+			stamps = actionObject.traceStamps
+			if 'complete' not in stamps or stamps['write'] < stamps.get('transmit', 0): return
+		self.record(actionObject)
+	
+	def complete(self, actionObject):
+		'''Stamps actionObject as complete, and records it unless the write of its latest transmission is still to come.'''
+		stamps = actionObject.traceStamps
+		if stamps == None: return	#created before tracing was enabled
+		with self.lock:
+			stamps['complete'] = time.time()
+			if stamps.get('write', 0) < stamps.get('transmit', 0): return	#recorded once written
+		self.record(actionObject)
+	
+	def record(self, actionObject):
+		'''Adds the time actionObject took to reach each stage to the histograms, and keeps its trace.'''
+		stampedStages = sorted([(stampTime, self.stages.index(stage), stage) for stage, stampTime in actionObject.traceStamps.items()])	#a request may be released before it is committed
+		stampedStages = [(stage, stampTime) for stampTime, index, stage in stampedStages]
+		nodeName, routineName = self.names(actionObject)
+		with self.lock:
+			nodeStages = self.nodeStages.setdefault(nodeName, {})
+			routineStages = self.routineStages.setdefault(routineName, {})
+			for (lastStage, lastTime), (stage, stampTime) in zip(stampedStages[:-1], stampedStages[1:]):
+				for stageHistograms in (nodeStages, routineStages):
+					if stage not in stageHistograms: stageHistograms[stage] = latencyHistogram(self.bucketBase)
+					stageHistograms[stage].add(stampTime - lastTime)
+			self.traces.append((nodeName, routineName, stampedStages))
+	
+	def names(self, actionObject):
+		'''Returns the names of the node and of the service routine under which actionObject is traced.
+		
+		Multicast actionObjects reach every node, and so are traced under the node name multicast.'''
+		if actionObject.mode == 'multicast': nodeName = 'multicast'
+		else: nodeName = getattr(actionObject.virtualNode, 'name', None) or type(actionObject.virtualNode).__name__
+		serviceRoutine = actionObject.serviceRoutine
+		return nodeName, type(serviceRoutine).__name__ if serviceRoutine != None else type(actionObject).__name__
+	
+	def report(self):
+		'''Returns the latency of each stage in seconds, as reported by latencyHistogram, by node and by service routine.'''
+		with self.lock:
+			return {'elapsedTime':time.time() - self.startTime, 'traced':len(self.traces),
+					'nodes':dict([(nodeName, dict([(stage, histogram.report()) for stage, histogram in stageHistograms.iteritems()])) for nodeName, stageHistograms in self.nodeStages.iteritems()]),
+					'serviceRoutines':dict([(routineName, dict([(stage, histogram.report()) for stage, histogram in stageHistograms.iteritems()])) for routineName, stageHistograms in self.routineStages.iteritems()])}
+	
+	def export(self, fileName = None):
+		'''Returns the kept traces in the Chrome trace event format, and if fileName is provided writes them to it as JSON.
+		
+		Each node is shown as a process, and each of its service routines as a thread. Every actionObject is an async
+		event, which spans its lifecycle and holds an event for each stage it went thru, so that actionObjects which
+		overlap are shown side by side. The file can be opened with chrome://tracing or Perfetto.'''
+		with self.lock:
+			traces = list(self.traces)
+			startTime = self.startTime
+		processIDs, threadIDs, traceEvents = {}, {}, []
+		microseconds = lambda stampTime: round((stampTime - startTime)*1e6, 1)
+		for traceID, (nodeName, routineName, stampedStages) in enumerate(traces):
+			if nodeName not in processIDs:
+				processIDs[nodeName] = len(processIDs) + 1
+				traceEvents += [{'name':'process_name', 'ph':'M', 'pid':processIDs[nodeName], 'tid':0, 'args':{'name':nodeName}}]
+			if (nodeName, routineName) not in threadIDs:
+				threadIDs[(nodeName, routineName)] = len(threadIDs) + 1
+				traceEvents += [{'name':'thread_name', 'ph':'M', 'pid':processIDs[nodeName], 'tid':threadIDs[(nodeName, routineName)], 'args':{'name':routineName}}]
+			event = {'cat':'actionObject', 'id':traceID, 'pid':processIDs[nodeName], 'tid':threadIDs[(nodeName, routineName)]}
+			traceEvents += [dict(event, name = routineName, ph = 'b', ts = microseconds(stampedStages[0][1]))]
+			for (lastStage, lastTime), (stage, stampTime) in zip(stampedStages[:-1], stampedStages[1:]):
+				traceEvents += [dict(event, name = stage, ph = 'b', ts = microseconds(lastTime)), dict(event, name = stage, ph = 'e', ts = microseconds(stampTime))]
+			traceEvents += [dict(event, name = routineName, ph = 'e', ts = microseconds(stampedStages[-1][1]))]
+		chromeTrace = {'traceEvents':traceEvents, 'displayTimeUnit':'ms'}
+		if fileName != None:
+			with open(fileName, 'w') as traceFile: json.dump(chromeTrace, traceFile)
+		return chromeTrace
+
+trace = latencyTracer()	#shared by all interfaces. Call trace.enable() to start tracing, and trace.export(fileName) to save a Chrome trace.
+
+class rttEstimator(object):
+	'''Estimates the round trip time of requests, and from it how long to wait on a response before retransmitting.
+	
+	The smoothed round trip time and its mean deviation are updated with each sample as described by Jacobson and Karels,
+	and the timeout is the smoothed time plus four deviations. Following Karn, only requests which were answered without
+	being retransmitted are sampled, and each timeout doubles a backoff multiplier which is held until the next sample.
+	The latest samples are kept so that the distribution of round trip times can be reported.'''
+	def __init__(self, initialTimeout = 0.2, minimumTimeout = 0.05, cautiousTimeout = 0.25, maximumTimeout = 0.5, historyLength = 512):
+		self.initialTimeout = initialTimeout	#used until the first sample arrives
+		self.minimumTimeout = minimumTimeout	#kept above scheduling delays on the host
+		self.cautiousTimeout = cautiousTimeout	#the minimum for requests which aren't idempotent, which outlasts a stalled host rather than repeating a move
+		self.maximumTimeout = maximumTimeout
+		self.granularity = 0.001	#smallest deviation allowed for, in seconds
+		self.lock = threading.Lock()
+		self.history = collections.deque(maxlen = historyLength)	#latest round trip times
+		self.reset()
+	
+	def reset(self):
+		with self.lock:
+			self.smoothedRTT = None
+			self.rttDeviation = None
+			self.backoff = 1	#doubles with each timeout, and is cleared by the next sample
+			self.sampleCount = 0
+			self.timeoutCount = 0
+			self.history.clear()
+	
+	def observe(self, rtt):
+		'''Updates the estimate with the round trip time of a request which was answered on its first transmission.'''
+		with self.lock:
+			if self.smoothedRTT == None:
+				self.smoothedRTT = rtt
+				self.rttDeviation = rtt/2.0
+			else:
+				self.rttDeviation += (abs(self.smoothedRTT - rtt) - self.rttDeviation)/4.0
+				self.smoothedRTT += (rtt - self.smoothedRTT)/8.0
+			self.backoff = 1
+			self.sampleCount += 1
+			self.history.append(rtt)
+	
+	def timedOut(self):
+		'''Records that a request went unanswered, backing off the timeout.'''
+		with self.lock:
+			self.timeoutCount += 1
+			if self.timeout() < self.maximumTimeout: self.backoff *= 2
+	
+	def baseTimeout(self):
+		'''Returns the timeout before backing off, or None before the first sample.'''
+		if self.smoothedRTT == None: return None
+		return self.smoothedRTT + max(self.granularity, 4.0*self.rttDeviation)
+	
+	def timeout(self, fallback = None, idempotent = True):
+		'''Returns the time to wait on a response before retransmitting.
+		
+		Before the first sample, the estimate of fallback is used if it has one, and otherwise initialTimeout. A request
+		which isn't idempotent waits at least cautiousTimeout.'''
+		baseTimeout = self.baseTimeout()
+		if baseTimeout == None and fallback != None: baseTimeout = fallback.baseTimeout()
+		if baseTimeout == None: baseTimeout = self.initialTimeout
+		if idempotent: minimumTimeout = self.minimumTimeout
+		else: minimumTimeout = self.cautiousTimeout
+		return min(max(baseTimeout, minimumTimeout)*self.backoff, max(self.maximumTimeout, minimumTimeout))
+	
+	def percentile(self, percent):
+		'''Returns the round trip time below which percent of the recorded samples fall, or None if there are none.'''
+		with self.lock:
+			samples = sorted(self.history)
+		if not samples: return None
+		return samples[min(int(len(samples)*percent/100.0), len(samples) - 1)]
+	
+	def report(self):
+		'''Returns a dictionary describing the estimate and the distribution of recent round trip times, in seconds.'''
+		with self.lock:
+			samples = sorted(self.history)
+		report = {'samples':self.sampleCount, 'timeouts':self.timeoutCount, 'smoothedRTT':self.smoothedRTT,
+					'rttDeviation':self.rttDeviation, 'timeout':self.timeout()}
+		if samples:
+			report.update({'min':samples[0], 'max':samples[-1], 'mean':sum(samples)/len(samples),
+							'percentiles':dict([(percent, self.percentile(percent)) for percent in (50, 90, 99)])})
+		return report
+
+class serialExecutorPool(object):
+	'''Runs tasks on a bounded pool of worker threads, in order and one at a time for each key.
+	
+	Tasks submitted under different keys run in parallel, up to workerCount at once, so that a slow task only holds up
+	the tasks behind it under its own key. Keys with waiting tasks take turns on the workers. The time each task waited
+	to run, and the time it took to run, are measured by key.'''
+	def __init__(self, workerCount = 4):
+		self.workerCount = workerCount
+		self.readyQueue = monitoredQueue()	#keys with a task ready to run. A key is never queued while its task is running
+		self.lock = threading.Lock()
+		self.pending = {}	#{key: deque of (function, args, submitTime)}, the first of which is queued or running
+		self.statistics = {}	#{key: [count, total wait, longest wait, total run, longest run]}
+		self.workers = []
+		for workerNumber in range(workerCount):
+			worker = threading.Thread(target = self.work)
+			worker.daemon = True
+			worker.start()
+			self.workers += [worker]
+	
+	def close(self, timeout = None):
+		'''Stops the workers once they have finished their current tasks, and waits for up to timeout seconds for each
+		to stop. Tasks which haven't started are dropped.'''
+		self.readyQueue.close()
+		for worker in self.workers: worker.join(timeout)
+	
+	def submit(self, key, function, *args):
+		'''Runs function(*args) on a worker, after every task already submitted under key.'''
+		with self.lock:
+			tasks = self.pending.get(key)
+			if tasks:	#key is already queued or running, and will be requeued with this task
+				tasks.append((function, args, time.time()))
+				return
+			self.pending[key] = collections.deque([(function, args, time.time())])
+		self.readyQueue.put(key)
+	
+	def work(self):
+		while True:
+			try:
+				key = self.readyQueue.get()
+			except queueClosed:	#the pool has been closed
+				return
+			with self.lock:
+				function, args, submitTime = self.pending[key][0]
+			startTime = time.time()
+			try:
+				function(*args)
+			except Exception:	#a failing task mustn't take its worker down with it
+				traceback.print_exc()
+			finishTime = time.time()
+			with self.lock:
+				tasks = self.pending[key]
+				tasks.popleft()
+				if tasks: requeue = True
+				else:
+					requeue = False
+					del self.pending[key]
+				statistics = self.statistics.setdefault(key, [0, 0.0, 0.0, 0.0, 0.0])
+				statistics[0] += 1
+				statistics[1] += startTime - submitTime
+				statistics[2] = max(statistics[2], startTime - submitTime)
+				statistics[3] += finishTime - startTime
+				statistics[4] = max(statistics[4], finishTime - startTime)
+			if requeue: self.readyQueue.put(key)	#behind any other keys which are waiting
+	
+	def report(self):
+		'''Returns a dictionary by key of the tasks run and waiting, and of their wait and run times in seconds.'''
+		with self.lock:
+			return dict([(key, {'count':count, 'waiting':len(self.pending.get(key, ())), 'meanWait':waitTotal/count, 'maxWait':waitMax,
+								'meanRun':runTotal/count, 'maxRun':runMax})
+						for key, (count, waitTotal, waitMax, runTotal, runMax) in self.statistics.iteritems()])
+
+class queueClosed(Exception):
+	'''Raised by the get of a queue which has been closed, so that the thread consuming it can stop.'''
+	pass
+
+class monitoredQueue(Queue.Queue):
+	'''A queue which can be bounded, and which measures how full it gets and how long producers are held up by it.
+	
+	When the queue is full, put either blocks until there is room ('block'), blocks for up to timeout seconds and then
+	raises Queue.Full ('timeout'), or raises Queue.Full straight away ('reject'). A maxsize of 0 never fills. Once the
+	queue is closed, get raises queueClosed in every consumer, including those already waiting.'''
+	def __init__(self, maxsize = 0, policy = 'block', timeout = None):
+		Queue.Queue.__init__(self, maxsize)
+		self.policy = policy
+		self.timeout = timeout
+		self.closed = False
+		self.highWater = 0	#the most items the queue has held
+		self.putCount = 0
+		self.blockedCount = 0	#puts which found the queue full, and waited for room
+		self.blockedTime = 0.0	#seconds spent by those puts waiting for room
+		self.rejectedCount = 0	#puts which raised Queue.Full, whose items never made it into the queue
+	
+	def put(self, item, block = None, timeout = None):
+		'''Puts item into the queue, following the queue's policy if it is full. Passing block overrides the policy.'''
+		if block == None:
+			block = (self.policy != 'reject')
+			if self.policy == 'timeout': timeout = self.timeout
+		if not self.full():
+			try:
+				return Queue.Queue.put(self, item, block, timeout)	#the queue may have filled in the meantime
+			except Queue.Full:
+				with self.mutex: self.rejectedCount += 1
+				raise
+		startTime = time.time()
+		try:
+			Queue.Queue.put(self, item, block, timeout)
+		except Queue.Full:
+			with self.mutex: self.rejectedCount += 1
+			raise
+		with self.mutex:
+			self.blockedCount += 1
+			self.blockedTime += time.time() - startTime
+	
+	def _put(self, item):	#called with the mutex held
+		Queue.Queue._put(self, item)
+		self.putCount += 1
+		if len(self.queue) > self.highWater: self.highWater = len(self.queue)
+	
+	def _qsize(self, len = len):	#called with the mutex held. A closed queue is never empty, so that get doesn't wait on it
+		return len(self.queue) or int(self.closed)
+	
+	def _get(self):
+		if self.closed: raise queueClosed
+		return Queue.Queue._get(self)
+	
+	def close(self):
+		'''Closes the queue, waking every consumer waiting on it.'''
+		with self.mutex:
+			self.closed = True
+			self.not_empty.notify_all()
+	
+	def peek(self):
+		'''Returns a list of the items in the queue, leaving them in place.'''
+		with self.mutex:
+			return list(self.queue)
+	
+	def remove(self, item):
+		'''Takes item from wherever it is in the queue, making room for a producer which is held up.'''
+		with self.not_full:
+			self.queue.remove(item)
+			self.not_full.notify()
+	
+	def report(self):
+		'''Returns a dictionary of the depth and capacity of the queue, its high-water mark, and how it has held up producers.'''
+		with self.mutex:
+			return {'depth':len(self.queue), 'capacity':self.maxsize, 'highWater':self.highWater, 'puts':self.putCount,
+					'blocked':self.blockedCount, 'blockedTime':self.blockedTime, 'rejected':self.rejectedCount}
+
+class priorityClassQueue(object):
+	'''A queue which holds each priority class in its own monitoredQueue, and hands out items by class.
+	
+	classes lists the priority classes from highest to lowest. An item put without a known class joins the lowest, and
+	items of the same class come out in the order they were put. Without weights, the highest class with an item waiting
+	always goes first. With weights ({class: items per round}), the weighted classes take turns, each being served up to
+	its weight in items per round, so that a busy higher class can't starve a lower one. A class without a weight always
+	goes ahead of the weighted classes. Any other keyword arguments set up the monitoredQueue of each class. Meant for a single
+	consumer, though once the queue is closed get raises queueClosed in any number of them.'''
+	def __init__(self, classes, weights = None, **settings):
+		self.classes = list(classes)
+		self.weights = weights
+		self.credits = dict(weights or {})	#items each weighted class can still be served in this round
+		self.queues = dict([(priority, monitoredQueue(**settings)) for priority in self.classes])
+		self.available = threading.Semaphore(0)	#counts the items held across every class
+		self.lock = threading.Lock()
+		self.highWater = 0	#the most items held across every class
+		self.closed = False
+	
+	def put(self, item, priority = None, block = None):
+		'''Puts item into the queue of its class, following the policy of that queue if it is full unless block is provided.'''
+		if priority not in self.queues: priority = self.classes[-1]
+		self.queues[priority].put(item, block)
+		with self.lock:
+			depth = self.qsize()
+			if depth > self.highWater: self.highWater = depth
+		self.available.release()
+	
+	def get(self, block = True):
+		'''Returns the next item to be served, blocking until there is one unless block is False.'''
+		while True:
+			if not self.available.acquire(block): raise Queue.Empty
+			if self.closed:
+				self.available.release()	#wakes the next consumer, which is also told
+				raise queueClosed
+			with self.lock:
+				waitingClasses = [priority for priority in self.classes if self.queues[priority].qsize()]
+				if waitingClasses: return self.queues[self.choose(waitingClasses)].get_nowait()
+			#the item counted was taken out by remove or purge, after this consumer had been counted in
+	
+	def get_nowait(self):
+		return self.get(False)
+	
+	def close(self):
+		'''Closes the queue, so that get raises queueClosed in every consumer, including those already waiting.'''
+		self.closed = True
+		self.available.release()
+	
+	def isFull(self, priority):
+		'''Returns True if the queue of priority has no room for another item.'''
+		if priority not in self.queues: priority = self.classes[-1]
+		return self.queues[priority].full()
+	
+	def peek(self, priority):
+		'''Returns the items of a single class in the order they were put, leaving them in the queue.'''
+		return self.queues[priority].peek()
+	
+	def remove(self, item, priority):
+		'''Takes item from the queue of its class, wherever it is in that queue. The weights aren't consulted.'''
+		if priority not in self.queues: priority = self.classes[-1]
+		with self.lock:
+			self.queues[priority].remove(item)
+			self.available.acquire(False)
+	
+	def purge(self, test):
+		'''Takes every item for which test(item) is True out of the queue, and returns them, highest class first.'''
+		purged = []
+		with self.lock:
+			for priority in self.classes:
+				for item in self.queues[priority].peek():
+					if test(item):
+						self.queues[priority].remove(item)
+						self.available.acquire(False)
+						purged += [item]
+		return purged
+	
+	def choose(self, waitingClasses):
+		'''Returns the class to be served next, from waitingClasses listed highest first, and charges it for the item.'''
+		if not self.weights: return waitingClasses[0]
+		for priority in waitingClasses:
+			if priority not in self.weights: return priority
+			if self.credits[priority] > 0:
+				self.credits[priority] -= 1
+				return priority
+		self.credits = dict(self.weights)	#every waiting class has had its turn, so a new round begins
+		self.credits[waitingClasses[0]] -= 1
+		return waitingClasses[0]
+	
+	def qsize(self):
+		return sum([queue.qsize() for queue in self.queues.values()])
+	
+	def report(self):
+		'''Returns the totals of the monitoredQueue reports of every class, along with the report of each class.'''
+		classReports = dict([(priority, queue.report()) for priority, queue in self.queues.iteritems()])
+		report = {'highWater':self.highWater, 'classes':classReports}
+		for key in ['depth', 'capacity', 'puts', 'blocked', 'blockedTime', 'rejected']:
+			report[key] = sum([classReport[key] for classReport in classReports.values()])
+		return report
+
+class bufferCredits(object):
+	'''Tracks the free slots in the buffer of a node, so that requests are only sent when the node has room for them.
+	
+	A credit is spent on each request sent, and the credits are refreshed whenever the node reports how much of its
+	buffer is occupied, which it usually does in its response. Requests which have been sent but not yet answered aren't
+	counted in a report, and so are kept aside as outstanding until their responses arrive.'''
+	def __init__(self, bufferSize):
+		self.bufferSize = bufferSize
+		self.condition = threading.Condition()	#notified when credits are refreshed
+		self.credits = bufferSize	#the buffer is taken to be empty to start
+		self.outstanding = 0	#requests sent which haven't been answered
+		self.spentCount = 0
+		self.refreshCount = 0
+		self.waitCount = 0	#waits for a refresh, by requests which found no credit
+		self.waitTime = 0.0
+	
+	def waitForCredit(self, timeout = None):
+		'''Blocks until a credit is available, or until timeout has elapsed. Returns True if a credit is available.'''
+		with self.condition:
+			if self.credits > 0: return True
+			startTime = time.time()
+			self.condition.wait(timeout)
+			self.waitCount += 1
+			self.waitTime += time.time() - startTime
+			return self.credits > 0
+	
+	def acquire(self, pollInterval = None, poll = None):
+		'''Waits for a credit, and spends it on a request which is about to be sent.
+		
+		While there is no credit, poll is called every pollInterval seconds to ask the node for a refresh, rather than the
+		request being sent into a full buffer over and over. If poll returns False, the node can't be asked, and the
+		credit is spent regardless, leaving the response to the request to tell whether the node had room.'''
+		while not self.waitForCredit(pollInterval):
+			if not poll or not poll(): break
+		self.spend()
+	
+	def spend(self):
+		'''Spends a credit on a request which is about to be sent.'''
+		with self.condition:
+			self.credits -= 1
+			self.outstanding += 1
+			self.spentCount += 1
+	
+	def cancel(self):
+		'''Forgets a request which went unanswered. Its credit is recovered by the next refresh, if the node didn't take it.'''
+		with self.condition:
+			self.outstanding = max(self.outstanding - 1, 0)
+	
+	def refresh(self, occupied, answered = False):
+		'''Refreshes the credits from the number of occupied slots reported by the node. answered is True if the report is
+		the response to a request which spent a credit.'''
+		with self.condition:
+			if answered: self.outstanding = max(self.outstanding - 1, 0)
+			self.credits = self.bufferSize - occupied - self.outstanding
+			self.refreshCount += 1
+			self.condition.notify_all()
+	
+	def report(self):
+		'''Returns the credits available and outstanding, the credits spent and refreshes, and the waits for a refresh.'''
+		with self.condition:
+			return {'credits':self.credits, 'outstanding':self.outstanding, 'spent':self.spentCount, 'refreshes':self.refreshCount,
+					'waits':self.waitCount, 'waitTime':self.waitTime}
+
 class persistenceManager(object):
 	'''Handles interacting with persistence files.'''
 	def __init__(self, filename = None, namespace = None):
@@ -67,7 +673,7 @@ class persistenceManager(object):
 		fileObject.write("# This Gestalt persistence file was auto-generated @ " + str(datetime.datetime.now()) + "\n")
 		fileObject.write("{\n")
 		for key in persistenceDict:
-			fileObject.write("'" + key + "'" + ":" + str(persistenceDict[key]) + ",\n")
+			fileObject.write("'" + key + "'" + ":" + repr(persistenceDict[key]) + ",\n")	#repr quotes strings, which are read back with literal_eval
 		fileObject.write("}")
 		fileObject.close()
 		